@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+"""Replays rotary encoder edges through the decoders.
+
+Each trace is a list of (gpio, level, tick) edges as they would be received
+from pigpio. The traces are synthetic: they are generated below (with random
+contact bounce for the bouncy trace) rather than recorded from an encoder.
+
+The old decoder (one step when a leg rises while the other is high, with a
+"last gpio" debounce) is compared with the table-driven decoder in
+RotaryEncoder. For each trace we show the number of detents turned, the
+number of steps decoded and the number of callbacks.
+
+The steps and callbacks from the table-driven decoder (with and without
+acceleration) are checked against the expected values and the script exits
+with an error if any of them differ.
+
+Run from the root of the repository (pigpio needs to be installed but the
+pigpio daemon isn't used):
+
+    python benchmarks/encoder_replay.py
+"""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from resources.rotary_encoder import RotaryEncoder
+
+GPIO_A = 19
+GPIO_B = 20
+
+# States for one detent forwards (A, B), starting from rest at (1, 1)
+FORWARDS = [(1, 0), (0, 0), (0, 1), (1, 1)]
+
+
+class FakePi(object):
+    """Just enough of pigpio.pi to create an encoder."""
+
+    def set_mode(self, gpio, mode):
+        pass
+
+    def set_pull_up_down(self, gpio, pud):
+        pass
+
+    def set_glitch_filter(self, gpio, steady):
+        pass
+
+    def set_watchdog(self, gpio, timeout):
+        pass
+
+
+def detents(count, interval, start=0, bounce=0, seed=1):
+    """Returns edges for turning the encoder "count" detents (negative for
+       backwards), one every "interval" microseconds.
+
+       "bounce" is the number of extra edges (contact bounce) added after
+       each real edge.
+    """
+    rand = random.Random(seed)
+    states = FORWARDS if count > 0 else [(b, a) for a, b in FORWARDS]
+    edges = []
+    tick = start
+    last = (1, 1)
+
+    for _ in range(abs(count)):
+        for state in states:
+            tick += interval // len(states)
+            gpio, level = ((GPIO_A, state[0]) if state[0] != last[0]
+                           else (GPIO_B, state[1]))
+            edges.append((gpio, level, tick))
+
+            for _ in range(bounce):
+                tick += rand.randint(20, 200)
+                edges.append((gpio, 1 - level, tick))
+                tick += rand.randint(20, 200)
+                edges.append((gpio, level, tick))
+
+            last = state
+
+    return edges, tick
+
+
+def old_decoder(edges):
+    """The original decoder. Returns a list of callback values."""
+    calls = []
+    levels = {GPIO_A: 1, GPIO_B: 1}
+    last_gpio = None
+
+    for gpio, level, tick in edges:
+        levels[gpio] = level
+
+        if gpio != last_gpio:
+            last_gpio = gpio
+
+            if gpio == GPIO_A and level == 1 and levels[GPIO_B] == 1:
+                calls.append(1)
+            elif gpio == GPIO_B and level == 1 and levels[GPIO_A] == 1:
+                calls.append(-1)
+
+    return calls
+
+
+def new_decoder(edges, accelerate):
+    """The table-driven decoder. Returns a list of callback values."""
+    calls = []
+    encoder = RotaryEncoder(FakePi(), GPIO_A, GPIO_B, 21,
+                            rot_callback=calls.append, accelerate=accelerate)
+    encoder.state = 0b11
+
+    for edge in edges:
+        encoder._pulse(*edge)
+
+    return calls
+
+
+def build_traces():
+    """Returns a list of (name, edges, detents, accelerated steps)."""
+    traces = []
+
+    traces.append(("slow forwards", detents(10, 150000)[0], 10, 10))
+    traces.append(("slow backwards", detents(-10, 150000)[0], -10, -10))
+
+    # The first detent moves one step and the rest are fast enough to move
+    # four steps each
+    traces.append(("fast spin", detents(30, 12000)[0], 30, 1 + 29 * 4))
+    traces.append(("bouncy contacts", detents(10, 150000, bounce=2)[0],
+                   10, 10))
+
+    # Turning half way to the next detent and letting the encoder fall back
+    edges = []
+    tick = 0
+    for _ in range(10):
+        for gpio, level in ((GPIO_B, 0), (GPIO_A, 0), (GPIO_A, 1), (GPIO_B, 1)):
+            tick += 40000
+            edges.append((gpio, level, tick))
+    traces.append(("half turns and back", edges, 0, 0))
+
+    return traces
+
+
+def main():
+    print "{:<26} {:>8} {:>14} {:>14} {:>14}".format(
+        "trace", "detents", "old", "new", "accelerated")
+    print "{:<26} {:>8} {:>14} {:>14} {:>14}".format(
+        "", "", "steps/calls", "steps/calls", "steps/calls")
+
+    failures = 0
+
+    for name, edges, expected, accelerated in build_traces():
+        results = [old_decoder(edges),
+                   new_decoder(edges, False),
+                   new_decoder(edges, True)]
+
+        # One callback per detent, each in the direction of the turn
+        ok = True
+        for calls, steps in zip(results[1:], (expected, accelerated)):
+            ok = ok and (sum(calls) == steps and
+                         len(calls) == abs(expected) and
+                         all(step * expected > 0 for step in calls))
+        failures += not ok
+
+        cols = ["{}/{}".format(sum(calls), len(calls)) for calls in results]
+        print "{:<26} {:>8} {:>14} {:>14} {:>14}  {}".format(
+            name, expected, *(cols + ["ok" if ok else "FAIL"]))
+
+    if failures:
+        print
+        print "{} trace(s) failed".format(failures)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
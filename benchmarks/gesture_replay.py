@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+"""Replays button edges through the gesture recogniser.
+
+Each trace is a list of (level, tick) edges as they would be received from
+pigpio, including the watchdog timeouts (level pigpio.TIMEOUT) that pigpio
+sends while the button is held. The traces are written by hand to cover the
+timing cases: they aren't recordings from a real button.
+
+For each trace the gestures emitted by GestureRecognizer are compared with the
+expected gestures. The script exits with an error if any of them differ.
+
+Run from the root of the repository (pigpio needs to be installed but the
+pigpio daemon isn't used):
+
+    python benchmarks/gesture_replay.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pigpio
+
+from resources.gestures import (GestureRecognizer, PRESS, RELEASE, CLICK,
+                                DOUBLE, LONG, REPEAT, DOUBLE_TIME, LONG_TIME,
+                                REPEAT_TIME)
+
+# Buttons are pulled up so pressing them takes the level to 0
+DOWN = 0
+UP = 1
+TIMEOUT = pigpio.TIMEOUT
+
+# Ticks are in microseconds and wrap round after 2^32
+MS = 1000
+WRAP = 1 << 32
+
+
+def click(tick, length=100 * MS):
+    """Edges for a short press starting at "tick"."""
+    return [(DOWN, tick), (UP, (tick + length) % WRAP)]
+
+
+def held(tick, repeats):
+    """Edges for holding the button until "repeats" repeats have been sent
+       (the watchdog timeouts are included).
+    """
+    edges = [(DOWN, tick)]
+    tick += LONG_TIME * MS
+    edges.append((TIMEOUT, tick))
+
+    for _ in range(repeats):
+        tick += REPEAT_TIME * MS
+        edges.append((TIMEOUT, tick))
+
+    edges.append((UP, tick + 50 * MS))
+    return edges
+
+
+def build_traces():
+    gap = DOUBLE_TIME * MS
+
+    traces = []
+
+    traces.append(("single click", click(0),
+                   [PRESS, RELEASE, CLICK]))
+
+    traces.append(("double click", click(0) + click(300 * MS),
+                   [PRESS, RELEASE, CLICK,
+                    PRESS, RELEASE, CLICK, DOUBLE]))
+
+    traces.append(("two clicks", click(0) + click(100 * MS + gap + 1),
+                   [PRESS, RELEASE, CLICK,
+                    PRESS, RELEASE, CLICK]))
+
+    traces.append(("three quick clicks",
+                   click(0) + click(250 * MS) + click(500 * MS),
+                   [PRESS, RELEASE, CLICK,
+                    PRESS, RELEASE, CLICK, DOUBLE,
+                    PRESS, RELEASE, CLICK]))
+
+    traces.append(("long press", held(0, 0),
+                   [PRESS, LONG, RELEASE]))
+
+    traces.append(("long press and repeats", held(0, 3),
+                   [PRESS, LONG, REPEAT, REPEAT, REPEAT, RELEASE]))
+
+    # A held button doesn't count towards a double click
+    traces.append(("long press then click", held(0, 0) + click(1000 * MS),
+                   [PRESS, LONG, RELEASE,
+                    PRESS, RELEASE, CLICK]))
+
+    # Timeouts when the button isn't held (e.g. the watchdog wasn't
+    # cancelled in time) are ignored
+    traces.append(("stray timeouts",
+                   [(TIMEOUT, 0)] + click(10 * MS) + [(TIMEOUT, 500 * MS)],
+                   [PRESS, RELEASE, CLICK]))
+
+    # Repeated levels (no change) are ignored
+    traces.append(("repeated levels",
+                   [(DOWN, 0), (DOWN, 10 * MS), (UP, 100 * MS),
+                    (UP, 110 * MS)],
+                   [PRESS, RELEASE, CLICK]))
+
+    # The tick wraps round between the two clicks
+    start = WRAP - 200 * MS
+    traces.append(("double click over wrap",
+                   click(start) + click((start + 300 * MS) % WRAP),
+                   [PRESS, RELEASE, CLICK,
+                    PRESS, RELEASE, CLICK, DOUBLE]))
+
+    traces.append(("two clicks over wrap",
+                   click(start) + click((start + 100 * MS + gap + 1) % WRAP),
+                   [PRESS, RELEASE, CLICK,
+                    PRESS, RELEASE, CLICK]))
+
+    return traces
+
+
+def replay(edges):
+    """Returns the gestures emitted for the edges and the watchdog calls."""
+    gestures = []
+    watchdog = []
+    recogniser = GestureRecognizer(lambda gesture, tick:
+                                   gestures.append(gesture),
+                                   watchdog=watchdog.append)
+
+    for level, tick in edges:
+        recogniser.edge(level, tick)
+
+    return gestures, watchdog
+
+
+def main():
+    failures = 0
+
+    for name, edges, expected in build_traces():
+        gestures, watchdog = replay(edges)
+
+        # The watchdog must be cancelled once the button has been released
+        ok = gestures == expected and watchdog[-1:] == [0]
+        failures += not ok
+
+        print "{:<26} {:<4} {}".format(name, "ok" if ok else "FAIL",
+                                       " ".join(gestures))
+        if not ok:
+            print "{:<31} expected {} (watchdog {})".format(
+                "", " ".join(expected), watchdog)
+
+    if failures:
+        print
+        print "{} trace(s) failed".format(failures)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+"""Checks the pin traffic sent by the pigpio LCD driver.
+
+A fake pigpio instance keeps track of the level of each pin as the driver sets
+them (with bank writes or waveforms). Whenever the enable line falls, the
+nibble on the data lines is read together with the register select line, as
+the display would read it. The sleeps made by the driver are recorded in the
+same sequence so the delays in the power-on reset can be checked.
+
+For each case, the bytes received by the "display" are compared with the
+expected bytes. The data and register select lines mustn't change while the
+enable line is high. The script exits with an error if any of the checks
+fail.
+
+Run from the root of the repository (pigpio needs to be installed but the
+pigpio daemon isn't used):
+
+    python benchmarks/lcd_replay.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import resources.lcd_pigpio as lcd_pigpio
+from resources.lcd_pigpio import PigpioCharLCD
+
+# Pins (as wired for the Adafruit library)
+RS = 27
+EN = 22
+DATA = [25, 24, 23, 18]
+BACKLIGHT = 4
+
+# Times the display needs after each of the reset nibbles (seconds)
+RESET_TIMES = [0.0041, 0.0001, 0.0001, 0.0001]
+
+PATTERN = [0b00000, 0b01010, 0b11111, 0b11111,
+           0b01110, 0b00100, 0b00000, 0b00000]
+
+
+class RecordingPi(object):
+    """Just enough of pigpio.pi to drive the display. The nibbles latched
+       by the display and the sleeps are recorded in "events" as ("nibble",
+       rs, value) and ("sleep", seconds).
+    """
+
+    def __init__(self):
+        self.levels = {}
+        self.outputs = set()
+        self.events = []
+        self.errors = []
+        self.waves = []
+
+    def sleep(self, seconds):
+        self.events.append(("sleep", seconds))
+
+    def set_mode(self, gpio, mode):
+        self.outputs.add(gpio)
+
+    def write(self, gpio, level):
+        self._update({gpio: level})
+
+    def set_bank_1(self, bits):
+        self._update({gpio: 1 for gpio in range(32) if bits & (1 << gpio)})
+
+    def clear_bank_1(self, bits):
+        self._update({gpio: 0 for gpio in range(32) if bits & (1 << gpio)})
+
+    def wave_add_generic(self, pulses):
+        self.waves.append(pulses)
+
+    def wave_create(self):
+        return len(self.waves) - 1
+
+    def wave_send_once(self, wid):
+        for pulse in self.waves[wid]:
+            changes = {}
+            for gpio in range(32):
+                if pulse.gpio_on & (1 << gpio):
+                    changes[gpio] = 1
+                elif pulse.gpio_off & (1 << gpio):
+                    changes[gpio] = 0
+            self._update(changes)
+
+    def wave_tx_busy(self):
+        return 0
+
+    def wave_delete(self, wid):
+        pass
+
+    def _update(self, changes):
+        for gpio in changes:
+            if gpio not in self.outputs:
+                self.errors.append("gpio {} isn't an output".format(gpio))
+
+        enabled = self.levels.get(EN, 0)
+        old = dict(self.levels)
+        self.levels.update(changes)
+
+        moved = [gpio for gpio in [RS] + DATA
+                 if old.get(gpio, 0) != self.levels.get(gpio, 0)]
+
+        # The lines are read when enable falls so they must be steady while
+        # it's high (and RS must be set before it rises)
+        if moved and (enabled or (RS in moved and self.levels.get(EN))):
+            self.errors.append("gpio {} changed while enabled".format(moved))
+
+        if enabled and not self.levels.get(EN, 0):
+            nibble = sum(self.levels.get(gpio, 0) << bit
+                         for bit, gpio in enumerate(DATA))
+            self.events.append(("nibble", self.levels.get(RS, 0), nibble))
+
+
+def take_bytes(pi):
+    """Returns the (rs, byte) pairs received since the last call (and any
+       errors).
+    """
+    nibbles = [event[1:] for event in pi.events if event[0] == "nibble"]
+    errors = pi.errors
+
+    pi.events = []
+    pi.errors = []
+
+    if len(nibbles) % 2:
+        errors.append("odd number of nibbles")
+
+    received = []
+    for (rs, high), (rs_low, low) in zip(nibbles[::2], nibbles[1::2]):
+        if rs != rs_low:
+            errors.append("RS changed within a byte")
+        received.append((rs, (high << 4) | low))
+
+    return received, errors
+
+
+def check_reset(pi):
+    """Checks the reset nibbles and the time waited after each one. Returns
+       a list of errors and removes the reset from the events.
+    """
+    errors = []
+    events = pi.events
+
+    if not events or events[0][0] != "sleep" or events[0][1] < 0.04:
+        errors.append("no wait for the display to power on")
+
+    nibbles = [num for num, event in enumerate(events)
+               if event[0] == "nibble"][:len(RESET_TIMES)]
+
+    for num, (pos, needed) in enumerate(zip(nibbles, RESET_TIMES)):
+        if events[pos][1:] != (0, 0x3 if num < 3 else 0x2):
+            errors.append("reset nibble {} is {}".format(num, events[pos][1:]))
+
+        waited = 0
+        for event in events[pos + 1:]:
+            if event[0] != "sleep":
+                break
+            waited += event[1]
+
+        if waited < needed:
+            errors.append("waited {:.2f}ms after reset nibble {} (needs "
+                          "{:.2f}ms)".format(waited * 1000, num,
+                                             needed * 1000))
+
+    if nibbles:
+        pi.events = events[nibbles[-1] + 1:]
+
+    return errors
+
+
+def chars(text):
+    return [(1, ord(char)) for char in text]
+
+
+def build_cases():
+    """Returns a list of (name, function, expected bytes)."""
+    return [
+        ("command", lambda lcd: lcd.set_cursor(3, 1),
+         [(0, 0x80 | 0x43)]),
+        ("one character", lambda lcd: lcd.message("P"),
+         chars("P")),
+        ("character run", lambda lcd: lcd.message("PiRadio"),
+         chars("PiRadio")),
+        ("command after characters", lambda lcd: lcd.set_cursor(0, 3),
+         [(0, 0x80 | 0x54)]),
+        ("create_char", lambda lcd: lcd.create_char(2, PATTERN),
+         [(0, 0x40 | (2 << 3))] + [(1, row) for row in PATTERN]),
+    ]
+
+
+def main():
+    failures = 0
+
+    for waves in (True, False):
+        pi = RecordingPi()
+        lcd_pigpio.sleep = pi.sleep
+
+        lcd = PigpioCharLCD(pi, RS, EN, DATA[0], DATA[1], DATA[2], DATA[3],
+                            20, 4, backlight=BACKLIGHT, waves=waves)
+
+        print "waveforms {}".format("on" if waves else "off")
+
+        # Reset, function set (4-bit, 2 lines), display on, entry mode and
+        # clear
+        errors = check_reset(pi)
+        received, more = take_bytes(pi)
+        errors += more
+        ok = not errors and received == [(0, 0x28), (0, 0x0C), (0, 0x06),
+                                         (0, 0x01)]
+        cases = [("initialise", ok, received, errors)]
+
+        for name, action, expected in build_cases():
+            action(lcd)
+            received, errors = take_bytes(pi)
+            cases.append((name, not errors and received == expected,
+                          received, errors))
+
+        for name, ok, received, errors in cases:
+            failures += not ok
+            print "  {:<26} {:<4} {}".format(
+                name, "ok" if ok else "FAIL",
+                " ".join("{}{:02x}".format("C" if rs else "", value)
+                         for rs, value in received))
+            for error in errors:
+                print "  {:<31} {}".format("", error)
+
+        print
+
+    print "  (bytes in hex, C = character, otherwise a command)"
+
+    if failures:
+        print
+        print "{} case(s) failed".format(failures)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+"""Benchmark of sending commands to MPD.
+
+Loads the Internet Radio playlist (clear plus one add per station) and plays a
+station against a fake MPD server running on this machine:
+
+    subprocess:   a new process and connection for each command (as with mpc)
+    socket:       one command at a time over a persistent connection
+    command list: the whole playlist in one command list
+
+If mpc isn't installed, bash (connecting with /dev/tcp) is used to show the
+cost of starting a process and connecting for each command.
+
+Run from the root of the repository:
+
+    python benchmarks/mpd_commands.py
+"""
+import os
+import SocketServer
+import subprocess
+import sys
+import threading
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from modes.internetradio import STATIONS
+from modes.lib.mpd_client import MPDClient
+
+REPEATS = 20
+
+# Use mpc if it's installed
+MPC = any(os.access(os.path.join(path, "mpc"), os.X_OK)
+          for path in os.environ.get("PATH", "").split(os.pathsep))
+
+
+class FakeMPDHandler(SocketServer.StreamRequestHandler):
+    """Replies OK to every command (and list_OK to each command in a list)."""
+
+    def handle(self):
+        self.wfile.write("OK MPD 0.21.0\n")
+        in_list = 0
+
+        for line in iter(self.rfile.readline, ""):
+            command = line.split(" ", 1)[0].strip()
+
+            if command == "command_list_ok_begin":
+                in_list = 1
+                count = 0
+            elif command == "command_list_end":
+                self.wfile.write("list_OK\n" * count + "OK\n")
+                in_list = 0
+            elif in_list:
+                count += 1
+            elif command == "status":
+                self.wfile.write("volume: 50\nstate: play\nOK\n")
+            else:
+                self.wfile.write("OK\n")
+
+
+class FakeMPDServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def subprocess_command(port, args):
+    """Runs a command in a new process with a new connection."""
+    if MPC:
+        env = dict(os.environ, MPD_HOST="127.0.0.1", MPD_PORT=str(port))
+        subprocess.check_output(["mpc"] + args, env=env)
+    else:
+        script = ("exec 3<>/dev/tcp/127.0.0.1/{port}; read -u 3 l; "
+                  "echo '{cmd}' >&3; read -u 3 l").format(port=port,
+                                                         cmd=" ".join(args))
+        subprocess.check_output(["bash", "-c", script])
+
+
+def main():
+    server = FakeMPDServer(("127.0.0.1", 0), FakeMPDHandler)
+    port = server.server_address[1]
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    client = MPDClient("127.0.0.1", port)
+    links = [link for _, link in STATIONS]
+
+    def load_subprocess():
+        subprocess_command(port, ["clear"])
+        for link in links:
+            subprocess_command(port, ["add", link])
+
+    def load_socket():
+        client.command("clear")
+        for link in links:
+            client.command("add", link)
+
+    def load_list():
+        client.command_list([("clear",)] + [("add", link) for link in links])
+
+    def play_subprocess():
+        subprocess_command(port, ["play", "1"])
+
+    def play_socket():
+        client.play(0)
+
+    label = "mpc" if MPC else "bash /dev/tcp"
+
+    print "Playlist of {} stations, fake MPD on port {}".format(len(links),
+                                                                port)
+    print
+
+    tests = [("load: subprocess ({})".format(label), load_subprocess),
+             ("load: socket", load_socket),
+             ("load: command list", load_list),
+             ("play: subprocess ({})".format(label), play_subprocess),
+             ("play: socket", play_socket)]
+
+    for name, func in tests:
+        trips = client.round_trips
+        elapsed = timeit.timeit(func, number=REPEATS) / REPEATS
+        trips = (client.round_trips - trips) // REPEATS
+        print "{:<32} {:8.2f} ms  ({} round trips)".format(
+            name, elapsed * 1000, trips if trips else "-")
+
+    client.disconnect()
+    server.shutdown()
+    server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+"""Benchmark of showing stream titles from MPD.
+
+Runs the Internet Radio mode against a scripted fake MPD server which changes
+the stream title every 200ms. The mode finds out about the changes from MPD's
+"idle" command. The script shows how long each title took to reach the
+display and how many commands were sent to MPD, both while the titles were
+changing and while nothing was happening.
+
+Run from the root of the repository:
+
+    python benchmarks/mpd_metadata.py
+"""
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from collections import Counter
+from time import sleep, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import modes.internetradio as internetradio
+from modes.lib.mpd_client import MPDClient
+from resources.scheduler import Scheduler
+
+from playlist_sync import FakeMPD, FakeMPDHandler, FakeMPDServer
+
+CHANGES = 10
+INTERVAL = 0.2
+QUIET = 2
+
+
+class ScriptedMPD(FakeMPD):
+    """Fake MPD with a player whose stream title can be changed."""
+
+    def __init__(self):
+        super(ScriptedMPD, self).__init__()
+        self.cond = threading.Condition(self.lock)
+        self.commands = Counter()
+
+        self.song = {"Name": "Fake FM"}
+        self.status = {"state": "stop"}
+        self.player_version = 0
+
+    def set_player(self, **song):
+        """Changes the song and tells any idle clients."""
+        with self.cond:
+            self.song.update(song)
+            self.player_version += 1
+            self.cond.notify_all()
+
+    def run(self, args):
+        cmd = args[0]
+        self.commands[cmd] += 1
+
+        if cmd == "idle":
+            version = self.player_version
+            while self.player_version == version:
+                self.cond.wait()
+            return ["changed: player"]
+
+        elif cmd == "currentsong":
+            return ["{}: {}".format(key, value)
+                    for key, value in self.song.items()]
+
+        elif cmd == "status":
+            lines = super(ScriptedMPD, self).run(args)
+            return lines + ["{}: {}".format(key, value)
+                            for key, value in self.status.items()]
+
+        elif cmd == "play":
+            self.status = {"state": "play", "bitrate": 128,
+                           "audio": "44100:24:2"}
+            self.player_version += 1
+            self.cond.notify_all()
+
+        elif cmd == "stop":
+            self.status = {"state": "stop"}
+
+        return super(ScriptedMPD, self).run(args)
+
+
+class DisplayRecorder(object):
+    """Stands in for the display queue and records when text arrives."""
+
+    def __init__(self):
+        self.items = []
+
+    def put(self, item):
+        self.items.append((time(), item))
+
+
+def main():
+    server = FakeMPDServer(("127.0.0.1", 0), FakeMPDHandler)
+    server.mpd = mpd = ScriptedMPD()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    port = server.server_address[1]
+
+    folder = tempfile.mkdtemp()
+    internetradio.CATALOG_DIRS = [folder]
+    internetradio.PLAYLIST_CACHE = os.path.join(folder, "playlist.json")
+
+    scheduler = Scheduler()
+    loop = threading.Thread(target=scheduler.run)
+    loop.daemon = True
+    loop.start()
+
+    mode = internetradio.ModeRadio()
+    mode.mpd = MPDClient("127.0.0.1", port)
+    mode.scheduler = scheduler
+    mode.display_q = display = DisplayRecorder()
+
+    try:
+        mode.enter()
+        sleep(INTERVAL)
+
+        # Change the title and wait for it to reach the display
+        latencies = []
+        before = Counter(mpd.commands)
+
+        for num in range(CHANGES):
+            title = "Song {}".format(num)
+            changed = time()
+            mpd.set_player(Title=title)
+
+            shown = None
+            while shown is None and time() - changed < 1:
+                sleep(0.001)
+                shown = next((when for when, (key, text) in display.items
+                              if key == "metadata" and
+                              text.get("Title") == title), None)
+
+            latencies.append((shown or time()) - changed)
+            sleep(INTERVAL)
+
+        busy = mpd.commands - before
+
+        # Nothing changes for a while
+        before = Counter(mpd.commands)
+        wakeups = scheduler.wakeups
+        sleep(QUIET)
+        quiet = mpd.commands - before
+        wakeups = scheduler.wakeups - wakeups
+
+        print "Fake MPD on port {}, {} title changes every {:.0f}ms".format(
+            port, CHANGES, INTERVAL * 1000)
+        print
+        print "Title to display:  mean {:.1f} ms, max {:.1f} ms".format(
+            sum(latencies) / len(latencies) * 1000, max(latencies) * 1000)
+        print "Commands while titles changed: {}".format(
+            ", ".join("{} {}".format(count, cmd)
+                      for cmd, count in sorted(busy.items())))
+        print "Commands in {}s with no changes: {} ({} scheduler wakeups)" \
+            .format(QUIET, sum(quiet.values()), wakeups)
+
+        mode.show_stream_info()
+        print "Stream info: {}".format(display.items[-1][1][1])
+
+    finally:
+        mode.exit()
+        mode.mpd.disconnect()
+        scheduler.stop()
+        shutil.rmtree(folder)
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+"""Benchmark of updating the Internet Radio playlist.
+
+Runs the Internet Radio mode against a fake MPD server (which keeps a
+playlist) with a catalog of 1,000 stations and shows the time taken and the
+number of playlist changes sent for:
+
+    startup:          creating the mode (the playlist isn't touched)
+    full reload:      clearing the playlist and adding every station (as the
+                      mode used to do on every startup)
+    first enter:      entering the mode with an empty playlist
+    restart:          entering the mode again after a restart
+    catalog edited:   entering after a station was removed and one added
+    playlist changed: entering after another client changed the playlist
+
+Run from the root of the repository:
+
+    python benchmarks/playlist_sync.py
+"""
+import os
+import shlex
+import shutil
+import SocketServer
+import sys
+import tempfile
+import threading
+from time import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import modes.internetradio as internetradio
+from modes.lib.mpd_client import MPDClient
+
+STATIONS = 1000
+
+
+class FakeMPD(object):
+    """The playlist (and its version) held by the fake server."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.playlist = []
+        self.version = 1
+        self.changes = 0
+
+    def changed(self, count=1):
+        self.version += 1
+        self.changes += count
+
+    def run(self, args):
+        """Runs a command and returns the lines of its response."""
+        cmd = args[0]
+
+        if cmd == "status":
+            return ["playlist: {}".format(self.version),
+                    "playlistlength: {}".format(len(self.playlist))]
+
+        elif cmd == "playlistinfo":
+            return ["file: {}\nPos: {}".format(url, pos)
+                    for pos, url in enumerate(self.playlist)]
+
+        elif cmd == "clear":
+            self.changed(len(self.playlist))
+            self.playlist = []
+
+        elif cmd in ("add", "addid"):
+            pos = int(args[2]) if len(args) > 2 else len(self.playlist)
+            self.playlist.insert(pos, args[1])
+            self.changed()
+
+        elif cmd == "delete":
+            start, _, end = args[1].partition(":")
+            end = int(end) if end else int(start) + 1
+            del self.playlist[int(start):end]
+            self.changed(end - int(start))
+
+        return []
+
+
+class FakeMPDHandler(SocketServer.StreamRequestHandler):
+
+    def handle(self):
+        self.wfile.write("OK MPD 0.21.0\n")
+        in_list = False
+        response = []
+
+        for line in iter(self.rfile.readline, ""):
+            args = shlex.split(line)
+
+            if args[0] == "command_list_ok_begin":
+                in_list = True
+                response = []
+            elif args[0] == "command_list_end":
+                self.wfile.write("".join(response) + "OK\n")
+                in_list = False
+            else:
+                with self.server.mpd.lock:
+                    lines = self.server.mpd.run(args)
+                text = "".join(line + "\n" for line in lines)
+
+                if in_list:
+                    response.append(text + "list_OK\n")
+                else:
+                    self.wfile.write(text + "OK\n")
+
+
+class FakeMPDServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def write_catalog(path, skip=None, extra=None):
+    with open(path, "w") as catalog:
+        catalog.write("#EXTM3U\n")
+        for num in range(STATIONS):
+            if num != skip:
+                catalog.write("#EXTINF:-1,Station {n}\n"
+                              "http://stream{n}.example.com/live\n"
+                              .format(n=num))
+        if extra:
+            catalog.write("#EXTINF:-1,New\n{}\n".format(extra))
+
+
+def main():
+    server = FakeMPDServer(("127.0.0.1", 0), FakeMPDHandler)
+    server.mpd = FakeMPD()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    port = server.server_address[1]
+
+    folder = tempfile.mkdtemp()
+    catalog = os.path.join(folder, "stations.m3u")
+    internetradio.CATALOG_DIRS = [folder]
+    internetradio.PLAYLIST_CACHE = os.path.join(folder, "playlist.json")
+
+    clients = []
+
+    def new_mode():
+        mode = internetradio.ModeRadio()
+        mode.mpd = MPDClient("127.0.0.1", port)
+        clients.append(mode.mpd)
+        return mode
+
+    def measure(name, func):
+        changes = server.mpd.changes
+        start = time()
+        func()
+        elapsed = time() - start
+        print "{:<20} {:8.1f} ms  {:>6} changes".format(
+            name, elapsed * 1000, server.mpd.changes - changes)
+
+    def full_reload(mode):
+        mode.mpd.command_list([("clear",)] +
+                              [("add", station.url)
+                               for station in mode.catalog.stations])
+
+    try:
+        write_catalog(catalog)
+        print "Catalog of {} stations, fake MPD on port {}".format(STATIONS,
+                                                                   port)
+        print
+
+        measure("startup", new_mode)
+
+        mode = new_mode()
+        measure("full reload", lambda: full_reload(mode))
+
+        server.mpd.playlist = []
+        measure("first enter", new_mode().sync_playlist)
+        measure("restart", new_mode().sync_playlist)
+
+        write_catalog(catalog, skip=STATIONS // 2,
+                      extra="http://new.example.com/live")
+        measure("catalog edited", new_mode().sync_playlist)
+
+        server.mpd.changed(0)
+        measure("playlist changed", new_mode().sync_playlist)
+
+        mode = new_mode()
+        wanted = [station.url for station in mode.catalog.stations]
+        print
+        print "Playlist matches catalog: {}".format(
+            server.mpd.playlist == wanted)
+
+    finally:
+        for client in clients:
+            client.disconnect()
+        shutil.rmtree(folder)
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
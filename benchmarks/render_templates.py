@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""Micro-benchmark of the cost of rendering the display for each update.
+
+Compares formatting every template line (the old behaviour of
+RadioDisplay.update) with the compiled templates, which only render the lines
+that use the changed parameter.
+
+Run from the root of the repository:
+
+    python benchmarks/render_templates.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from resources.templates import DisplayTemplate
+
+# How many updates to time
+NUMBER = 100000
+
+OLD_TEMPLATE = ["{mode:^14.14} {time}",
+                "{title:^20.20}",
+                "{artist:^20.20}",
+                "{album:^20.20}"]
+
+NEW_TEMPLATE = ["{mode:^*} {time}",
+                "{title:^*}",
+                "{artist:^*}",
+                "{album:^*}"]
+
+PARAMS = {"mode": "Squeezeplayer",
+          "time": "12:34",
+          "title": "Paranoid Android",
+          "artist": "Radiohead",
+          "album": "OK Computer"}
+
+
+def old_update():
+    return [line.format(**PARAMS) for line in OLD_TEMPLATE]
+
+
+def main():
+    template = DisplayTemplate(NEW_TEMPLATE, 20, 4, {"time": 5})
+
+    # Make sure we're comparing like with like
+    assert template.render(PARAMS) == old_update()
+
+    # This mirrors what RadioDisplay.update does for a single change
+    renderers = template.renderers
+
+    def new_update(key):
+        return [renderers[i](**PARAMS) for i in template.lines_for((key,))]
+
+    def new_all():
+        return template.render(PARAMS)
+
+    def new_time():
+        return new_update("time")
+
+    def new_title():
+        return new_update("title")
+
+    results = [("format all lines", old_update),
+               ("compiled, all lines", new_all),
+               ("compiled, 'time' update", new_time),
+               ("compiled, 'title' update", new_title)]
+
+    for name, func in results:
+        elapsed = timeit.timeit(func, number=NUMBER)
+        print "{name:<26} {us:6.2f} us/update".format(name=name,
+                                                     us=elapsed / NUMBER * 1e6)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmark of loading a large station catalog.
+
+Writes a catalog of 10,000 stations in each of the supported formats and
+loads each one in a new process, showing the time taken to load the catalog
+and build the grouped menu and the increase in the peak memory of the process.
+
+Run from the root of the repository:
+
+    python benchmarks/station_catalog.py
+"""
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+from time import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from modes.lib.station_catalog import StationCatalog
+
+STATIONS = 10000
+
+GENRES = ["Pop", "Rock", "Jazz", "Classical", "News", "Talk", "Dance", "Folk",
+          "Country", "Blues", "Reggae", "Metal", "Ambient", "Sport", ""]
+COUNTRIES = ["GB", "US", "DE", "FR", "ES", "PY", "BR", "JP", "IT", "NL", ""]
+WORDS = ["Radio", "FM", "Classic", "Hits", "Live", "City", "Sound", "Wave",
+         "Café", "Música", "Zürich", "Nord", "Sud", "Jazz", "One", "Plus"]
+
+
+def make_stations():
+    rand = random.Random(1)
+
+    for num in range(STATIONS):
+        name = u" ".join(w.decode("utf-8")
+                         for w in rand.sample(WORDS, 3)) + u" {}".format(num)
+        yield {"name": name,
+               "url": "http://stream{}.example.com:8000/live.mp3".format(num),
+               "genre": rand.choice(GENRES),
+               "country": rand.choice(COUNTRIES)}
+
+
+def write_catalogs(folder):
+    paths = {}
+
+    paths["m3u"] = os.path.join(folder, "stations.m3u")
+    with open(paths["m3u"], "w") as m3u:
+        m3u.write("#EXTM3U\n")
+        for st in make_stations():
+            m3u.write(u'#EXTINF:-1 group-title="{genre}" tvg-country='
+                      u'"{country}",{name}\n{url}\n'.format(**st)
+                      .encode("utf-8"))
+
+    paths["pls"] = os.path.join(folder, "stations.pls")
+    with open(paths["pls"], "w") as pls:
+        pls.write("[playlist]\n")
+        for num, st in enumerate(make_stations(), 1):
+            pls.write(u"File{n}={url}\nTitle{n}={name}\n".format(n=num, **st)
+                      .encode("utf-8"))
+        pls.write("NumberOfEntries={}\nVersion=2\n".format(STATIONS))
+
+    paths["jsonl"] = os.path.join(folder, "stations.jsonl")
+    with open(paths["jsonl"], "w") as jsonl:
+        for st in make_stations():
+            jsonl.write(json.dumps(st) + "\n")
+
+    paths["json"] = os.path.join(folder, "stations.json")
+    with open(paths["json"], "w") as js:
+        json.dump(list(make_stations()), js)
+
+    return paths
+
+
+def load(path):
+    """Loads the catalog and prints the results (run in a new process)."""
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time()
+    catalog = StationCatalog()
+    catalog.load(path)
+    loaded = time()
+    menu = catalog.menu(lambda pos: None)
+    built = time()
+
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    print json.dumps({"stations": len(catalog),
+                      "load": (loaded - start) * 1000,
+                      "menu": (built - loaded) * 1000,
+                      "groups": [(title, len(items)) for title, items in menu],
+                      "memory": after - before})
+
+
+def main():
+    folder = tempfile.mkdtemp()
+
+    try:
+        paths = write_catalogs(folder)
+
+        print "{:<6} {:>9} {:>10} {:>10} {:>12}".format(
+            "format", "stations", "load (ms)", "menu (ms)", "memory (KB)")
+
+        for fmt in ("m3u", "pls", "jsonl", "json"):
+            output = subprocess.check_output([sys.executable, __file__,
+                                              paths[fmt]])
+            result = json.loads(output)
+            print "{:<6} {:>9} {:>10.0f} {:>10.0f} {:>12}".format(
+                fmt, result["stations"], result["load"], result["menu"],
+                result["memory"])
+
+        print
+        print "Menu groups: {}".format(
+            ", ".join("{} ({})".format(*group) for group in result["groups"]))
+
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        load(sys.argv[1])
+    else:
+        main()
@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+"""Benchmark of switching between Internet Radio stations.
+
+A local HTTP server stands in for the stations. Each station's address is a
+PLS playlist pointing to an address that redirects to the stream, and every
+request to the server is delayed by LATENCY to stand in for the network.
+
+The script shows:
+
+    time to first audio: how long a player takes to get the first audio
+                         from the station's address and from the resolved
+                         address (as remembered by StreamResolver)
+    switching:           the stations played by a fake MPD when the
+                         listener selects one station or several in quick
+                         succession, how many of them had already been
+                         resolved and the time from selecting a station to
+                         MPD being told to play it (including the wait for
+                         quick selections to finish)
+
+Run from the root of the repository:
+
+    python benchmarks/station_switching.py
+"""
+import BaseHTTPServer
+import os
+import shutil
+import SocketServer
+import sys
+import tempfile
+import threading
+from collections import Counter
+from StringIO import StringIO
+from time import sleep, time
+import urllib2
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import modes.internetradio as internetradio
+from modes.lib.mpd_client import MPDClient
+from modes.lib.station_catalog import StationCatalog
+from modes.lib.stream_resolver import StreamResolver
+from resources.scheduler import Scheduler
+
+from mpd_metadata import ScriptedMPD
+from playlist_sync import FakeMPDHandler, FakeMPDServer
+
+STATIONS = 10
+
+# Delay added to each HTTP request (seconds)
+LATENCY = 0.05
+
+# Time between selections when switching quickly (seconds)
+SELECT_INTERVAL = 0.1
+
+
+class StationHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serves /pls/N (playlist), /redirect/N and /stream/N."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        sleep(LATENCY)
+        _, kind, num = self.path.split("/")
+        base = "http://{}:{}".format(*self.server.server_address)
+
+        if kind == "pls":
+            body = "[playlist]\nFile1={}/redirect/{}\nNumberOfEntries=1\n" \
+                   .format(base, num)
+            self.send_response(200)
+            self.send_header("Content-Type", "audio/x-scpls")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        elif kind == "redirect":
+            self.send_response(302)
+            self.send_header("Location", "{}/stream/{}".format(base, num))
+            self.end_headers()
+
+        else:
+            self.send_response(200)
+            self.send_header("Content-Type", "audio/mpeg")
+            self.end_headers()
+            try:
+                for _ in range(10):
+                    self.wfile.write("\xff\xfb" * 2048)
+            except IOError:
+                pass
+
+
+class TimedMPD(ScriptedMPD):
+    """Fake MPD which records when it was told to play."""
+
+    def __init__(self):
+        super(TimedMPD, self).__init__()
+        self.played = []
+
+    def run(self, args):
+        if args[0] == "play":
+            self.played.append(time())
+        return super(TimedMPD, self).run(args)
+
+
+class StationServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Players close the stream once they have the audio they need
+        pass
+
+
+def first_audio(url):
+    """Plays the address like a player would (following redirects and
+       playlists) and returns the time taken to get the first audio.
+    """
+    start = time()
+
+    while True:
+        response = urllib2.urlopen(url)
+        if response.info().gettype() != "audio/x-scpls":
+            break
+
+        playlist = StationCatalog()
+        playlist.read(StringIO(response.read()), ".pls")
+        response.close()
+        url = playlist.stations[0].url
+
+    response.read(4096)
+    response.close()
+
+    return time() - start
+
+
+def serve(server):
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server.server_address
+
+
+def main():
+    host, port = serve(StationServer(("127.0.0.1", 0), StationHandler))
+    urls = ["http://{}:{}/pls/{}".format(host, port, num)
+            for num in range(STATIONS)]
+
+    print "{} stations, {:.0f}ms latency per request".format(
+        STATIONS, LATENCY * 1000)
+    print
+
+    # Time to first audio
+    resolver = StreamResolver()
+    start = time()
+    resolved = [resolver.resolve(url) for url in urls]
+    resolve_time = (time() - start) / STATIONS
+
+    cold = [first_audio(url) for url in urls]
+    warm = [first_audio(url) for url in resolved]
+
+    print "Time to first audio"
+    print "  station address:  {:6.1f} ms".format(
+        sum(cold) / STATIONS * 1000)
+    print "  resolved address: {:6.1f} ms".format(
+        sum(warm) / STATIONS * 1000)
+    print "  (resolving took {:.1f} ms per station in the background)" \
+        .format(resolve_time * 1000)
+    print
+
+    # Switching stations with a fake MPD
+    mpd_server = FakeMPDServer(("127.0.0.1", 0), FakeMPDHandler)
+    mpd_server.mpd = mpd = TimedMPD()
+    serve(mpd_server)
+
+    folder = tempfile.mkdtemp()
+    with open(os.path.join(folder, "stations.m3u"), "w") as catalog:
+        for num, url in enumerate(urls):
+            catalog.write("#EXTINF:-1,Station {}\n{}\n".format(num, url))
+
+    internetradio.CATALOG_DIRS = [folder]
+    internetradio.PLAYLIST_CACHE = os.path.join(folder, "playlist.json")
+
+    scheduler = Scheduler()
+    loop = threading.Thread(target=scheduler.run)
+    loop.daemon = True
+    loop.start()
+
+    mode = internetradio.ModeRadio()
+    mode.mpd = MPDClient(*mpd_server.server_address)
+    mode.scheduler = scheduler
+
+    try:
+        mode.enter()
+        sleep(1)
+
+        def select(stations, delay):
+            """Selects the stations SELECT_INTERVAL apart. Returns the
+               number played, the number played from resolved addresses and
+               the times from the first and last selections to the first
+               and last plays (or None).
+            """
+            played = len(mpd.played)
+            hits = mode.resolver.hits
+            first = None
+
+            for link in stations:
+                if first is not None:
+                    sleep(SELECT_INTERVAL)
+                selected = time()
+                if first is None:
+                    first = selected
+                mode.play_station(link, delay=delay)
+
+            sleep(internetradio.SWITCH_DELAY + 0.1)
+            plays = mpd.played[played:]
+
+            to_first = (plays[0] - first) * 1000 if plays else None
+            to_last = (plays[-1] - selected) * 1000 \
+                if plays and plays[-1] >= selected else None
+
+            return (len(plays), mode.resolver.hits - hits, to_first, to_last)
+
+        def ms(value):
+            return "-" if value is None else "{:.1f}".format(value)
+
+        print "Selecting stations {:.0f}ms apart".format(
+            SELECT_INTERVAL * 1000)
+        print "  {:<30} {:>6} {:>9} {:>14} {:>14}".format(
+            "", "played", "resolved", "first (ms)", "last (ms)")
+
+        for name, stations, delay in (
+                ("one station", [2], internetradio.SWITCH_DELAY),
+                ("5 stations", [3, 4, 5, 6, 7], internetradio.SWITCH_DELAY),
+                ("5 stations without waiting", [3, 4, 5, 6, 7], 0),
+                ("5 stations, back to the first", [8, 9, 10, 9, 8],
+                 internetradio.SWITCH_DELAY)):
+            # Give the resolver time to resolve the current station's
+            # neighbours (and end the last run of quick selections)
+            sleep(1)
+            plays, hits, to_first, to_last = select(stations, delay)
+            print "  {:<30} {:>6} {:>9} {:>14} {:>14}".format(
+                name, plays, hits, ms(to_first), ms(to_last))
+
+        print
+        print "  first/last: time from the first/last selection to MPD " \
+              "being told to play"
+
+    finally:
+        mode.exit()
+        mode.mpd.disconnect()
+        scheduler.stop()
+        shutil.rmtree(folder)
+        mpd_server.shutdown()
+        mpd_server.server_close()
+
+
+if __name__ == "__main__":
+    main()
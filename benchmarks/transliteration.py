@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmark of converting track metadata for the display.
+
+Compares the old approach (normalising every field of every metadata update)
+with the cached character ROM conversion. Metadata is repeated as it would be
+when a mode sends the same track details to the display several times.
+
+Run from the root of the repository:
+
+    python benchmarks/transliteration.py
+"""
+import os
+import sys
+import timeit
+import unicodedata
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from resources.lcd_charset import LCDCharset, ROM_A00, ROM_A02
+
+# How many times each track's metadata is sent to the display
+REPEATS = 20
+
+TRACKS = [(u"Hoppípolla", u"Sigur Rós", u"Takk..."),
+          (u"Ace of Spades", u"Motörhead", u"Ace of Spades"),
+          (u"Jóga", u"Björk", u"Homogenic"),
+          (u"Déjà Vu", u"Beyoncé", u"B'Day"),
+          (u"Kickstart My Heart", u"Mötley Crüe", u"Dr. Feelgood"),
+          (u"Ñá Ñá Ñá", u"Los Fabulosos Cadillacs", u"El León"),
+          (u"Mañana", u"Café Tacvba", u"Re"),
+          (u"99 Luftballons", u"Nena", u"Nena"),
+          (u"Für Elise", u"Ludwig van Beethoven", u"Klavierstücke"),
+          (u"Englabörn", u"Jóhann Jóhannsson", u"Englabörn"),
+          (u"Don’t Stop Me Now", u"Queen", u"Jazz"),
+          (u"Señorita", u"Shawn Mendes & Camila Cabello", u"Señorita"),
+          (u"Águas de Março", u"Elis Regina & Tom Jobim", u"Elis & Tom"),
+          (u"L’Été indien", u"Joe Dassin", u"Joe Dassin"),
+          (u"Łódź", u"Kult", u"Spokojnie"),
+          (u"Ζορμπάς", u"Μίκης Θεοδωράκης", u"Zorba the Greek"),
+          (u"Paranoid Android", u"Radiohead", u"OK Computer"),
+          (u"Smells Like Teen Spirit", u"Nirvana", u"Nevermind")]
+
+METADATA = [{"Title": title, "Artist": artist, "Album": album}
+            for title, artist, album in TRACKS for _ in range(REPEATS)]
+
+
+def remove_accents(data):
+    """The original conversion from RadioBaseMode."""
+    if type(data) == dict:
+        return {key: remove_accents(data[key]) for key in data}
+
+    nfkd_form = unicodedata.normalize('NFKD', data)
+    return nfkd_form.encode('ASCII', 'ignore')
+
+
+def main():
+    number = 20
+
+    def old():
+        for meta in METADATA:
+            remove_accents(meta)
+
+    results = [("normalise every update", old)]
+
+    for rom in (ROM_A00, ROM_A02):
+        charset = LCDCharset(rom)
+
+        def new(charset=charset):
+            for meta in METADATA:
+                {key: charset.translate(meta[key]) for key in meta}
+
+        results.append(("cached ({})".format(rom), new))
+
+    # RadioBaseMode also skips fields that haven't changed since the last
+    # update from the mode
+    charset = LCDCharset()
+    fields = {}
+
+    def convert_field(key, value):
+        last = fields.get(key)
+        if last is not None and last[0] == value:
+            return last[1]
+        text = charset.translate(value)
+        fields[key] = (value, text)
+        return text
+
+    def changed_only():
+        for meta in METADATA:
+            {key: convert_field(key, meta[key]) for key in meta}
+
+    results.append(("changed fields only", changed_only))
+
+    for name, func in results:
+        elapsed = timeit.timeit(func, number=number)
+        per_update = elapsed / (number * len(METADATA)) * 1e6
+        print "{name:<24} {us:6.2f} us/update".format(name=name, us=per_update)
+
+    # Show what the display would get for a few tracks
+    print
+    for rom in (ROM_A00, ROM_A02):
+        charset = LCDCharset(rom)
+        for title, artist, _ in TRACKS[:5]:
+            print "{rom}: {old:<30} {new!r}".format(
+                rom=rom, old=remove_accents(artist),
+                new=charset.translate(artist))
+
+
+if __name__ == "__main__":
+    main()
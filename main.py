@@ -1,5 +1,9 @@
 #!/usr/bin/env python
-import time
+import logging
+from time import time
+
+# Time taken to start the radio is logged
+started = time()
 
 # GPIO control
 import pigpio
@@ -14,6 +18,9 @@ from modes.squeezeplayer import ModeSqueezeplayer
 from modes.internetradio import ModeRadio
 from modes.airplay import ModeAirplay
 
+# Show log messages (e.g. latency statistics if tracing is enabled)
+logging.basicConfig(level=logging.INFO)
+
 # Get pigpio up and running
 pi = pigpio.pi()
 
@@ -28,16 +35,17 @@ radio = PiRadio(pi, [ModeSqueezeplayer(),
 # Go!
 radio.start()
 
-# Keep the script alive
-while True:
-    try:
-        time.sleep(1)
+logging.info("Radio ready in {:.0f}ms".format((time() - started) * 1000))
 
-    # Yes, this is bad practice but let's catch everything that goes wrong
-    except:
-        try:
-            radio.exit()
-        except TypeError:
-            pass
+# Run the radio's scheduler (this keeps the script alive)
+try:
+    radio.run()
+
+# Yes, this is bad practice but let's catch everything that goes wrong
+except:
+    try:
+        radio.exit()
+    except TypeError:
+        pass
 
-        raise
+    raise
@@ -17,6 +17,7 @@ OFF = ["sudo", "systemctl", "stop", "shairport-sync.service"]
 class ModeAirplay(RadioBaseMode):
 
     name = "Airplay"
+    icon = "airplay"
 
     def __init__(self):
         super(ModeAirplay, self).__init__()
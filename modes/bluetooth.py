@@ -6,8 +6,6 @@
 # There is no option to pair devices at the moment. This may be added in later
 # releases.
 from subprocess import check_output
-from threading import Thread
-from time import sleep
 
 import dbus
 
@@ -16,10 +14,23 @@ from resources.basemode import RadioBaseMode
 # Define the dbus interface for metadata discovery
 PLAYER_IFACE = "org.bluez.MediaPlayer1"
 
+# Interface for the audio stream (has the volume of the device)
+TRANSPORT_IFACE = "org.bluez.MediaTransport1"
+
+# Maximum volume of a media transport
+TRANSPORT_MAX_VOLUME = 127
+
+# How often to check for metadata (seconds)
+POLL_INTERVAL = 1
+
 
 class ModeBluetooth(RadioBaseMode):
 
     name = "Bluetooth"
+    icon = "bluetooth"
+
+    # Each volume change is sent to the device over Bluetooth
+    volume_rate = 10
 
     def __init__(self):
         super(ModeBluetooth, self).__init__()
@@ -37,6 +48,7 @@ class ModeBluetooth(RadioBaseMode):
         # Initialise some basic variables
         self.running = False
         self.player = None
+        self.meta_timer = None
 
     def enter(self):
         # Enable bluetooth adaptor
@@ -49,15 +61,18 @@ class ModeBluetooth(RadioBaseMode):
         # Set the flag so we know our script is running
         self.running = True
 
-        # Define and start a thread to get the song metadata
-        meta = Thread(target=self.get_metadata)
-        meta.daemon = True
-        meta.start()
+        # Check the song metadata regularly
+        self.meta_timer = self.scheduler.call_every(POLL_INTERVAL,
+                                                    self.get_metadata)
 
     def exit(self):
-        # Set the running flag to False to stop the metadata thread
+        # Set the running flag to False and stop checking the metadata
         self.running = False
 
+        if self.meta_timer:
+            self.meta_timer.cancel()
+            self.meta_timer = None
+
         # Disable the bluetooth adaptor
         self.start_bluetooth(False)
 
@@ -126,14 +141,35 @@ class ModeBluetooth(RadioBaseMode):
                 return False
 
     def get_metadata(self):
-        """Method to get track metadata. This should be run in a thread.
+        """Method to get track metadata. Called regularly by the scheduler.
 
            When metadata is found, it is sent to the display.
         """
-        while self.running:
-            if self.poll_metadata():
-                self.show_text("metadata", self.metadata)
-            sleep(1)
+        if self.running and self.poll_metadata():
+            self.show_text("metadata", self.metadata)
+
+    def set_volume(self, level):
+        """Sets the volume of the connected device's audio stream."""
+        if not self.running:
+            return False
+
+        iface = "org.freedesktop.DBus.Properties"
+
+        try:
+            objects = self.manager.GetManagedObjects()
+
+            for path, interfaces in objects.iteritems():
+                if TRANSPORT_IFACE in interfaces:
+                    transport = self.bus.get_object("org.bluez", path)
+                    volume = dbus.UInt16(level * TRANSPORT_MAX_VOLUME // 100)
+                    transport.Set(TRANSPORT_IFACE, "Volume", volume,
+                                  dbus_interface=iface)
+                    return True
+
+        except dbus.DBusException:
+            pass
+
+        return False
 
     def start_bluetooth(self, enabled=False):
         """Method to enable bluetooth. As the audio will stutter if the wifi is
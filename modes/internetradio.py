@@ -1,11 +1,49 @@
 # Internet Radio mode for PiRadio
 
-# Uses MPD to stream sources. Playlist of stations is defined in code below.
-from subprocess import check_output
-from time import sleep
-from threading import Thread
+# Uses MPD to stream sources. Stations are loaded from the catalogs (M3U, PLS
+# or JSON files) in CATALOG_DIRS. If there aren't any, the stations defined in
+# the code below are used.
+#
+# The MPD playlist is only updated when the mode is first entered. Only the
+# stations that have been added or removed since the last time are changed.
+#
+# Stream titles (from the station's ICY metadata) are shown when MPD tells us
+# the player has changed (see MPDIdleWatcher) rather than by polling.
+#
+# To start stations quickly, the addresses of the streams (after redirects and
+# playlists) are remembered and the stations either side of the one playing
+# are resolved in the background (see StreamResolver). Selecting several
+# stations in quick succession only plays the last one.
+import difflib
+import hashlib
+import json
+import logging
+import os
+from time import time
 
 from resources.basemode import RadioBaseMode
+from .lib.mpd_client import MPDClient, MPDError, MPDIdleWatcher
+from .lib.station_catalog import StationCatalog
+from .lib.stream_resolver import StreamResolver
+
+# Folders containing station catalogs
+CATALOG_DIRS = [os.path.expanduser("~/.piradio/stations")]
+
+# File recording the stations in the MPD playlist when it was last updated
+# (and whether there's a resolved address after them)
+PLAYLIST_CACHE = os.path.expanduser("~/.piradio/playlist.json")
+
+# Shown as the artist if the station doesn't send its name
+LISTENING = "Listening to:"
+
+# A station selected within this time (seconds) of the last one isn't played
+# until this time has passed without another selection. Stations selected
+# after a pause are played straight away.
+SWITCH_DELAY = 0.3
+
+# Number of stations either side of the current one to resolve in the
+# background (0 to turn off)
+PREFETCH_NEIGHBOURS = 1
 
 # Define the radio stations
 STATIONS = [("Radio 1", "http://bbcmedia.ic.llnwd.net/stream/bbcmedia_radio1_mf_p"),
@@ -20,76 +58,271 @@ STATIONS = [("Radio 1", "http://bbcmedia.ic.llnwd.net/stream/bbcmedia_radio1_mf_
             ("Heart", "http://media-sov.musicradio.com:80/HeartLondonMP3"),
             ("XFM", "http://media-sov.musicradio.com:80/RadioXLondonMP3")]
 
+log = logging.getLogger(__name__)
+
 
 class ModeRadio(RadioBaseMode):
 
     name = "Internet Radio"
 
+    # Volume changes are sent over the MPD connection
+    volume_rate = 10
+
     def __init__(self):
         super(ModeRadio, self).__init__()
 
-        # Build the playlist of our radio stations and add to our menu
+        # Connection to MPD (connects when the first command is sent)
+        self.mpd = MPDClient()
+
+        # Load our radio stations and add them to our menu. The playlist is
+        # updated when the mode is entered.
         self.get_stations()
+        self.synced = False
+        self.playlist_fingerprint = None
 
         # Finish building the menu
         self.build_menu()
 
-        # Internet radio is unlikely to provide metadata so we'll just let
-        # the listener know what station they're listening to
-        self.metadata = {"Artist": "Listening to:"}
+        # Show the station's name and, if the station sends them, its stream
+        # title and the name it broadcasts
+        self.metadata = {"Artist": LISTENING}
 
         # Initialise some useful variables
         self.current_station = None
         self.running = False
 
+        # Watches MPD for changes to the stream while the mode is active
+        self.watcher = None
+
+        # Resolved stream addresses, the timer for the station waiting to be
+        # played, when the last station was selected, the station that's
+        # playing and whether there is a resolved address after our stations
+        # in the MPD playlist
+        self.resolver = StreamResolver()
+        self.pending = None
+        self.selected = None
+        self.streaming = None
+        self.extra = False
+
     def get_stations(self):
         """Creates menu entries for each radio station."""
-        menu = []
+        self.catalog = StationCatalog()
+
+        for path in CATALOG_DIRS:
+            self.catalog.load_dir(path)
+
+        # Use our own list if there aren't any catalogs
+        if not len(self.catalog):
+            for station, link in STATIONS:
+                self.catalog.add(station, link)
+
+        log.info("Loaded {} stations".format(len(self.catalog)))
+
+        # Create menu items with callbacks to start the streams. The position
+        # of the station in the catalog is used to play it.
+        self.menu = self.catalog.menu(self.play_station,
+                                      label=self.remove_accents)
+        self.menu.append(("Stream info", self.show_stream_info))
+
+    def fingerprint(self, urls):
+        """Returns a fingerprint of a list of stream addresses."""
+        return hashlib.sha1("\n".join(url.encode("utf-8")
+                                      for url in urls)).hexdigest()
+
+    def read_cache(self):
+        """Returns the details saved when the playlist was last updated."""
+        try:
+            with open(PLAYLIST_CACHE) as cache:
+                return json.load(cache)
 
-        # Empty the existing playlist to be safe
-        _ = check_output (["mpc", "clear"])
+        except (IOError, ValueError):
+            return {}
 
-        # Loop over the list of stations. We need the index too as mpc uses this
-        # to play items.
-        for i, (station, link) in enumerate(STATIONS):
+    def write_cache(self, fingerprint, version, extra=False):
+        try:
+            folder = os.path.dirname(PLAYLIST_CACHE)
+            if not os.path.isdir(folder):
+                os.makedirs(folder)
 
-            # Add the stream address to the mpd playlist
-            _ = check_output(["mpc", "add", link])
+            with open(PLAYLIST_CACHE, "w") as cache:
+                json.dump({"fingerprint": fingerprint,
+                           "version": version,
+                           "extra": extra}, cache)
 
-            # Create a menu item with a callback to start the stream
-            menu.append((station, lambda i=i+1: self.play_station(i)))
+        except (IOError, OSError) as err:
+            log.warning("Unable to save playlist details: {}".format(err))
 
-        # Add the menu items to the mode's main menu
-        self.menu = menu
+    def sync_playlist(self):
+        """Makes sure the MPD playlist matches our stations.
+
+           If neither the stations nor the playlist have changed since we last
+           updated it, nothing needs to be sent. Otherwise the playlist is
+           compared with the stations and only the differences are sent.
+        """
+        wanted = [station.url for station in self.catalog.stations]
+        fingerprint = self.fingerprint(wanted)
+        cache = self.read_cache()
+
+        try:
+            # MPD's playlist version changes whenever the playlist is changed.
+            # The version isn't kept when MPD restarts so the length is
+            # checked too (a resolved address may have been left after our
+            # stations, e.g. if the radio wasn't shut down cleanly).
+            status = self.mpd.status()
+            version = status.get("playlist")
+            extra = cache.get("extra", False)
+            length = len(wanted) + (1 if extra else 0)
+
+            if (cache.get("fingerprint") == fingerprint and
+                    cache.get("version") == version and
+                    status.get("playlistlength") == str(length)):
+                log.info("Playlist is up to date")
+                self.playlist_fingerprint = fingerprint
+                self.synced = True
+
+                self.extra = extra
+                self.remove_extra()
+                return
+
+            current = [url.decode("utf-8") for url in self.mpd.playlist()]
+            if self.fingerprint(current) != fingerprint:
+
+                # Work from the end of the playlist so the positions of the
+                # earlier changes aren't affected by the later ones
+                matcher = difflib.SequenceMatcher(None, current, wanted,
+                                                  autojunk=False)
+                commands = []
+
+                for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+                    if tag in ("replace", "delete"):
+                        commands.append(("delete", "{}:{}".format(i1, i2)))
+                    if tag in ("replace", "insert"):
+                        commands += [("addid", url, i1 + offset)
+                                     for offset, url in
+                                     enumerate(wanted[j1:j2])]
+
+                self.mpd.command_list(commands)
+                log.info("Updated playlist with {} changes"
+                         .format(len(commands)))
+
+                version = self.mpd.status().get("playlist")
+
+            self.write_cache(fingerprint, version)
+            self.playlist_fingerprint = fingerprint
+            self.synced = True
+            self.extra = False
+
+        except MPDError as err:
+            log.warning("Unable to load stations: {}".format(err))
+
+    def remove_extra(self):
+        """Removes the resolved address after our stations (if there is one)
+           and records the new playlist version so the next sync doesn't
+           need to read the playlist.
+        """
+        if not self.extra:
+            return
+
+        try:
+            results = self.mpd.command_list([("delete", len(self.catalog)),
+                                             ("status",)])
+            self.extra = False
+            self.write_cache(self.playlist_fingerprint,
+                             dict(results[-1]).get("playlist"))
+
+        except MPDError as err:
+            log.warning("Unable to tidy playlist: {}".format(err))
 
     def enter(self):
+        # Make sure the playlist has our stations
+        if not self.synced:
+            self.sync_playlist()
+
         # When turning on the radio, we automatically want to start playing.
         # Preference is to start the last tuned station. If this is the first
         # time, then we play the first station in the playlist.
         if self.current_station is None:
             self.current_station = 1
 
-        self.play_station(self.current_station)
+        if not self.resolver.is_alive():
+            self.resolver.start()
+
+        self.play_station(self.current_station, delay=0)
 
         # Set the script as running
         self.running = True
 
-        # Define and start the thread
-        # meta = Thread(target=self.show_station)
-        # meta.daemon = True
-        # meta.start()
+        # Show the stream title whenever MPD says the player has changed
+        if self.scheduler:
+            self.watcher = MPDIdleWatcher(self.scheduler, self.player_changed,
+                                          host=self.mpd.host,
+                                          port=self.mpd.port)
+            self.watcher.start()
+
+        self.update_metadata()
 
     def exit(self):
+        # Forget any station waiting to be played
+        if self.pending:
+            self.pending.cancel()
+            self.pending = None
+
+        self.streaming = None
+
+        # Stop watching for changes
+        if self.watcher:
+            self.watcher.stop()
+            self.watcher = None
+
         # Stop the radio stream
-        _ = check_output(["mpc", "stop"])
+        try:
+            self.mpd.stop()
+        except MPDError as err:
+            log.warning("Unable to stop: {}".format(err))
+
+        # Leave the playlist with just our stations
+        self.remove_extra()
+
         self.running = False
 
-    def play_station(self, link):
-        # Start the radio stream
-        _ = check_output(["mpc", "play", str(link)])
+    def set_volume(self, level):
+        """Sets the volume of MPD's output."""
+        if not self.running:
+            return False
+
+        try:
+            self.mpd.setvol(level)
+            return True
+
+        except MPDError:
+            return False
 
-        # Set the metadata to show the name of the current station
-        self.metadata["Album"] = STATIONS[link-1][0]
+    def play_station(self, link, delay=SWITCH_DELAY):
+        """Shows the station and starts playing it.
+
+           If the last station was selected less than "delay" seconds ago,
+           the listener is probably moving through the stations so we wait
+           until there's a pause before playing this one.
+        """
+        now = time()
+        quick = self.selected is not None and now - self.selected < delay
+        self.selected = now
+
+        if self.pending:
+            self.pending.cancel()
+            self.pending = None
+
+        if quick and self.scheduler:
+            self.pending = self.scheduler.call_later(delay, self.start_stream,
+                                                     link, True)
+        else:
+            self.start_stream(link)
+
+        # Set the metadata to show the name of the current station. The
+        # stream's details are added once MPD has them.
+        self.metadata["Album"] = self.catalog.stations[link-1].name
+        self.metadata["Artist"] = LISTENING
+        self.metadata["Title"] = ""
 
         # Send metadata to the display
         self.show_text("metadata", self.metadata)
@@ -97,11 +330,113 @@ class ModeRadio(RadioBaseMode):
         # Remember the current station
         self.current_station = link
 
-    # def show_station(self):
-    #     station = -1
-    #
-    #     while self.running:
-    #         if station != self.current_station:
-    #             self.show_text("metadata", self.metadata)
-    #             station = self.current_station
-    #         sleep(1)
+    def start_stream(self, link, debounced=False):
+        """Plays the station's stream and resolves the stations either side
+           of it in the background.
+        """
+        self.pending = None
+
+        # After moving through the stations, the listener may have come back
+        # to the one that's playing
+        if debounced and link == self.streaming:
+            return
+
+        self.streaming = link
+        station = self.catalog.stations[link-1]
+        url = self.resolver.cached(station.url)
+
+        try:
+            # Play the station's entry in the playlist (MPD counts positions
+            # from 0) unless we know where the stream actually is. In that
+            # case, the resolved address is put after our stations and
+            # played instead. The new playlist version is saved so the
+            # playlist doesn't need to be read at the next sync.
+            if url is None or url == station.url or not self.synced:
+                self.mpd.play(link - 1)
+
+            else:
+                end = len(self.catalog)
+                commands = [("delete", end)] if self.extra else []
+                commands += [("addid", url, end), ("play", end), ("status",)]
+
+                results = self.mpd.command_list(commands)
+                self.extra = True
+                self.write_cache(self.playlist_fingerprint,
+                                 dict(results[-1]).get("playlist"),
+                                 extra=True)
+
+        except MPDError as err:
+            log.warning("Unable to play station: {}".format(err))
+            self.extra = False
+            self.streaming = None
+
+        # Resolve this station (if we haven't already) and its neighbours
+        first = max(0, link - 1 - PREFETCH_NEIGHBOURS)
+        nearby = self.catalog.stations[first:link + PREFETCH_NEIGHBOURS]
+        self.resolver.prefetch([item.url for item in nearby])
+
+    def player_changed(self, changed):
+        """Called (on the scheduler's thread) when MPD's player changes."""
+        if self.running:
+            self.update_metadata()
+
+    def update_metadata(self):
+        """Gets the stream's title and name from MPD and shows them if they
+           have changed.
+        """
+        try:
+            song = self.mpd.currentsong()
+        except MPDError as err:
+            log.warning("Unable to get stream title: {}".format(err))
+            return
+
+        title = song.get("Title", "").decode("utf-8", "ignore")
+        artist = song.get("Name", "").decode("utf-8", "ignore") or LISTENING
+
+        if (title == self.metadata.get("Title", "") and
+                artist == self.metadata.get("Artist")):
+            return
+
+        self.metadata["Title"] = title
+        self.metadata["Artist"] = artist
+        self.show_text("metadata", self.metadata)
+
+    def stream_info(self):
+        """Returns a dict of the stream's state ("play", "pause" or "stop"),
+           bitrate (kbps), audio format ("samplerate:bits:channels"), whether
+           it is still buffering and any error.
+
+           MPD doesn't report how full its buffer is. The stream is treated as
+           buffering if it is playing but MPD hasn't decoded any audio yet.
+        """
+        status = self.mpd.status()
+        state = status.get("state", "stop")
+
+        return {"state": state,
+                "bitrate": int(status.get("bitrate", 0)),
+                "audio": status.get("audio"),
+                "buffering": state == "play" and "audio" not in status,
+                "error": status.get("error")}
+
+    def show_stream_info(self):
+        """Shows the bitrate of the stream (or whether it is buffering)."""
+        try:
+            info = self.stream_info()
+        except MPDError as err:
+            log.warning("Unable to get stream info: {}".format(err))
+            return
+
+        if info["error"]:
+            text = info["error"]
+        elif info["buffering"]:
+            text = "Buffering..."
+        elif info["state"] != "play":
+            text = "Not playing"
+        else:
+            text = "{}kbps".format(info["bitrate"])
+            if info["audio"]:
+                rate = info["audio"].split(":")[0]
+                if rate.isdigit():
+                    text += " {:g}kHz".format(int(rate) / 1000.0)
+
+        self.show_text("menuinfo", text)
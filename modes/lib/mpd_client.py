@@ -0,0 +1,350 @@
+"""
+Simple client for the Music Player Daemon (MPD) protocol.
+
+The client keeps one connection to MPD open rather than starting a new
+process (and connection) for every command as mpc does. Several commands can
+be sent together in a command list so they only need one round trip.
+
+If the connection is lost (e.g. MPD has closed an idle connection) the client
+reconnects and sends the command again.
+
+MPDIdleWatcher uses MPD's "idle" command on a separate connection to find out
+when the player changes (e.g. a new song or stream title) without polling.
+"""
+import logging
+import socket
+import threading
+
+MPD_HOST = "localhost"
+MPD_PORT = 6600
+
+# Time to wait for MPD to respond (seconds)
+MPD_TIMEOUT = 10
+
+# Time to wait before reconnecting the idle watcher (seconds)
+RECONNECT_DELAY = 5
+
+log = logging.getLogger(__name__)
+
+
+class MPDError(Exception):
+    """MPD returned an error or couldn't be reached."""
+    pass
+
+
+def quote(arg):
+    """Quotes an argument for sending to MPD."""
+    arg = unicode(arg).encode("utf-8") if not isinstance(arg, str) else arg
+    return '"{}"'.format(arg.replace("\\", "\\\\").replace('"', '\\"'))
+
+
+class MPDClient(object):
+    """
+    Class for sending commands to MPD.
+
+    Responses are returned as lists of (key, value) tuples (MPD can return
+    the same key more than once e.g. for each item in the playlist).
+    """
+
+    def __init__(self, host=MPD_HOST, port=MPD_PORT, timeout=MPD_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+        self.sock = None
+        self.rfile = None
+        self.version = None
+        self._lock = threading.RLock()
+
+        # Number of round trips to the server and number of times the
+        # connection has been made
+        self.round_trips = 0
+        self.connections = 0
+
+    def connect(self):
+        """Connects to MPD."""
+        with self._lock:
+            self.disconnect()
+
+            try:
+                self.sock = socket.create_connection((self.host, self.port),
+                                                     self.timeout)
+                self.rfile = self.sock.makefile("rb")
+                greeting = self.rfile.readline()
+
+            except (socket.error, socket.timeout) as err:
+                self.disconnect()
+                raise MPDError("Unable to connect to MPD: {}".format(err))
+
+            if not greeting.startswith("OK MPD "):
+                self.disconnect()
+                raise MPDError("Unexpected greeting: {!r}".format(greeting))
+
+            self.version = greeting[7:].strip()
+            self.connections += 1
+
+    def disconnect(self):
+        """Closes the connection."""
+        with self._lock:
+            for item in (self.rfile, self.sock):
+                if item is not None:
+                    try:
+                        item.close()
+                    except socket.error:
+                        pass
+
+            self.sock = None
+            self.rfile = None
+
+    def _read_response(self, list_ok=False):
+        """Reads lines until OK (or list_OK). Returns the (key, value) pairs
+           and whether the response ended with list_OK.
+        """
+        pairs = []
+
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                raise socket.error("Connection closed by MPD")
+
+            line = line.rstrip("\n")
+
+            if line == "OK":
+                return pairs, False
+
+            if list_ok and line == "list_OK":
+                return pairs, True
+
+            if line.startswith("ACK "):
+                raise MPDError(line[4:])
+
+            key, _, value = line.partition(": ")
+            pairs.append((key, value))
+
+    def _send(self, lines, list_ok=False):
+        """Sends the lines and reads the response, reconnecting (once) if the
+           connection has been lost.
+        """
+        data = "".join(line + "\n" for line in lines)
+
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self.sock is None:
+                        self.connect()
+
+                    self.sock.sendall(data)
+                    self.round_trips += 1
+
+                    if not list_ok:
+                        return self._read_response()[0]
+
+                    results = []
+                    while True:
+                        pairs, more = self._read_response(list_ok=True)
+                        if not more:
+                            return results
+                        results.append(pairs)
+
+                except (socket.error, socket.timeout) as err:
+                    self.disconnect()
+                    if attempt:
+                        raise MPDError("Lost connection to MPD: {}"
+                                       .format(err))
+
+    def command(self, name, *args):
+        """Sends a command to MPD and returns the response."""
+        line = " ".join([name] + [quote(arg) for arg in args])
+        return self._send([line])
+
+    def command_list(self, commands):
+        """Sends a list of commands in one go. Each command is a tuple of the
+           command name and its arguments e.g. ("add", url).
+
+           Returns a list of the responses to each command.
+        """
+        lines = ["command_list_ok_begin"]
+        lines += [" ".join([cmd[0]] + [quote(arg) for arg in cmd[1:]])
+                  for cmd in commands]
+        lines.append("command_list_end")
+
+        return self._send(lines, list_ok=True)
+
+    def send_idle(self, *subsystems):
+        """Asks MPD to tell us when any of the subsystems (e.g. "player")
+           change. Returns straight away: the response is read with read_idle
+           once the connection has something to read.
+
+           No other commands can be sent until the response has been read.
+        """
+        line = " ".join(("idle",) + subsystems) + "\n"
+
+        with self._lock:
+            try:
+                if self.sock is None:
+                    self.connect()
+                self.sock.sendall(line)
+
+            except (socket.error, socket.timeout) as err:
+                self.disconnect()
+                raise MPDError("Lost connection to MPD: {}".format(err))
+
+    def read_idle(self):
+        """Reads the response to send_idle. Returns the list of subsystems
+           that changed.
+        """
+        with self._lock:
+            if self.rfile is None:
+                raise MPDError("Not connected to MPD")
+
+            try:
+                pairs, _ = self._read_response()
+                self.round_trips += 1
+
+            except (socket.error, socket.timeout) as err:
+                self.disconnect()
+                raise MPDError("Lost connection to MPD: {}".format(err))
+
+        return [value for key, value in pairs if key == "changed"]
+
+    def status(self):
+        """Returns the player status as a dict."""
+        return dict(self.command("status"))
+
+    def playlist(self):
+        """Returns the addresses of the items in the playlist (in order)."""
+        return [value for key, value in self.command("playlistinfo")
+                if key == "file"]
+
+    def currentsong(self):
+        """Returns the details of the current song as a dict."""
+        return dict(self.command("currentsong"))
+
+    def play(self, pos):
+        """Plays the playlist entry at the given position (starting at 0)."""
+        self.command("play", pos)
+
+    def stop(self):
+        self.command("stop")
+
+    def pause(self, paused=True):
+        self.command("pause", int(paused))
+
+    def setvol(self, level):
+        self.command("setvol", level)
+
+
+class MPDIdleWatcher(object):
+    """
+    Class which calls a function when parts of MPD change.
+
+    The watcher keeps its own connection waiting in MPD's "idle" command and
+    the scheduler watches the connection, so there's no polling and no thread.
+    If the connection is lost, the watcher reconnects after RECONNECT_DELAY
+    seconds.
+
+    Watcher takes the following parameters:
+      scheduler:  Scheduler instance to watch the connection
+      callback:   function called with the list of subsystems that changed
+      subsystems: the subsystems to watch (default: "player")
+      host, port: address of MPD
+    """
+
+    def __init__(self, scheduler, callback, subsystems=("player",),
+                 host=MPD_HOST, port=MPD_PORT):
+        self.scheduler = scheduler
+        self.callback = callback
+        self.subsystems = tuple(subsystems)
+        self.client = MPDClient(host, port, timeout=MPD_TIMEOUT)
+
+        self.running = False
+        self.fd = None
+        self.retry = None
+
+        # Number of notifications received
+        self.events = 0
+
+    def start(self):
+        """Starts watching MPD."""
+        self.running = True
+        self._idle()
+
+    def stop(self):
+        """Stops watching MPD and closes the connection.
+
+           The connection is closed on the scheduler's thread as the
+           scheduler may be waiting on it (and select fails if it's closed
+           from another thread).
+        """
+        self.running = False
+
+        if self.retry:
+            self.retry.cancel()
+            self.retry = None
+
+        self._unwatch()
+
+        # Use a new client if the watcher is started again
+        client = self.client
+        self.client = MPDClient(client.host, client.port,
+                                timeout=client.timeout)
+
+        if self.scheduler.thread is None:
+            client.disconnect()
+        else:
+            self.scheduler.call_later(0, client.disconnect)
+
+    def _unwatch(self):
+        if self.fd is not None:
+            self.scheduler.remove_reader(self.fd)
+            self.fd = None
+
+    def _idle(self):
+        """Sends the idle command and makes sure the scheduler is watching
+           the connection (which is new if we had to reconnect).
+        """
+        self.retry = None
+        if not self.running:
+            return
+
+        try:
+            self.client.send_idle(*self.subsystems)
+
+        except MPDError as err:
+            self._lost(err)
+            return
+
+        fd = self.client.sock.fileno()
+        if fd != self.fd:
+            self._unwatch()
+            self.fd = fd
+            self.scheduler.add_reader(fd, self._readable)
+
+    def _lost(self, err):
+        log.warning("MPD idle connection: {}".format(err))
+        self._unwatch()
+
+        if self.running:
+            self.retry = self.scheduler.call_later(RECONNECT_DELAY,
+                                                   self._idle)
+
+    def _readable(self, fd):
+        # The watcher may have been stopped while the scheduler was waiting
+        if not self.running or fd != self.fd:
+            return
+
+        try:
+            changed = self.client.read_idle()
+
+        except MPDError as err:
+            self._lost(err)
+            return
+
+        self.events += 1
+
+        try:
+            if changed:
+                self.callback(changed)
+
+        finally:
+            self._idle()
@@ -6,6 +6,9 @@ This code uses the JSON interface.
 import urllib2
 import json
 
+# Time to wait for the server to respond (seconds)
+LMS_TIMEOUT = 2
+
 
 class LMSPlayer(object):
 
@@ -49,9 +52,10 @@ class LMSServer(object):
     Provides access to JSON interface.
     """
 
-    def __init__(self, host="localhost", port=9000):
+    def __init__(self, host="localhost", port=9000, timeout=LMS_TIMEOUT):
         self.host = host
         self.port = port
+        self.timeout = timeout
         self.id = 1
         self.url = "http://{h}:{p}/jsonrpc.js".format(h=host, p=port)
 
@@ -72,7 +76,7 @@ class LMSServer(object):
                 "params": cmd}
 
         try:
-            response = urllib2.urlopen(req, json.dumps(data))
+            response = urllib2.urlopen(req, json.dumps(data), self.timeout)
             self.id += 1
             return json.loads(response.read())["result"]
 
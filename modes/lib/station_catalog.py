@@ -0,0 +1,220 @@
+"""
+Catalog of internet radio stations.
+
+Stations are loaded from M3U, PLS or JSON files. JSON files can either be a
+list of stations or have one station per line (JSON lines). The keys used by
+radio-browser.info exports ("name", "url", "tags", "countrycode") are
+understood as well as "genre" and "country".
+
+Files are read a line at a time (apart from JSON lists) so large catalogs
+don't need to be held in memory while they are parsed. Each station is stored
+as a small tuple and the genre and country names are shared between stations.
+
+The menu groups the stations by genre, by country and by the first letter of
+their name so that thousands of stations can be browsed with the dial.
+"""
+from collections import namedtuple
+import json
+import os
+import re
+
+# File extensions for each type of catalog
+M3U = (".m3u", ".m3u8")
+PLS = (".pls",)
+JSON = (".json", ".jsonl")
+
+# Catalogs with this many stations (or fewer) are shown as a single list
+GROUP_THRESHOLD = 20
+
+# Name used for stations without a genre or country
+UNKNOWN = "Other"
+
+# Attributes in an #EXTINF line e.g. group-title="Rock"
+EXTINF_ATTR = re.compile(r'([\w-]+)="([^"]*)"')
+
+Station = namedtuple("Station", "name url genre country")
+
+
+class StationCatalog(object):
+    """
+    Class to load stations and build the menu for them.
+
+    A station's position in the catalog (starting at 1) is its position in
+    the MPD playlist.
+    """
+
+    def __init__(self):
+        self.stations = []
+
+        # Shared copies of genre and country names
+        self._names = {}
+
+    def __len__(self):
+        return len(self.stations)
+
+    def _shared(self, text):
+        text = text.strip() or UNKNOWN
+        return self._names.setdefault(text, text)
+
+    def add(self, name, url, genre=None, country=None):
+        """Adds a station to the catalog."""
+        url = url.strip()
+        if not url:
+            return
+
+        name = name.strip() or url
+
+        # Only keep the first genre if there's a list of them
+        genre = (genre or "").split(",")[0].title()
+
+        self.stations.append(Station(name, url, self._shared(genre),
+                                     self._shared((country or "").upper())))
+
+    def load(self, path):
+        """Loads the stations in a catalog file. Returns the number of
+           stations that were added.
+        """
+        with open(path) as catalog:
+            return self.read(catalog, os.path.splitext(path)[1])
+
+    def read(self, catalog, ext):
+        """Loads the stations from an open file (e.g. a playlist that has
+           been downloaded). "ext" is the file extension for the type of
+           catalog. Returns the number of stations that were added.
+        """
+        count = len(self.stations)
+        ext = ext.lower()
+
+        if ext in M3U:
+            self._load_m3u(catalog)
+        elif ext in PLS:
+            self._load_pls(catalog)
+        elif ext in JSON:
+            self._load_json(catalog)
+
+        return len(self.stations) - count
+
+    def load_dir(self, path):
+        """Loads all of the catalog files in a folder (in name order)."""
+        if not os.path.isdir(path):
+            return 0
+
+        count = 0
+        for name in sorted(os.listdir(path)):
+            if name.lower().endswith(M3U + PLS + JSON):
+                count += self.load(os.path.join(path, name))
+
+        return count
+
+    def _load_m3u(self, catalog):
+        info = None
+
+        for line in catalog:
+            line = line.strip().decode("utf-8", "ignore")
+
+            if line.startswith("#EXTINF:"):
+                attrs, _, name = line[8:].partition(",")
+                info = dict(EXTINF_ATTR.findall(attrs))
+                info["name"] = name
+
+            elif line and not line.startswith("#"):
+                info = info or {}
+                self.add(info.get("name", ""), line,
+                         info.get("group-title") or info.get("genre"),
+                         info.get("tvg-country") or info.get("country"))
+                info = None
+
+    def _load_pls(self, catalog):
+        # Entries are numbered (File1, Title1 etc.) and can be in any order
+        entries = {}
+
+        for line in catalog:
+            key, _, value = line.strip().decode("utf-8", "ignore") \
+                                .partition("=")
+            match = re.match(r"(File|Title|Genre)(\d+)$", key, re.I)
+            if match:
+                entry = entries.setdefault(int(match.group(2)), {})
+                entry[match.group(1).lower()] = value
+
+        for num in sorted(entries):
+            entry = entries[num]
+            self.add(entry.get("title", ""), entry.get("file", ""),
+                     entry.get("genre"))
+
+    def _load_json(self, catalog):
+        first = catalog.read(1)
+        while first.isspace():
+            first = catalog.read(1)
+
+        if first == "[":
+            items = json.loads(first + catalog.read())
+        else:
+            # JSON lines: one station per line
+            items = self._json_lines(first, catalog)
+
+        for item in items:
+            self.add(item.get("name", ""),
+                     item.get("url_resolved") or item.get("url", ""),
+                     item.get("genre") or item.get("tags"),
+                     item.get("countrycode") or item.get("country"))
+
+    def _json_lines(self, first, catalog):
+        line = first + catalog.readline()
+        while line:
+            if line.strip():
+                yield json.loads(line)
+            line = catalog.readline()
+
+    def groups(self, field):
+        """Returns a dict of group name: list of positions (starting at 1)
+           for the given field ("genre", "country" or "letter").
+        """
+        groups = {}
+
+        for pos, station in enumerate(self.stations, 1):
+            if field == "letter":
+                key = station.name[:1].upper()
+                key = key if key.isalpha() else "#"
+            else:
+                key = getattr(station, field)
+
+            groups.setdefault(key, []).append(pos)
+
+        return groups
+
+    def menu(self, callback, label=None, threshold=GROUP_THRESHOLD):
+        """Returns the menu for the stations (in the format used by the modes'
+           "menu" attribute). Selecting a station calls the callback with its
+           position.
+
+           "label" is an optional function to convert the names for the
+           display.
+        """
+        label = label or (lambda text: text)
+        stations = self.stations
+
+        def items(positions):
+            if len(positions) > threshold:
+                positions = sorted(
+                    positions, key=lambda pos: stations[pos - 1].name.lower())
+
+            return [(label(stations[pos - 1].name),
+                     lambda pos=pos: callback(pos)) for pos in positions]
+
+        if len(self.stations) <= threshold:
+            return items(range(1, len(self.stations) + 1))
+
+        menu = []
+        for title, field in (("Genres", "genre"),
+                             ("Countries", "country"),
+                             ("A-Z", "letter")):
+            groups = self.groups(field)
+
+            # No point grouping if every station is in the same group
+            if len(groups) < 2:
+                continue
+
+            menu.append((title, [(label(name), items(groups[name]))
+                                 for name in sorted(groups)]))
+
+        return menu or items(range(1, len(self.stations) + 1))
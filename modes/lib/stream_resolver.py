@@ -0,0 +1,166 @@
+"""
+Finds the address that a station's stream is actually played from.
+
+Station addresses often redirect to another server or point to a playlist
+(M3U or PLS) containing the stream's address. Following these every time a
+station is played delays the start of the audio. The resolver follows them
+once and remembers the result for RESOLVE_TTL seconds.
+
+Addresses can be resolved in the background (e.g. for the stations either
+side of the one that is playing) so they're ready if the listener moves to
+another station.
+"""
+import logging
+import os
+from Queue import Queue
+from StringIO import StringIO
+from threading import Thread, Lock
+from time import time
+import urllib2
+import urlparse
+
+from .station_catalog import StationCatalog, M3U, PLS
+
+# Time to remember a resolved address (seconds)
+RESOLVE_TTL = 600
+
+# Time to wait for a server to respond (seconds)
+RESOLVE_TIMEOUT = 5
+
+# Number of playlists to follow (in case a playlist points to a playlist)
+MAX_DEPTH = 3
+
+# Most of a playlist we'll read (bytes)
+MAX_PLAYLIST = 65536
+
+# Content types of M3U and PLS playlists. HLS playlists (.m3u8) are left to
+# the player as they list segments of the stream rather than streams.
+PLAYLIST_TYPES = {"audio/x-mpegurl": ".m3u",
+                  "audio/mpegurl": ".m3u",
+                  "audio/x-scpls": ".pls"}
+
+log = logging.getLogger(__name__)
+
+
+class StreamResolver(Thread):
+    """
+    Thread to resolve stream addresses in the background.
+
+    Resolver takes two optional parameters:
+      ttl:     time to remember a resolved address (seconds)
+      timeout: time to wait for a server to respond (seconds)
+    """
+
+    def __init__(self, ttl=RESOLVE_TTL, timeout=RESOLVE_TIMEOUT):
+        super(StreamResolver, self).__init__(name="stream-resolver")
+        self.daemon = True
+
+        self.ttl = ttl
+        self.timeout = timeout
+
+        # Address -> (resolved address, time it expires)
+        self.cache = {}
+        self.lock = Lock()
+
+        # Addresses waiting to be resolved
+        self.queue = Queue()
+        self.pending = set()
+
+        # Number of addresses found in (and missing from) the cache and the
+        # number of times we've had to resolve an address
+        self.hits = 0
+        self.misses = 0
+        self.resolved = 0
+
+    def cached(self, url):
+        """Returns the resolved address if we have it (and it hasn't
+           expired). Otherwise returns None.
+        """
+        with self.lock:
+            entry = self.cache.get(url)
+
+            if entry and entry[1] > time():
+                self.hits += 1
+                return entry[0]
+
+            self.misses += 1
+            return None
+
+    def prefetch(self, urls):
+        """Resolves the addresses in the background (if they aren't already
+           cached).
+        """
+        now = time()
+
+        with self.lock:
+            for url in urls:
+                entry = self.cache.get(url)
+                if url in self.pending or (entry and entry[1] > now):
+                    continue
+
+                self.pending.add(url)
+                self.queue.put(url)
+
+    def resolve(self, url):
+        """Follows redirects and playlists to find the stream's address.
+
+           If the address can't be resolved, the original address is used
+           (the player may still be able to play it).
+        """
+        try:
+            resolved = self._follow(url, MAX_DEPTH)
+        except Exception as err:
+            log.info("Unable to resolve {}: {}".format(url, err))
+            resolved = url
+
+        with self.lock:
+            self.cache[url] = (resolved, time() + self.ttl)
+            self.pending.discard(url)
+            self.resolved += 1
+
+        return resolved
+
+    def _follow(self, url, depth):
+        # urllib2 follows any redirects
+        response = urllib2.urlopen(url, timeout=self.timeout)
+
+        try:
+            final = response.geturl()
+            ctype = response.info().gettype()
+            ext = os.path.splitext(urlparse.urlparse(final).path)[1].lower()
+
+            if ctype in PLAYLIST_TYPES:
+                ext = PLAYLIST_TYPES[ctype]
+            elif ext not in M3U + PLS or ext == ".m3u8":
+                # It's the stream itself (we don't read any of it)
+                return final
+
+            body = response.read(MAX_PLAYLIST)
+
+        finally:
+            response.close()
+
+        # Use the first entry in the playlist
+        playlist = StationCatalog()
+        playlist.read(StringIO(body), ext)
+
+        if not playlist.stations:
+            return final
+
+        stream = urlparse.urljoin(final, playlist.stations[0].url)
+
+        if depth > 1:
+            return self._follow(stream, depth - 1)
+
+        return stream
+
+    def stats(self):
+        with self.lock:
+            return {"cached": len(self.cache),
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "resolved": self.resolved}
+
+    def run(self):
+        while True:
+            self.resolve(self.queue.get())
@@ -3,8 +3,7 @@
 # Mode that uses Squeezelite to play music from Logitech Media Server.
 # Mode will discover server on local network.
 from subprocess import Popen, call
-from threading import Thread
-from time import sleep
+from threading import Thread, Event
 
 from resources.basemode import RadioBaseMode
 from .lib.lms_discovery import LMSDiscovery
@@ -14,11 +13,26 @@ from .lib.simple_pylms import LMSServer, LMSPlayer
 # groups etc)
 PLAYER_MAC = "41:41:41:41:41:41"
 
+# How often to check for a new track (seconds)
+POLL_INTERVAL = 1
+
+# Time after which squeezelite closes the sound card when it isn't playing
+# (seconds). When the mode is parked squeezelite is left running paused and
+# would otherwise keep the card open, stopping other modes from using it.
+IDLE_TIMEOUT = 1
+
 
 class ModeSqueezeplayer(RadioBaseMode):
 
     name = "Squeezeplayer"
 
+    # Squeezelite can be left running (paused) when switching to another mode
+    supports_standby = True
+    standby_cost = 10
+
+    # Each volume change is a request to the server
+    volume_rate = 5
+
     def __init__(self):
         super(ModeSqueezeplayer, self).__init__()
 
@@ -36,6 +50,13 @@ class ModeSqueezeplayer(RadioBaseMode):
         self.connected = False
         self.server = None
         self.ref = PLAYER_MAC
+        self.track_timer = None
+
+        # The requests for the metadata are made on the poller thread (so a
+        # slow or missing server doesn't hold up the scheduler). The timer
+        # sets poll_due when it's time to check again.
+        self.poller = None
+        self.poll_due = Event()
 
     def enter(self):
         # Try to connect to server
@@ -53,6 +74,7 @@ class ModeSqueezeplayer(RadioBaseMode):
                                "-n", "PiRadio",
                                "-a", "16384:4096",
                                "-o", "sysdefault:CARD=ALSA",
+                               "-C", str(IDLE_TIMEOUT),
                                "-m", self.ref])
 
             # Create a player instance so we can send JSON commands
@@ -62,10 +84,8 @@ class ModeSqueezeplayer(RadioBaseMode):
             # Set flag
             self.stopped = False
 
-            # Define and start thread to monitor metadata
-            track_info = Thread(target=self.get_track)
-            track_info.daemon = True
-            track_info.start()
+            # Check the metadata regularly
+            self.start_polling()
 
     def exit(self):
         # Terminate squeezelite ...
@@ -74,9 +94,44 @@ class ModeSqueezeplayer(RadioBaseMode):
         # ... and murder it to be sure it's really dead!
         self.proc.kill()
 
-        # Update flag (to end metadata thread)
+        # Update flag and stop checking metadata
         self.stopped = True
 
+        if self.track_timer:
+            self.track_timer.cancel()
+            self.track_timer = None
+
+    def park(self):
+        # Pause the player but leave squeezelite running. If the server
+        # doesn't answer we can't be sure it's paused so squeezelite is
+        # stopped (and resume starts it again).
+        if self.connected and self.player.request("pause 1") is None:
+            self.exit()
+            self.connected = False
+            return
+
+        # Stop checking metadata
+        self.stopped = True
+
+        if self.track_timer:
+            self.track_timer.cancel()
+            self.track_timer = None
+
+    def resume(self):
+        # If we weren't connected when we were parked, try again
+        if not self.connected or self.proc.poll() is not None:
+            self.enter()
+            return
+
+        # If the server doesn't answer, start again as if we'd been left
+        if self.player.request("pause 0") is None:
+            self.exit()
+            self.enter()
+            return
+
+        self.stopped = False
+        self.start_polling()
+
     def connect(self):
 
         # See if we can find the server on the network
@@ -96,33 +151,78 @@ class ModeSqueezeplayer(RadioBaseMode):
             self.server = None
             return False
 
-    def get_track(self):
-
-        # Loop to check metadata
-        while not self.stopped:
-
-            # Get the title, artists and album of current track
-            try:
-                ttl = self.player.get_track_title()
-                art = self.player.get_track_artist()
-                alb = self.player.get_track_album()
-
-            except (KeyError, TypeError):
-                ttl = art = alb = ""
+    def start_polling(self):
+        """Starts checking the metadata every POLL_INTERVAL seconds."""
+        # The display's metadata was cleared when we were last left so make
+        # sure the first check shows the current track
+        self.current_track = ""
 
-            # Create a single string of all data
-            current = ttl + art + alb
+        if self.poller is None:
+            self.poller = Thread(target=self.poll_track,
+                                 name="squeezeplayer-poll")
+            self.poller.daemon = True
+            self.poller.start()
 
-            # If it's a new track...
-            if current != self.current_track:
+        self.track_timer = self.scheduler.call_every(POLL_INTERVAL,
+                                                     self.get_track,
+                                                     start=0)
 
-                # ... send metadata to display
-                self.show_text("metadata", {"Title": ttl,
-                                            "Artist": art,
-                                            "Album": alb})
+    def get_track(self):
+        """Asks the poller thread to check the metadata. Called regularly by
+           the scheduler.
+
+           If the last check hasn't finished (e.g. the server isn't
+           responding), the next check is made as soon as it has.
+        """
+        if not self.stopped:
+            self.poll_due.set()
+
+    def poll_track(self):
+        """Checks the metadata whenever the timer asks (runs on the poller
+           thread).
+        """
+        while True:
+            self.poll_due.wait()
+            self.poll_due.clear()
+
+            if not self.stopped:
+                self.check_track()
+
+    def check_track(self):
+        """Gets the metadata from the server and shows it if the track has
+           changed.
+        """
+        # Get the title, artists and album of current track
+        try:
+            ttl = self.player.get_track_title()
+            art = self.player.get_track_artist()
+            alb = self.player.get_track_album()
+
+        except (IOError, KeyError, TypeError):
+            ttl = art = alb = ""
+
+        # Create a single string of all data
+        current = ttl + art + alb
+
+        # If it's a new track...
+        if current != self.current_track:
+
+            # ... send metadata to display
+            self.show_text("metadata", {"Title": ttl,
+                                        "Artist": art,
+                                        "Album": alb})
+
+            # Remember the current track
+            self.current_track = current
+
+    def set_volume(self, level):
+        """Sets the volume of the player on the server."""
+        if self.stopped or self.server is None:
+            return False
 
-                # Remember the current track
-                self.current_track = current
+        # The server returns None if the request failed
+        return self.player.request("mixer volume {}".format(level)) \
+            is not None
 
     def show_device_name(self):
         # Show the name of the squeezelite player
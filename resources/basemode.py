@@ -1,7 +1,6 @@
-import unicodedata
-
 import pigpio
 
+from .lcd_charset import charset
 from .menubase import RadioSubmenu, RadioMenuItem, RadioMenuMode
 
 class RadioBaseMode(object):
@@ -9,16 +8,39 @@ class RadioBaseMode(object):
        subclass this.
     """
 
-    def __init__(self, pi=None, led_pin=None, display_q=None):
-        """Constructor takes 3 optional parameters:
+    # Name of the glyph to show next to the mode name on the display (see
+    # resources/glyphs.py) or None for no icon
+    icon = None
+
+    # Modes whose player has its own volume control should set this to the
+    # maximum number of volume changes per second that the player can handle
+    # and override set_volume
+    volume_rate = None
+
+    # Modes that can be kept running in the background (see park and resume)
+    # should set supports_standby to True. The standby cost is roughly the
+    # memory (in MB) used by the mode while it is parked.
+    supports_standby = False
+    standby_cost = 0
+
+    def __init__(self, pi=None, led_pin=None, display_q=None,
+                 scheduler=None):
+        """Constructor takes 4 optional parameters:
 
              pi:        pigpio pi instance (e.g. if you need GPIO access)
              led_pin:   GPIO pin number of LED (to indicate mode active)
-             display_q: Queue instance for displaying text on display
+             display_q: DisplayQueue instance for displaying text on display
+             scheduler: Scheduler instance for timers (e.g. to poll for
+                        metadata) rather than starting threads
         """
         self.pi = pi
         self.led_pin = led_pin
         self.display_q = display_q
+        self.scheduler = scheduler
+
+        # The last value of each metadata field sent to the display and the
+        # converted text (so we only convert fields that have changed)
+        self.display_fields = {}
 
         # Prepare LED
         if self.pi and self.led_pin:
@@ -46,6 +68,21 @@ class RadioBaseMode(object):
         """
         pass
 
+    def park(self):
+        """Called instead of exit (if the mode supports standby) when the
+           radio switches to another mode. The mode should stop playing but
+           can leave its processes running so it can be resumed quickly.
+
+           A parked mode may still be left later (exit is then called).
+        """
+        pass
+
+    def resume(self):
+        """Called instead of enter when the radio switches back to a parked
+           mode. The mode should start playing again.
+        """
+        pass
+
     def _walk_menu(self, menu, parent):
         """Recursive method for building menu."""
 
@@ -85,6 +122,15 @@ class RadioBaseMode(object):
         """
         pass
 
+    def set_volume(self, level):
+        """Sets the volume (0-100) of the mode's player.
+
+           Modes with a player that has its own volume control can override
+           this. Returns True if the volume was set or False if the volume
+           should be set at the sink instead.
+        """
+        return False
+
     def toggle_led(self, state):
         """Modes may have access to a dedicated LED to indicate activity
            (e.g. successful Bluetooth connection).
@@ -105,26 +151,29 @@ class RadioBaseMode(object):
     def remove_accents(self, data):
         """Method to tidy up strings for the display.
 
-           The LCD can't handle accented characters so we need to make sure all
-           text is ASCII.
-
-           However, rather than removing accents, the code tries to replace the
-           letter with the non-accented version wherever possible. Removal of
-           characters is a last resort.
+           The LCD can only show the characters in its character ROM. Any
+           accented characters in the ROM are kept. Otherwise the code tries
+           to replace the letter with the non-accented version wherever
+           possible. Removal of characters is a last resort.
         """
         # Metadata is provided in a dict, so make sure each entry is compatible
         # with our display
         if type(data) == dict:
-            return {key: self.remove_accents(data[key]) for key in data}
+            return {key: self.convert_field(key, data[key]) for key in data}
 
         else:
-            if type(data) == str:
-                data = unicode(data)
+            return charset.translate(data)
+
+    def convert_field(self, key, value):
+        """Converts a metadata field for the display, reusing the last result
+           if the field hasn't changed.
+        """
+        last = self.display_fields.get(key)
 
-            # Remove accents from letters
-            nfkd_form = unicodedata.normalize('NFKD', data)
+        if last is not None and last[0] == value:
+            return last[1]
 
-            # Remove accented letters (where not normalised above)
-            only_ascii = nfkd_form.encode('ASCII', 'ignore')
+        text = charset.translate(value)
+        self.display_fields[key] = (value, text)
 
-            return only_ascii
+        return text
@@ -1,10 +1,27 @@
 import Queue
-from subprocess import call
-from time import sleep, time
+from time import time
 from threading import Thread
-import unicodedata
 
-import Adafruit_CharLCD as LCD
+# The Adafruit library is only needed if we're using it to drive the display
+try:
+    import Adafruit_CharLCD as LCD
+except ImportError:
+    LCD = None
+
+from .display_queue import DisplayQueue
+from .glyphs import GlyphCache, CGRAM_SLOTS
+from .lcd_pigpio import PigpioCharLCD
+from .lcd_virtual import VirtualCharLCD, TerminalCharLCD
+from .marquee import Marquee
+from .templates import DisplayTemplate
+from .tracing import tracer
+
+# Available drivers for the LCD. The memory and terminal drivers don't need a
+# display to be connected.
+LCD_ADAFRUIT = "adafruit"
+LCD_PIGPIO = "pigpio"
+LCD_MEMORY = "memory"
+LCD_TERMINAL = "terminal"
 
 # Define modes for the display (which determines template to be displayed)
 DISPLAY_CONTROLS = "controls"
@@ -13,12 +30,33 @@ DISPLAY_NOWPLAYING = "playing"
 # How long to wait before reverting to "now playing" display
 DISPLAY_TIMEOUT = 5
 
+# When writing changes to the LCD, unchanged gaps of up to this many characters
+# are rewritten rather than moving the cursor (a cursor move costs one byte)
+MERGE_GAP = 1
+
 # Define our display (e.g. 20x4)
-# NB If you use a different size display you will need to redefine the display
-# templates
+# NB The templates adapt to the width of the display but you may want to
+# redefine them if your display has a different number of rows
 DISPLAY_COLS = 20
 DISPLAY_ROWS = 4
 
+# Widths of fields that don't define their own width in the templates
+FIELD_WIDTHS = {"time": 5, "modeicon": 1, "volicon": 1}
+
+# Fields which show a custom character. The value sent to the display is the
+# name of the glyph (or None for no icon).
+ICON_FIELDS = ["modeicon", "volicon"]
+
+# Number of steps in each character of the volume bar (one per column of
+# pixels)
+VOLUME_STEPS = 5
+
+# Fields on the "now playing" display which scroll if they are too long
+SCROLL_FIELDS = ["title", "artist", "album"]
+
+# How often to move scrolling text on by one character (seconds)
+SCROLL_INTERVAL = 0.4
+
 
 class RadioDisplay(Thread):
     """Class to handle the display of information on the state of the
@@ -33,19 +71,23 @@ class RadioDisplay(Thread):
        It must therefore be run by calling the "start" method.
     """
 
-    def __init__(self, rs, en, d4, d5, d6, d7, backlight=None, debug=False):
+    def __init__(self, rs, en, d4, d5, d6, d7, backlight=None, debug=False,
+                 cols=DISPLAY_COLS, rows=DISPLAY_ROWS, driver=LCD_ADAFRUIT,
+                 pi=None):
 
         # Initialise the Thread
-        super(RadioDisplay, self).__init__()
+        super(RadioDisplay, self).__init__(name="display")
 
-        # Define a queue where requests for updates can be placed
-        self.queue = Queue.Queue()
+        # Define a queue where requests for updates can be placed. Pending
+        # updates for the same key are merged so we only show the latest one.
+        self.queue = DisplayQueue()
 
         # Debug mode can be used to test display without a display connected
         self.debug = debug
 
-        # Create an empty list to hold the lines of text
-        self.lines = ["" for _ in range(DISPLAY_ROWS)]
+        # Size of the display
+        self.cols = cols
+        self.rows = rows
 
         # This thread should be daemonised
         self.daemon = True
@@ -54,56 +96,198 @@ class RadioDisplay(Thread):
         self.displaymode = DISPLAY_CONTROLS
 
         # Define which items won't force the menu to change to the menu mode
-        self.ignore = ["time", "menuinfo2"]
+        self.ignore = ["time", "menuinfo2", "modeicon", "volicon"]
 
-        # Define the templates for the modes
+        # Define the templates for the modes ("*" means use the rest of the
+        # line). The mode's icon takes the place of the space before the time
+        # so the mode name has the same width whether or not there's an icon.
         self.templates = {"controls":
-                             ["{mode:^14.14} {time}",
-                              "{menuinfo:^20.20}",
-                              "{menuinfo2:^20.20}",
-                              "Vol:  -|{vol}|+"],
+                             ["{mode:^*}{modeicon}{time}",
+                              "{menuinfo:^*}",
+                              "{menuinfo2:^*}",
+                              "Vol: {volicon}-|{vol:<*}|+"],
                          "playing":
-                             ["{mode:^14.14} {time}",
-                              "{title:^20.20}",
-                              "{artist:^20.20}",
-                              "{album:^20.20}"]
+                             ["{mode:^*}{modeicon}{time}",
+                              "{title:^*}",
+                              "{artist:^*}",
+                              "{album:^*}"]
                          }
 
-        # Create a single string of the current template
-        # self.text = "\n".join(self.templates[self.displaymode])
+        # Compile the templates for the size of our display
+        self.compiled = {mode: DisplayTemplate(lines, self.cols, self.rows,
+                                               FIELD_WIDTHS)
+                         for mode, lines in self.templates.iteritems()}
+
+        # Debug mode shows the display on the terminal
+        if self.debug:
+            driver = LCD_TERMINAL
+
+        # Create an instance of the display. The pigpio driver needs a pigpio
+        # instance to be passed as "pi".
+        if driver == LCD_MEMORY:
+            self.lcd = VirtualCharLCD(self.cols, self.rows)
+
+        elif driver == LCD_TERMINAL:
+            self.lcd = TerminalCharLCD(self.cols, self.rows)
+
+        elif driver == LCD_PIGPIO:
+            self.lcd = PigpioCharLCD(pi, rs, en, d4, d5, d6, d7,
+                                     self.cols, self.rows,
+                                     backlight=backlight)
 
-        # Create an instance of the display
-        self.lcd = LCD.Adafruit_CharLCD(rs, en, d4, d5, d6, d7,
-                                        DISPLAY_COLS, DISPLAY_ROWS,
-                                        backlight=backlight,
-                                        invert_polarity=False)
+        elif LCD is None:
+            raise ImportError("Adafruit_CharLCD is needed for this display "
+                              "driver")
+
+        else:
+            self.lcd = LCD.Adafruit_CharLCD(rs, en, d4, d5, d6, d7,
+                                            self.cols, self.rows,
+                                            backlight=backlight,
+                                            invert_polarity=False)
+
+        # Custom characters are uploaded to the display when they're needed
+        self.glyphs = GlyphCache(self.lcd, on_evict=self.glyph_evicted)
+
+        # Names of the glyphs shown by the icon fields and any glyphs which
+        # have been removed from the display and need to be redrawn
+        self.icons = {key: None for key in ICON_FIELDS}
+        self.evicted = set()
+
+        # Current volume level (the volume bar is drawn from this)
+        self.volume = 0
 
         # Define a dict of parameters that will be used to format the text
         # to be displayed on the LCD
         self.params = {"mode": "PiRadio",
+                       "modeicon": " ",
                        "menuinfo": "Starting up",
                        "menuinfo2": "",
                        "vol": "",
+                       "volicon": " ",
                        "time": "00:00",
                        "title": "",
                        "artist": "",
                        "album": ""}
 
         # Create a list of formatted text for display
-        self.newtxt = [line.format(**self.params)
-                       for line in self.templates[self.displaymode]]
+        self.newtxt = self.compiled[self.displaymode].render(self.params)
+
+        # Scrolling text for the fields on the now playing display
+        self.marquees = {}
 
         # Define a list to hold old menu (to compare which lines have been
         # updated)
-        self.dirty = ["XX" for _ in range(4)]
+        self.dirty = ["XX" for _ in range(self.rows)]
+
+        # Shadow copy of the characters on the LCD so we only need to send
+        # the characters that have changed. None means "unknown".
+        self.framebuffer = [[None] * self.cols for _ in range(self.rows)]
+
+        # Counters used to measure how busy the display thread is
+        self.started = time()
+        self.wakeups = 0
+        self.renders = 0
+        self.lcd_bytes = 0
+        self.frames = 0
+        self.frame_time = 0
 
     def parse_metadata(self, meta):
         """Method to update the dictionary of parameters with the metadata
            received from the radio.
+
+           Returns a list of the parameters that have changed.
         """
-        self.params["title"] = meta.get("Title", "")
-        self.params["artist"] = meta.get("Artist", "")
-        self.params["album"] = meta.get("Album", "")
+        new = {"title": meta.get("Title", ""),
+               "artist": meta.get("Artist", ""),
+               "album": meta.get("Album", "")}
+
+        changed = [key for key in new if self.params[key] != new[key]]
+        self.params.update(new)
+
+        return changed
+
+    def set_param(self, key, value):
+        """Method to update a parameter with a value received from the
+           radio.
+
+           Volume levels and icon names are converted into the characters to
+           display. Returns True if the parameter has changed.
+        """
+        if key == "vol":
+            self.volume = value
+            value = self.volume_bar(value)
+
+        elif key in ICON_FIELDS:
+            self.icons[key] = value
+            value = self.icon(value)
+
+        if self.params.get(key) == value:
+            return False
+
+        self.params[key] = value
+        return True
+
+    def icon(self, name):
+        """Returns the character for an icon (or a space if there's no
+           icon).
+        """
+        if name is None:
+            return " "
+
+        return self.glyphs.char(name)
+
+    def volume_bar(self, level):
+        """Returns a string showing the volume level as a bar.
+
+           Each character of the bar is split into columns so the bar can show
+           small changes in volume.
+        """
+        width = self.compiled[DISPLAY_CONTROLS].widths.get("vol", 10)
+
+        # Number of columns to fill
+        filled = int(round(level * width * VOLUME_STEPS / 100.0))
+        full, part = divmod(min(filled, width * VOLUME_STEPS), VOLUME_STEPS)
+
+        bar = chr(255) * full
+        if part:
+            bar += self.glyphs.char("bar{}".format(part))
+
+        return "{bar:-<{width}}".format(bar=bar, width=width)
+
+    def glyph_evicted(self, name):
+        """Callback for when a custom character has been replaced on the
+           display.
+        """
+        self.evicted.add(name)
+
+    def refresh_glyphs(self):
+        """Redraws any fields that were showing a custom character that has
+           since been replaced. Returns a list of the fields that have changed.
+
+           If more glyphs are in use than there are slots on the display then
+           redrawing a field will replace another glyph so we give up after
+           one attempt per slot.
+        """
+        changed = []
+
+        for _ in range(CGRAM_SLOTS):
+            if not self.evicted:
+                break
+
+            evicted = self.evicted
+            self.evicted = set()
+
+            for key, name in self.icons.iteritems():
+                if name in evicted and self.set_param(key, name):
+                    changed.append(key)
+
+            if any(name.startswith("bar") for name in evicted):
+                if self.set_param("vol", self.volume):
+                    changed.append("vol")
+
+        self.evicted = set()
+
+        return changed
 
     def clear_metadata(self):
         """Method to remove the current metadata (e.g. when changing modes)."""
@@ -111,78 +295,217 @@ class RadioDisplay(Thread):
         self.params["artist"] = ""
         self.params["album"] = ""
 
+        self.marquees = {}
+
         # We should refresh the display after doing this to make sure change
         # is instant
-        self.update()
+        self.update(["title", "artist", "album"])
+
+    def set_marquees(self, keys):
+        """Prepares the scrolling text for any of the given fields that are
+           too long to fit on the now playing display.
+        """
+        widths = self.compiled[DISPLAY_NOWPLAYING].widths
+
+        for key in keys:
+            if key not in SCROLL_FIELDS:
+                continue
+
+            marquee = Marquee(self.params[key], widths.get(key, self.cols))
+
+            if marquee.scrolling:
+                self.marquees[key] = marquee
+            else:
+                self.marquees.pop(key, None)
+
+    def scroll(self):
+        """Moves the scrolling text on by one frame and updates the lines that
+           have changed.
+        """
+        start = time()
+
+        changed = [key for key, marquee in self.marquees.iteritems()
+                   if marquee.advance()]
+
+        if changed:
+            self.update(changed)
+
+        self.frames += 1
+        self.frame_time += time() - start
 
     def run(self):
         """Method to start the display functions.
 
-           The thread will continue to monitor the queue and update the display
-           for any new information received.
+           The thread blocks on the queue until there is either a new message
+           or it is time to revert to the "now playing" display, so an idle
+           display does not wake up at all. The screen is only redrawn when
+           something has actually changed.
         """
 
-        # How long to wait until changing to now playing mode
+        # Time at which we change to now playing mode (None when there's no
+        # change pending)
         change = time() + DISPLAY_TIMEOUT
 
+        # Time at which to show the next frame of scrolling text
+        next_frame = None
+
         # Start our loop
         while True:
+
+            # Work out how long we can sleep for
+            deadlines = [d for d in (change, next_frame) if d is not None]
+            if deadlines:
+                timeout = max(0, min(deadlines) - time())
+            else:
+                timeout = None
+
+            # Parameters that have changed and whether the whole screen needs
+            # to be redrawn (e.g. the display mode has changed)
+            changed = set()
+            redraw = False
+
+            # Traces of the input events that led to this update
+            traces = []
+
             try:
 
-                # See if there's anything in the queue
-                key, text = self.queue.get_nowait()
+                # Wait for the next updates in the queue (or our deadline)
+                batch = self.queue.get_batch(True, timeout)
+                self.wakeups += 1
+
+                traces = self.queue.batch_traces
+                for trace in traces:
+                    trace.mark("dequeued")
 
-                # Metadata needs to be handled separately
-                if key == "metadata":
-                    self.parse_metadata(text)
+                for key, text in batch:
 
-                # Anything else can be added straight to the dictionary
-                else:
-                    self.params[key] = text
+                    # Metadata needs to be handled separately
+                    if key == "metadata":
+                        keys = self.parse_metadata(text)
+                        changed.update(keys)
 
-                    # Check whether we need to change the display mode
-                    if not key in self.ignore:
-                        self.displaymode = DISPLAY_CONTROLS
-                        change = time() + DISPLAY_TIMEOUT
+                        # Prepare scrolling text and start from the beginning
+                        if keys:
+                            self.set_marquees(keys)
+                            next_frame = None
 
-            # If there's nothing in the queue...
+                    # Anything else can be added straight to the dictionary
+                    else:
+                        if self.set_param(key, text):
+                            changed.add(key)
+
+                        # Check whether we need to change the display mode
+                        if not key in self.ignore:
+                            if self.displaymode != DISPLAY_CONTROLS:
+                                self.displaymode = DISPLAY_CONTROLS
+                                redraw = True
+                            change = time() + DISPLAY_TIMEOUT
+
+            # We've reached our deadline
             except Queue.Empty:
+                self.wakeups += 1
 
-                # Small sleep (so don't hog CPU)
-                sleep(0.1)
+            # Redraw anything using a custom character that has been replaced
+            if self.evicted:
+                changed.update(self.refresh_glyphs())
 
-                # If we're already in now playing then we can go back to start
-                # of the loop as there's nothing to update
-                if self.displaymode == DISPLAY_NOWPLAYING:
-                    continue
+            now = time()
 
             # Do we need to change to now playing mode?
-            if self.displaymode == DISPLAY_CONTROLS and time() > change:
+            if change is not None and now >= change:
                 self.displaymode = DISPLAY_NOWPLAYING
+                change = None
+                redraw = True
+
+                # Show the start of any scrolling text
+                for marquee in self.marquees.itervalues():
+                    marquee.reset()
+
+            # Scrolling text is only shown on the now playing display
+            if self.displaymode != DISPLAY_NOWPLAYING or not self.marquees:
+                next_frame = None
+
+            elif next_frame is None:
+                next_frame = now + SCROLL_INTERVAL
+
+            elif now >= next_frame:
+                self.scroll()
+                next_frame = max(next_frame + SCROLL_INTERVAL, now)
+
+            # Update the display, but only if something has changed
+            if redraw:
+                self.update()
+            elif changed:
+                self.update(changed)
+
+            for trace in traces:
+                tracer.finish(trace)
+
+    def stats(self):
+        """Returns a dict of display statistics.
+
+           "wakeups_per_sec" is the number of times the display thread has woken
+           up per second since it was started and "renders" is the number of
+           times the screen has been redrawn. "coalesced" is the number of
+           queued updates that were replaced by a newer value before they
+           were displayed. "lcd_bytes" is the number of bytes (commands and
+           characters) that have been sent to the LCD. "frames" is the number
+           of frames of scrolling text shown and "frame_cost_us" is the
+           average time taken to show each one.
+        """
+        elapsed = max(time() - self.started, 1e-6)
+        return {"wakeups": self.wakeups,
+                "wakeups_per_sec": self.wakeups / elapsed,
+                "renders": self.renders,
+                "received": self.queue.received,
+                "coalesced": self.queue.coalesced,
+                "lcd_bytes": self.lcd_bytes,
+                "frames": self.frames,
+                "frame_cost_us": self.frame_time / max(self.frames, 1) * 1e6}
+
+    def update(self, keys=None):
+        """Method to update LCD display with text.
+
+           If a list of parameter names is passed as "keys" then only the
+           lines that use those parameters are rendered. Otherwise the whole
+           screen is rendered.
+        """
+
+        self.renders += 1
 
-            # Update the display
-            self.update()
+        template = self.compiled[self.displaymode]
 
-    def update(self):
-        """Method to update LCD display with text."""
+        # Work out which lines need to be rendered
+        if keys is None:
+            lines = range(self.rows)
+        else:
+            lines = template.lines_for(keys)
+
+        # Show the current frame of any scrolling text
+        params = self.params
+        if self.displaymode == DISPLAY_NOWPLAYING and self.marquees:
+            params = dict(params)
+            for key, marquee in self.marquees.iteritems():
+                params[key] = marquee.current
 
         # Build the list of lines
-        self.newtxt = [line.format(**self.params)
-                       for line in self.templates[self.displaymode]]
+        newtxt = list(self.newtxt)
+        renderers = template.renderers
+        for i in lines:
+            newtxt[i] = renderers[i](**params)
+        self.newtxt = newtxt
 
         # and display it
         self.display()
 
     def display(self):
-        """Method to display text. Can output to screen if in debug mode."""
+        """Method to display text."""
+        self.display_lcd()
 
-        # Text display if deibugging...
-        if self.debug:
-            self.text_display()
-
-        # ...otherwise update the LCD
-        else:
-            self.display_lcd()
+        # Virtual displays keep a record of each frame that is shown
+        flush = getattr(self.lcd, "flush", None)
+        if flush is not None:
+            flush()
 
     def display_lcd(self):
         """Method to update the LCD. The method check which lines have changed
@@ -201,29 +524,62 @@ class RadioDisplay(Thread):
         # Update the reference with the new text
         self.dirty = self.newtxt
 
-    def text_display(self):
-        """Simple method to create a virtual LCD display on the terminal."""
+    def write_line(self, line, text):
+        """Method to write lines on the LCD.
 
-        # Clear the screen so display is "refreshed"
-        call(["clear"])
+           The line is compared with the framebuffer and only the runs of
+           characters that have changed are sent to the display.
+        """
+        # Make sure the text fills the line exactly
+        text = text[:self.cols].ljust(self.cols)
 
-        # Print each line
-        for line in self.lines:
-            print "{line:_^{rows}}".format(rows=self.rowlength, line=line)
+        shadow = self.framebuffer[line]
 
-    def write_line(self, line, text):
-        """Method to write lines on the LCD."""
+        for start, run in self.changed_runs(shadow, text):
+
+            # Move the cursor to the start of the changed characters
+            self.lcd.set_cursor(start, line)
+            self.lcd_bytes += 1
+
+            # Send the characters to the display
+            self.lcd.message(run)
+            self.lcd_bytes += len(run)
+
+            # Remember what is now on the display
+            shadow[start:start + len(run)] = list(run)
 
-        # Move the cursor to the start of the relevant line
-        self.lcd.set_cursor(0, line)
+    def changed_runs(self, old, new):
+        """Returns a list of (column, text) tuples for the parts of the line
+           that differ between "old" and "new".
 
-        # Loop over the line and send each character to the display
-        for char in text:
-            self.lcd.write8(ord(char), True)
+           Runs separated by short unchanged gaps are merged as it is cheaper to
+           rewrite a character than to move the cursor past it.
+        """
+        runs = []
+        start = end = None
+
+        for i, char in enumerate(new):
+            if old[i] != char:
+                if start is None:
+                    start = i
+                elif i - end > MERGE_GAP:
+                    runs.append((start, new[start:end]))
+                    start = i
+                end = i + 1
+
+        if start is not None:
+            runs.append((start, new[start:end]))
+
+        return runs
 
     def clear(self):
         """Clears the LCD display."""
         self.lcd.clear()
+        self.lcd_bytes += 1
+
+        # The display is now blank
+        self.framebuffer = [[" "] * self.cols for _ in range(self.rows)]
+        self.dirty = [" " * self.cols for _ in range(self.rows)]
 
     def set_backlight(self, state):
         """Method to turn the LCD backlight on or off."""
@@ -0,0 +1,106 @@
+"""Coalescing queue for sending updates to the display."""
+from collections import OrderedDict
+import Queue
+from threading import Condition
+from time import time
+
+from .tracing import tracer
+
+
+class DisplayQueue(object):
+    """Mailbox for display updates.
+
+       Items are put on the queue as (key, value) tuples in the same way as a
+       normal Queue instance. However, the display is only interested in the
+       latest value for each key so, if a key is already waiting to be
+       displayed, the pending value is replaced rather than queuing another
+       update. The number of updates that have been replaced in this way is
+       stored in the "coalesced" attribute.
+
+       The display reads all pending updates in one go by calling "get_batch".
+    """
+
+    def __init__(self):
+        self.pending = OrderedDict()
+        self.cond = Condition()
+
+        # Traces of the input events that led to the pending updates and of
+        # those in the last batch
+        self.traces = []
+        self.batch_traces = []
+
+        # Counters to show how effective the coalescing is
+        self.received = 0
+        self.coalesced = 0
+
+    def put(self, item, block=True, timeout=None):
+        """Add a (key, value) tuple to the queue.
+
+           The "block" and "timeout" parameters are accepted for compatibility
+           with Queue.Queue but are ignored as the queue is never full.
+        """
+        key, value = item
+
+        trace = tracer.current()
+
+        with self.cond:
+
+            # An event may lead to several updates but we only need to record
+            # the first one
+            if trace is not None and trace not in self.traces:
+                trace.mark("queued")
+                self.traces.append(trace)
+
+            self.received += 1
+
+            # Replace the pending value (but keep the key's original position
+            # so updates are applied in the order they were first requested)
+            if key in self.pending:
+                self.coalesced += 1
+
+            self.pending[key] = value
+            self.cond.notify()
+
+    def get_batch(self, block=True, timeout=None):
+        """Returns a list of all pending (key, value) tuples.
+
+           If there is nothing waiting then the method waits for an update,
+           unless "block" is False, for up to "timeout" seconds (or forever if
+           timeout is None). Queue.Empty is raised if there is still nothing to
+           return.
+
+           Any traces of the input events that led to the updates in the batch
+           are available in the "batch_traces" attribute.
+        """
+        with self.cond:
+            if block:
+                if timeout is None:
+                    while not self.pending:
+                        self.cond.wait()
+                else:
+                    end = time() + timeout
+                    while not self.pending:
+                        remaining = end - time()
+                        if remaining <= 0:
+                            break
+                        self.cond.wait(remaining)
+
+            if not self.pending:
+                raise Queue.Empty
+
+            batch = self.pending.items()
+            self.pending = OrderedDict()
+
+            self.batch_traces = self.traces
+            self.traces = []
+
+        return batch
+
+    def qsize(self):
+        """Returns the number of keys waiting to be displayed."""
+        with self.cond:
+            return len(self.pending)
+
+    def empty(self):
+        """Returns True if there are no updates waiting."""
+        return self.qsize() == 0
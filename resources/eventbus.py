@@ -0,0 +1,152 @@
+"""Event bus for input events.
+
+The pigpio callbacks for the encoders run on pigpio's own thread. If the
+handlers were called on that thread, a slow handler (e.g. selecting a mode,
+which starts the mode's player) would hold up all the following edges.
+
+Instead, the encoders post events to a bus and return straight away. The bus
+has its own thread which calls the handlers in the order the events were
+received. Rotations are merged while they are waiting so, if a handler is
+slow, the next handler call makes up all of the steps in one go.
+"""
+from collections import deque
+import logging
+from threading import Thread, Condition
+from time import time
+
+from .tracing import tracer
+
+
+# Number of handler durations to keep for each type of event
+SAMPLES = 1000
+
+log = logging.getLogger(__name__)
+
+
+class InputEvent(object):
+    """A single event waiting to be handled."""
+
+    __slots__ = ("kind", "handler", "value", "merge", "trace")
+
+    def __init__(self, kind, handler, value, merge, trace):
+        self.kind = kind
+        self.handler = handler
+        self.value = value
+        self.merge = merge
+        self.trace = trace
+
+
+class EventBus(Thread):
+    """Thread which calls the handlers for input events.
+
+       Bus takes one optional parameter:
+         name: name of the thread
+    """
+
+    def __init__(self, name="events"):
+        super(EventBus, self).__init__(name=name)
+        self.daemon = True
+
+        self.events = deque()
+        self.cond = Condition()
+
+        # Number of events posted, merged and handled and the most events that
+        # have been waiting at once
+        self.received = 0
+        self.merged = 0
+        self.handled = 0
+        self.max_depth = 0
+
+        # Time taken by the handlers (seconds) for each type of event
+        self.durations = {}
+
+    def post(self, kind, handler, value, merge=False):
+        """Adds an event to the bus. Returns immediately.
+
+           kind:    type of event e.g. "selector.rotate"
+           handler: function to call with the value
+           value:   value to pass to the handler
+           merge:   if True, and the last waiting event is for the same
+                    handler, the values are added together instead of adding
+                    a new event (for rotations)
+        """
+        trace = tracer.current()
+
+        with self.cond:
+            self.received += 1
+
+            last = self.events[-1] if self.events else None
+
+            if (merge and last is not None and last.merge and
+                    last.handler == handler):
+                # The trace of the first event is kept so the latency covers
+                # the whole wait
+                last.value += value
+                self.merged += 1
+
+            else:
+                if trace is not None:
+                    trace.mark("posted")
+
+                self.events.append(InputEvent(kind, handler, value, merge,
+                                              trace))
+                self.max_depth = max(self.max_depth, len(self.events))
+                self.cond.notify()
+
+    def depth(self):
+        """Returns the number of events waiting."""
+        with self.cond:
+            return len(self.events)
+
+    def stats(self):
+        """Returns a dict of counters and the handler durations (in
+           milliseconds) for each type of event.
+        """
+        with self.cond:
+            stats = {"received": self.received,
+                     "merged": self.merged,
+                     "handled": self.handled,
+                     "depth": len(self.events),
+                     "max_depth": self.max_depth}
+
+            durations = {kind: sorted(values)
+                         for kind, values in self.durations.iteritems()}
+
+        handlers = {}
+        for kind, values in durations.iteritems():
+            handlers[kind] = {
+                "count": len(values),
+                "p50": values[len(values) // 2] * 1000,
+                "max": values[-1] * 1000}
+
+        stats["handlers"] = handlers
+
+        return stats
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.events:
+                    self.cond.wait()
+                event = self.events.popleft()
+
+            if event.trace is not None:
+                event.trace.mark("dispatched")
+
+            start = time()
+
+            tracer.resume(event.trace)
+            try:
+                event.handler(event.value)
+            except Exception:
+                log.exception("Error handling {}".format(event.kind))
+            finally:
+                tracer.end()
+
+            duration = time() - start
+
+            with self.cond:
+                self.handled += 1
+                if event.kind not in self.durations:
+                    self.durations[event.kind] = deque(maxlen=SAMPLES)
+                self.durations[event.kind].append(duration)
@@ -0,0 +1,111 @@
+"""Recognises gestures (clicks, long presses etc.) on the encoder buttons.
+
+The recogniser works on the pigpio ticks of the button edges so it never
+needs to sleep. Long presses and repeats happen when the button is held and
+there are no edges, so the recogniser asks for a pigpio watchdog which sends
+a timeout "edge" (level pigpio.TIMEOUT) if nothing happens in time.
+
+Contact bounce should be removed before the edges reach the recogniser (e.g.
+with pigpio's glitch filter) as a missed release would look like a long press.
+
+The gestures are:
+
+    press:   button has been pressed
+    release: button has been released
+    click:   button was released before a long press
+    double:  a second click within DOUBLE_TIME of the first (the click is
+             also reported so quick presses aren't lost)
+    long:    button has been held for LONG_TIME
+    repeat:  button is still held (every REPEAT_TIME after a long press)
+"""
+import pigpio
+
+
+PRESS = "press"
+RELEASE = "release"
+CLICK = "click"
+DOUBLE = "double"
+LONG = "long"
+REPEAT = "repeat"
+
+# Times in milliseconds
+DOUBLE_TIME = 400
+LONG_TIME = 800
+REPEAT_TIME = 250
+
+
+class GestureRecognizer(object):
+    """Class to turn button edges into gestures.
+
+       Recogniser takes the following parameters:
+         callback: function called with the gesture and the tick
+         watchdog: (optional) function called with the number of ms to wait
+                   for the next edge (0 to cancel) e.g. pi.set_watchdog
+         pressed:  (optional) level of the GPIO when the button is pressed
+                   (default 0 as the buttons are pulled up)
+    """
+
+    def __init__(self, callback, watchdog=None, pressed=0):
+        self.callback = callback
+        self.watchdog = watchdog
+        self.pressed = pressed
+
+        # Whether the button is down, whether it has been held long enough
+        # for a long press and the tick of the last click
+        self.down = False
+        self.held = False
+        self.click_tick = None
+
+    def _wait(self, ms):
+        if self.watchdog is not None:
+            self.watchdog(ms)
+
+    def edge(self, level, tick):
+        """Handles an edge (or watchdog timeout) from pigpio."""
+        if level == pigpio.TIMEOUT:
+            self.timeout(tick)
+            return
+
+        down = level == self.pressed
+        if down == self.down:
+            return
+
+        self.down = down
+
+        if down:
+            self.held = False
+            self._wait(LONG_TIME)
+            self.callback(PRESS, tick)
+
+        else:
+            self._wait(0)
+            self.callback(RELEASE, tick)
+
+            # Held buttons don't count as clicks
+            if self.held:
+                self.click_tick = None
+                return
+
+            self.callback(CLICK, tick)
+
+            if (self.click_tick is not None and
+                    pigpio.tickDiff(self.click_tick, tick) <=
+                    DOUBLE_TIME * 1000):
+                self.click_tick = None
+                self.callback(DOUBLE, tick)
+            else:
+                self.click_tick = tick
+
+    def timeout(self, tick):
+        """Handles the watchdog timeout while the button is held."""
+        if not self.down:
+            self._wait(0)
+            return
+
+        if not self.held:
+            self.held = True
+            self._wait(REPEAT_TIME)
+            self.callback(LONG, tick)
+
+        else:
+            self.callback(REPEAT, tick)
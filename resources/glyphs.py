@@ -0,0 +1,81 @@
+"""Custom characters for the LCD.
+
+The HD44780 has space for 8 user defined characters (CGRAM). The GlyphCache
+uploads glyphs the first time they are needed and, if all the slots are in
+use, replaces the glyph that was used least recently.
+"""
+from collections import OrderedDict
+
+
+# Number of custom characters the display can hold
+CGRAM_SLOTS = 8
+
+# Glyph patterns (5x8 pixels, one integer per row)
+GLYPHS = {
+    # Partially filled blocks for the volume bar (1-4 columns filled)
+    "bar1": [0x10] * 8,
+    "bar2": [0x18] * 8,
+    "bar3": [0x1C] * 8,
+    "bar4": [0x1E] * 8,
+
+    "mute": [0x01, 0x13, 0x1F, 0x1F, 0x1F, 0x13, 0x01, 0x00],
+    "play": [0x10, 0x18, 0x1C, 0x1E, 0x1C, 0x18, 0x10, 0x00],
+    "pause": [0x1B, 0x1B, 0x1B, 0x1B, 0x1B, 0x1B, 0x1B, 0x00],
+    "bluetooth": [0x06, 0x15, 0x0E, 0x04, 0x0E, 0x15, 0x06, 0x00],
+    "airplay": [0x1F, 0x11, 0x11, 0x1B, 0x04, 0x0E, 0x1F, 0x00]
+}
+
+
+class GlyphCache(object):
+    """Class to manage the custom characters on the display.
+
+       Calling "char" with the name of a glyph returns the character to use for
+       that glyph, uploading it to the display first if needed.
+
+       If a glyph has to be removed to make space for a new one, the "on_evict"
+       callback is called with the name of the glyph that has been removed as
+       any text using that character will now show the new glyph.
+    """
+
+    def __init__(self, lcd, glyphs=GLYPHS, slots=CGRAM_SLOTS, on_evict=None):
+        self.lcd = lcd
+        self.glyphs = glyphs
+        self.on_evict = on_evict
+
+        # Glyphs on the display (name: slot) with the least recently used
+        # glyph first
+        self.loaded = OrderedDict()
+        self.free = range(slots)
+
+        # Number of glyphs sent to the display
+        self.uploads = 0
+
+    def char(self, name):
+        """Returns the character for the glyph."""
+
+        # Glyph is already on the display so just mark it as recently used
+        if name in self.loaded:
+            slot = self.loaded.pop(name)
+            self.loaded[name] = slot
+            return chr(slot)
+
+        # Use a free slot if there is one...
+        if self.free:
+            slot = self.free.pop(0)
+
+        # ...or replace the least recently used glyph
+        else:
+            evicted, slot = self.loaded.popitem(last=False)
+            if self.on_evict:
+                self.on_evict(evicted)
+
+        self.lcd.create_char(slot, self.glyphs[name])
+        self.loaded[name] = slot
+        self.uploads += 1
+
+        return chr(slot)
+
+    def reset(self):
+        """Forgets all the glyphs (e.g. if the display has been reset)."""
+        self.free = sorted(self.free + self.loaded.values())
+        self.loaded = OrderedDict()
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""Conversion of text into characters that the LCD can display.
+
+HD44780 displays have a character ROM which, as well as ASCII, includes some
+accented letters and symbols. There are two common versions of the ROM:
+
+    A00: Japanese (katakana plus a few Greek letters and accented vowels)
+    A02: European (includes most of the accented Latin letters)
+
+Text is converted using a table for the display's ROM. Characters that aren't
+in the table are replaced with the unaccented version of the letter where
+possible, otherwise they are removed.
+"""
+import unicodedata
+
+
+ROM_A00 = "A00"
+ROM_A02 = "A02"
+
+# Character ROM of the display
+LCD_ROM = ROM_A00
+
+# Number of strings to remember
+CACHE_SIZE = 512
+
+# Replacements for common punctuation that isn't in either ROM
+PUNCTUATION = {u"‘": "'", u"’": "'", u"‚": "'",
+               u"“": '"', u"”": '"', u"„": '"',
+               u"‐": "-", u"–": "-", u"—": "-",
+               u"…": "...", u" ": " "}
+
+# Characters in the A00 ROM that aren't in the same place as in ASCII
+ROM_TABLES = {
+    ROM_A00: {u"¥": "\x5c", u"~": "-",
+              u"→": "\x7e", u"←": "\x7f",
+              u"°": "\xdf", u"α": "\xe0", u"ä": "\xe1",
+              u"β": "\xe2", u"ε": "\xe3", u"µ": "\xe4",
+              u"μ": "\xe4", u"σ": "\xe5", u"ρ": "\xe6",
+              u"√": "\xe8", u"¢": "\xec", u"ñ": "\xee",
+              u"ö": "\xef", u"θ": "\xf2", u"∞": "\xf3",
+              u"Ω": "\xf4", u"ü": "\xf5", u"Σ": "\xf6",
+              u"π": "\xf7", u"÷": "\xfd"},
+
+    # The accented Latin-1 letters are in the same place in the A02 ROM
+    ROM_A02: {unichr(code): chr(code) for code in range(0xC0, 0x100)
+              if code not in (0xD7, 0xF7)}
+}
+
+
+class LCDCharset(object):
+    """Class to convert text to the characters in the display's ROM.
+
+       The result for each string is kept in a small cache as the same text
+       (e.g. track names) tends to be sent to the display many times.
+
+       The cache is split into two halves. New results go into the current
+       half and, when that is full, it replaces the old half. Results found in
+       the old half are moved back into the current one so recently used text
+       stays in the cache and the least recently used text is dropped.
+    """
+
+    def __init__(self, rom=LCD_ROM, cache_size=CACHE_SIZE):
+        self.rom = rom
+        self.cache_size = cache_size
+        self.cache = {}
+        self.old_cache = {}
+
+        # Number of strings that were (or weren't) found in the cache
+        self.hits = 0
+        self.misses = 0
+
+        # Build the translation table: printable ASCII plus any characters in
+        # the ROM and common punctuation. Other characters are added as they
+        # are found.
+        self.table = {unichr(code): chr(code) for code in range(0x20, 0x7F)}
+        self.table.update(PUNCTUATION)
+        self.table.update(ROM_TABLES[rom])
+
+    def translate(self, text):
+        """Returns the text as a string of characters for the display."""
+        try:
+            result = self.cache[text]
+            self.hits += 1
+            return result
+
+        except KeyError:
+            pass
+
+        result = self.old_cache.get(text)
+
+        if result is None:
+            result = self._translate(text)
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        cache = self.cache
+        cache[text] = result
+
+        if len(cache) >= self.cache_size // 2:
+            self.old_cache = cache
+            self.cache = {}
+
+        return result
+
+    def _translate(self, text):
+        """Converts each character in the text using the translation table."""
+        if type(text) == str:
+            text = text.decode("utf-8", "ignore")
+
+        elif type(text) != unicode:
+            text = unicode(text)
+
+        table = self.table
+        result = []
+
+        for char in text:
+            try:
+                result.append(table[char])
+            except KeyError:
+                result.append(self._lookup(char))
+
+        return "".join(result)
+
+    def _lookup(self, char):
+        """Finds a replacement for a character that isn't in the table and
+           adds it to the table.
+        """
+        # Try to split the letter from its accents and keep the parts that we
+        # can display
+        nfkd_form = unicodedata.normalize("NFKD", char)
+
+        if nfkd_form != char:
+            replacement = "".join(self.table.get(part, "")
+                                  for part in nfkd_form)
+        else:
+            replacement = ""
+
+        self.table[char] = replacement
+
+        return replacement
+
+
+# Shared instance used by the radio modes
+charset = LCDCharset()
@@ -0,0 +1,207 @@
+"""HD44780 character LCD driver using pigpio.
+
+This provides the same methods as Adafruit_CharLCD that are used by the
+RadioDisplay but, rather than setting each pin individually, it uses pigpio
+bank writes to set all the data pins in one go. Strings of characters are
+sent as a single pigpio waveform so the timing is handled by the pigpio daemon
+rather than by sleeping in Python.
+"""
+from time import sleep
+
+import pigpio
+
+
+# Commands
+LCD_CLEARDISPLAY = 0x01
+LCD_ENTRYMODESET = 0x04
+LCD_DISPLAYCONTROL = 0x08
+LCD_FUNCTIONSET = 0x20
+LCD_SETCGRAMADDR = 0x40
+LCD_SETDDRAMADDR = 0x80
+
+# Flags
+LCD_ENTRYLEFT = 0x02
+LCD_DISPLAYON = 0x04
+LCD_4BITMODE = 0x00
+LCD_2LINE = 0x08
+LCD_5x8DOTS = 0x00
+
+# Offset of the start of each row in the display's memory
+LCD_ROW_OFFSETS = (0x00, 0x40, 0x14, 0x54)
+
+# Time taken by the display to execute a command (microseconds)
+EXEC_TIME = 40
+
+# Clearing the display takes much longer (seconds)
+CLEAR_TIME = 0.002
+
+# Time for the display to start up after power on (seconds)
+POWER_ON_TIME = 0.05
+
+# Nibbles sent to reset the display into 4-bit mode (whatever mode it was
+# left in) and the time to wait after each one (seconds). The display needs
+# more than 4.1ms after the first nibble and more than 100us after the rest.
+INIT_SEQUENCE = [(0x3, 0.0045),
+                 (0x3, 0.00015),
+                 (0x3, 0.00015),
+                 (0x2, 0.00015)]
+
+
+class PigpioCharLCD(object):
+    """Class to drive an HD44780 display in 4-bit mode using pigpio.
+
+       The class is initialised with the following parameters:
+         pi:        Instance of pigpio
+         rs, en:    GPIO pins for the register select and enable lines
+         d4 - d7:   GPIO pins for the data lines
+         cols:      Number of characters per line
+         lines:     Number of lines
+         backlight: (optional) GPIO pin for the backlight
+         waves:     (optional) Send strings as waveforms (default True)
+    """
+
+    def __init__(self, pi, rs, en, d4, d5, d6, d7, cols, lines,
+                 backlight=None, waves=True):
+        self.pi = pi
+        self.rs = rs
+        self.en = en
+        self.backlight = backlight
+        self.cols = cols
+        self.lines = lines
+        self.waves = waves
+
+        data = [d4, d5, d6, d7]
+        for pin in [rs, en] + data + [backlight]:
+            if pin is not None:
+                self.pi.set_mode(pin, pigpio.OUTPUT)
+                self.pi.write(pin, 0)
+
+        # Bit masks for the pins so we can use bank writes
+        self.rs_mask = 1 << rs
+        self.en_mask = 1 << en
+        self.data_mask = sum(1 << pin for pin in data)
+
+        # Precalculate the pins to set for each possible nibble
+        self.nibbles = [sum(1 << pin for bit, pin in enumerate(data)
+                            if value & (1 << bit))
+                        for value in range(16)]
+
+        # Current state of the register select line
+        self.char_mode = False
+
+        # Initialise the display in 4-bit mode. The delays are needed here
+        # as the display is much slower to respond than after it has been set
+        # up.
+        sleep(POWER_ON_TIME)
+        for nibble, delay in INIT_SEQUENCE:
+            self._write4(nibble)
+            sleep(delay)
+
+        self.write8(LCD_FUNCTIONSET | LCD_4BITMODE | LCD_2LINE | LCD_5x8DOTS)
+        self.write8(LCD_DISPLAYCONTROL | LCD_DISPLAYON)
+        self.write8(LCD_ENTRYMODESET | LCD_ENTRYLEFT)
+        self.clear()
+
+        if self.backlight is not None:
+            self.set_backlight(1)
+
+    def _write4(self, nibble):
+        """Sets the data pins and pulses the enable pin.
+
+           Once the display has been initialised, each call to pigpio takes
+           longer than the display needs to process the data so there is no
+           need for any further delays here.
+        """
+        bits = self.nibbles[nibble]
+        self.pi.clear_bank_1(self.data_mask & ~bits)
+        self.pi.set_bank_1(bits | self.en_mask)
+        self.pi.clear_bank_1(self.en_mask)
+
+    def write8(self, value, char_mode=False):
+        """Writes a byte to the display. Set char_mode to True to send a
+           character or False to send a command.
+        """
+        char_mode = bool(char_mode)
+
+        # Only change the register select line if we need to
+        if char_mode != self.char_mode:
+            if char_mode:
+                self.pi.set_bank_1(self.rs_mask)
+            else:
+                self.pi.clear_bank_1(self.rs_mask)
+            self.char_mode = char_mode
+
+        self._write4(value >> 4)
+        self._write4(value & 0x0F)
+
+    def _pulses(self, values):
+        """Returns the list of pigpio pulses needed to send a list of
+           characters to the display.
+        """
+        pulses = []
+        rs = self.rs_mask
+        en = self.en_mask
+        mask = self.data_mask | rs
+
+        for value in values:
+            for nibble in (value >> 4, value & 0x0F):
+                bits = self.nibbles[nibble] | rs
+                pulses.append(pigpio.pulse(bits, mask & ~bits, 1))
+                pulses.append(pigpio.pulse(en, 0, 1))
+                pulses.append(pigpio.pulse(0, en, 1))
+
+            # Give the display time to process the character
+            pulses[-1] = pigpio.pulse(0, en, EXEC_TIME)
+
+        return pulses
+
+    def write_chars(self, values):
+        """Sends a list of characters (as integers) to the display."""
+        if not self.waves or len(values) < 2:
+            for value in values:
+                self.write8(value, True)
+            return
+
+        pulses = self._pulses(values)
+
+        self.pi.wave_add_generic(pulses)
+        wid = self.pi.wave_create()
+        self.pi.wave_send_once(wid)
+
+        # Wait for the waveform to finish before releasing it
+        sleep(sum(pulse.delay for pulse in pulses) / 1e6)
+        while self.pi.wave_tx_busy():
+            sleep(EXEC_TIME / 1e6)
+
+        self.pi.wave_delete(wid)
+
+        # The waveform leaves the register select line set
+        self.char_mode = True
+
+    def message(self, text):
+        """Writes text to the display at the current cursor position."""
+        self.write_chars([ord(char) for char in text])
+
+    def set_cursor(self, col, row):
+        """Moves the cursor to the given column and row."""
+        row = min(row, self.lines - 1)
+        self.write8(LCD_SETDDRAMADDR | (col + LCD_ROW_OFFSETS[row]))
+
+    def clear(self):
+        """Clears the display."""
+        self.write8(LCD_CLEARDISPLAY)
+        sleep(CLEAR_TIME)
+
+    def create_char(self, location, pattern):
+        """Defines a custom character in one of the 8 CGRAM locations.
+
+           The pattern is a list of 8 integers, one for each row of the
+           character.
+        """
+        self.write8(LCD_SETCGRAMADDR | ((location & 0x7) << 3))
+        self.write_chars(pattern[:8])
+
+    def set_backlight(self, backlight):
+        """Turns the backlight on or off."""
+        if self.backlight is not None:
+            self.pi.write(self.backlight, int(bool(backlight)))
@@ -0,0 +1,167 @@
+"""Virtual character LCDs for running the PiRadio without a display.
+
+The classes here provide the same methods as Adafruit_CharLCD so they can be
+used by the RadioDisplay in place of a real display (e.g. for testing and
+benchmarking on a normal computer).
+"""
+from collections import deque
+import sys
+from time import time
+
+
+# Commands (see lcd_pigpio.py)
+LCD_CLEARDISPLAY = 0x01
+LCD_SETCGRAMADDR = 0x40
+LCD_SETDDRAMADDR = 0x80
+
+# Offset of the start of each row in the display's memory
+LCD_ROW_OFFSETS = (0x00, 0x40, 0x14, 0x54)
+
+# Number of frames to keep
+FRAME_HISTORY = 1000
+
+
+class VirtualCharLCD(object):
+    """In-memory HD44780 display.
+
+       The class keeps a copy of the display memory and moves the cursor in
+       the same way as the real display so the text can be checked after
+       writing. Every byte sent to the display is counted in "writes".
+
+       When "flush" is called, a snapshot of the screen is saved (together with
+       the time) in "frames" if it has changed since the last one.
+    """
+
+    def __init__(self, cols, lines, history=FRAME_HISTORY):
+        self.cols = cols
+        self.lines = lines
+        self.backlight = True
+
+        # Display memory (addresses 0x00-0x27 and 0x40-0x67)
+        self.ddram = {}
+        self.cgram = [[0] * 8 for _ in range(8)]
+
+        # Current address and whether it's in display or character memory
+        self.address = 0
+        self.in_cgram = False
+
+        # Number of bytes sent to the display
+        self.writes = 0
+
+        # Snapshots of the screen as (time, lines) tuples
+        self.frames = deque(maxlen=history)
+
+        self.clear()
+
+    def text(self):
+        """Returns a list of the text on each line of the display."""
+        return ["".join(self.ddram.get(LCD_ROW_OFFSETS[row] + col, " ")
+                        for col in range(self.cols))
+                for row in range(self.lines)]
+
+    def write8(self, value, char_mode=False):
+        """Writes a byte to the display. Set char_mode to True to send a
+           character or False to send a command.
+        """
+        self.writes += 1
+
+        if char_mode:
+            if self.in_cgram:
+                self.cgram[self.address >> 3][self.address & 0x07] = value
+                self.address = (self.address + 1) & 0x3F
+            else:
+                self.ddram[self.address] = chr(value)
+                self.address += 1
+
+                # Wrap around in the same way as the real display
+                if self.address == 0x28:
+                    self.address = 0x40
+                elif self.address == 0x68:
+                    self.address = 0x00
+
+        elif value & LCD_SETDDRAMADDR:
+            self.address = value & 0x7F
+            self.in_cgram = False
+
+        elif value & LCD_SETCGRAMADDR:
+            self.address = value & 0x3F
+            self.in_cgram = True
+
+        elif value == LCD_CLEARDISPLAY:
+            self.ddram = {}
+            self.address = 0
+            self.in_cgram = False
+
+    def message(self, text):
+        """Writes text to the display at the current cursor position."""
+        for char in text:
+            self.write8(ord(char), True)
+
+    def set_cursor(self, col, row):
+        """Moves the cursor to the given column and row."""
+        row = min(row, self.lines - 1)
+        self.write8(LCD_SETDDRAMADDR | (col + LCD_ROW_OFFSETS[row]))
+
+    def clear(self):
+        """Clears the display."""
+        self.write8(LCD_CLEARDISPLAY)
+
+    def create_char(self, location, pattern):
+        """Defines a custom character in one of the 8 CGRAM locations."""
+        self.write8(LCD_SETCGRAMADDR | ((location & 0x7) << 3))
+        for row in pattern[:8]:
+            self.write8(row, True)
+
+    def set_backlight(self, backlight):
+        """Turns the backlight on or off."""
+        self.backlight = bool(backlight)
+
+    def flush(self):
+        """Saves a snapshot of the display if it has changed."""
+        lines = tuple(self.text())
+
+        if not self.frames or self.frames[-1][1] != lines:
+            self.frames.append((time(), lines))
+
+
+class TerminalCharLCD(VirtualCharLCD):
+    """Virtual display which draws the screen on the terminal each time it
+       changes.
+    """
+
+    def __init__(self, cols, lines, history=FRAME_HISTORY, stream=None):
+        self.stream = stream or sys.stdout
+        super(TerminalCharLCD, self).__init__(cols, lines, history)
+
+    def printable(self, char):
+        """Returns a character that can be shown on the terminal."""
+        # Custom characters
+        if ord(char) < 8:
+            return "*"
+
+        # Solid block
+        elif ord(char) == 255:
+            return "#"
+
+        elif ord(char) > 127:
+            return "?"
+
+        return char
+
+    def flush(self):
+        """Redraws the terminal if the display has changed."""
+        last = self.frames[-1] if self.frames else None
+        super(TerminalCharLCD, self).flush()
+
+        # Nothing has changed
+        if self.frames[-1] is last:
+            return
+
+        border = "+{}+".format("-" * self.cols)
+        out = ["\x1b[H\x1b[2J", border]
+        for line in self.frames[-1][1]:
+            out.append("|{}|".format("".join(map(self.printable, line))))
+        out.append(border)
+
+        self.stream.write("\n".join(out) + "\n")
+        self.stream.flush()
@@ -0,0 +1,58 @@
+"""Scrolling text for fields which are too long for the display."""
+
+# Number of spaces between the end of the text and the start of the next loop
+MARQUEE_GAP = 4
+
+# Number of frames to hold the start of the text before scrolling
+MARQUEE_PAUSE = 4
+
+
+class Marquee(object):
+    """Class to scroll text that doesn't fit in the width available.
+
+       All the frames are calculated when the object is created so advancing
+       to the next frame is just a case of moving an index.
+    """
+
+    def __init__(self, text, width, gap=MARQUEE_GAP, pause=MARQUEE_PAUSE):
+        """Marquee takes four parameters:
+
+             text:  text to display
+             width: number of characters available
+             gap:   (optional) number of spaces between loops of the text
+             pause: (optional) number of frames to hold the start of the text
+        """
+        self.text = text
+        self.pos = 0
+
+        # Text fits so we don't need to scroll
+        if len(text) <= width:
+            self.frames = [text]
+
+        else:
+            loop = text + " " * gap
+            doubled = loop + text
+            frames = [doubled[i:i + width] for i in range(len(loop))]
+
+            # Hold the start of the text for a few frames so it can be read
+            self.frames = [frames[0]] * pause + frames
+
+    @property
+    def scrolling(self):
+        """True if the text needs to scroll."""
+        return len(self.frames) > 1
+
+    @property
+    def current(self):
+        """The text for the current frame."""
+        return self.frames[self.pos]
+
+    def advance(self):
+        """Moves to the next frame. Returns True if the text has changed."""
+        old = self.frames[self.pos]
+        self.pos = (self.pos + 1) % len(self.frames)
+        return self.frames[self.pos] != old
+
+    def reset(self):
+        """Goes back to the first frame."""
+        self.pos = 0
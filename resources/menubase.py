@@ -68,24 +68,33 @@ class RadioMenu(RadioMenuBase):
         if self.cb_display:
             self.cb_display(self.menu.items[self.idx].name)
 
-    def up(self):
+    def up(self, steps=1):
         """Navigate up the menu."""
-        self.idx = (self.idx + 1) % len(self.menu.items)
+        self.idx = (self.idx + steps) % len(self.menu.items)
         self.draw()
 
-    def down(self):
+    def down(self, steps=1):
         """Navigate down the menu."""
-        self.idx = (self.idx - 1) % len(self.menu.items)
+        self.idx = (self.idx - steps) % len(self.menu.items)
         self.draw()
 
     def rotate(self, direction):
         """Method to translate signals from the rotary encoder into directions
            for the menu.
+
+           Fast turns of the encoder can move more than one item at a time
+           (the size of "direction" is the number of items to move).
         """
         if direction > 0:
-            self.up()
+            self.up(direction)
         else:
-            self.down()
+            self.down(-direction)
+
+    def home(self, gesture=None):
+        """Returns to the top level of the menu (the list of modes)."""
+        self.menu = self
+        self.idx = 0
+        self.draw()
 
     def select(self, level=None):
         """Method to handle actions when button is pressed on menu item."""
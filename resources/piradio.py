@@ -1,16 +1,31 @@
 import datetime
-from threading import Thread
-from time import sleep
+import logging
+import threading
 
+from .eventbus import EventBus
+from .gestures import LONG
 from .menubase import RadioMenu
+from .tracing import tracer
 from .radioselector import RadioSelector
-from .display import RadioDisplay
+from .scheduler import Scheduler
+from .transitions import TransitionManager
+from .display import RadioDisplay, LCD_ADAFRUIT, LCD_PIGPIO, LCD_MEMORY, \
+                     LCD_TERMINAL
 from .volume_control import VolumeControl
 
 
 # Initial volume on boot (0-100)
 INITIAL_VOLUME = 50
 
+# Send volume changes to the player of the active mode (if it has its own
+# volume control) rather than setting the volume of the sink
+USE_NATIVE_VOLUME = False
+
+# Total standby cost (roughly MB of memory) of modes that can be kept running
+# in the background for quick switching. 0 means modes are always stopped when
+# leaving them.
+STANDBY_BUDGET = 0
+
 # Define pin layouts
 
 # Display pin mapping
@@ -22,6 +37,10 @@ lcd_d6 = 23
 lcd_d7 = 24
 lcd_backlight = 25
 
+# Driver to use for the display (LCD_ADAFRUIT or LCD_PIGPIO). LCD_MEMORY and
+# LCD_TERMINAL can be used to run the radio without a display.
+lcd_driver = LCD_ADAFRUIT
+
 # Volume control pin mapping
 vol_a = 19
 vol_b = 20
@@ -32,6 +51,8 @@ sel_a = 5
 sel_b = 6
 sel_button = 13
 
+log = logging.getLogger(__name__)
+
 
 class PiRadio(object):
     """PiRadio class definition.
@@ -51,27 +72,46 @@ class PiRadio(object):
        exit event.
     """
 
-    def __init__(self, pi, modes):
+    def __init__(self, pi, modes, driver=lcd_driver, trace=False):
         """Initialisation of the radio. Requires two (mandatory) parameters:
 
              pi:    A pigpio instance
              modes: A list of initialised radio modes
 
+          The display driver can also be set with the optional "driver"
+          parameter. Setting "trace" to True records the time taken for input
+          events to reach the display (see latency_stats).
+
           Note: Initialising the class does not start the application.
         """
         self.pi = pi
 
+        # Turn on latency tracing if requested
+        tracer.enabled = trace
+
+        # Timers and file watchers for the radio and the modes
+        self.scheduler = Scheduler()
+
+        # Encoder callbacks are handled away from the pigpio thread. Each
+        # control has its own bus so a slow change of mode doesn't hold up the
+        # volume.
+        self.volume_events = EventBus("volume-events")
+        self.selector_events = EventBus("selector-events")
+
         # Define the volume control and set its callback function
         self.volume_control = VolumeControl(self.pi, vol_a, vol_b, vol_button,
-                                            cb=self.vol_change)
+                                            cb=self.vol_change,
+                                            bus=self.volume_events)
 
         # Define the selection control (we don't use a callback here as the
         # control will be bound to the menu object later)
-        self.selector = RadioSelector(self.pi, sel_a, sel_b, sel_button)
+        self.selector = RadioSelector(self.pi, sel_a, sel_b, sel_button,
+                                      name="selector",
+                                      bus=self.selector_events)
 
         # Define the LCD disply
         self.lcd = RadioDisplay(lcd_rs, lcd_en, lcd_d4, lcd_d5, lcd_d6, lcd_d7,
-                                lcd_backlight)
+                                lcd_backlight, driver=driver, pi=self.pi)
 
         # Define the main menu object and set up some callbacks
         self.main_menu = RadioMenu("", modeselect=self.change_mode,
@@ -80,8 +120,9 @@ class PiRadio(object):
         # Build our menu based on the modes
         for mode in modes:
 
-            # Modes need access to the LCD queue
+            # Modes need access to the LCD queue and the scheduler
             mode.display_q = self.lcd.queue
+            mode.scheduler = self.scheduler
 
             # Add the mode-specific menu to our own menu
             self.main_menu.add_item(mode.modemenu)
@@ -90,19 +131,24 @@ class PiRadio(object):
         self.selector.bind_rotate(self.main_menu.rotate)
         self.selector.bind_select(self.main_menu.select)
 
+        # Holding the selection button returns to the list of modes
+        self.selector.bind_gesture(LONG, self.main_menu.home)
+
         # No mode set at the moment
         self.mode = None
 
+        # Modes are entered and left in the background
+        self.transitions = TransitionManager(
+            on_progress=self.transition_progress,
+            on_change=self.mode_changed,
+            budget=STANDBY_BUDGET)
+
         # Set the initial volume level
         self.vol_change(INITIAL_VOLUME)
 
         # Blank time for the display
         self.now = "00:00"
 
-        # Set up a thread to change the time in the LCD and daemonise it
-        self._time = Thread(target=self._time_worker)
-        self._time.daemon = True
-
     def start(self):
         """Method to start all the controls required to run the radio."""
 
@@ -110,12 +156,24 @@ class PiRadio(object):
         self.running = True
 
         # Start radio controls and display
+        self.volume_events.start()
+        self.selector_events.start()
+        self.transitions.start()
         self.volume_control.start()
         self.selector.start()
         self.lcd.start()
 
-        # Start the time thread
-        self._time.start()
+        # Show the time now and then at the start of every minute
+        self.update_time()
+        self.scheduler.call_every(60, self.update_time, align=True)
+
+        stats = self.runtime_stats()
+        log.info("Radio started with {threads} threads: {names}".format(
+            threads=stats["threads"], names=", ".join(stats["thread_names"])))
+
+    def run(self):
+        """Runs the scheduler. This blocks until the radio exits."""
+        self.scheduler.run()
 
     def exit(self):
         """Method to stop the radio and shutdown gracefully."""
@@ -123,12 +181,18 @@ class PiRadio(object):
         # Set the flag (stops threads that are watching this)
         self.running = False
 
+        # Stop the scheduler
+        self.scheduler.stop()
+
         # Run the active mode's exit method so processes can be stopped
         try:
             self.mode.exit()
         except (AttributeError, TypeError):
             pass
 
+        # Stop any modes that were kept running in the background
+        self.transitions.exit_parked()
+
         # Remove text from the display
         self.lcd.clear()
 
@@ -136,60 +200,116 @@ class PiRadio(object):
         self.lcd.set_backlight(0)
 
     def change_mode(self, newmode):
-        """Method to change the active mode of the radio."""
+        """Method to change the active mode of the radio.
 
-        # Run the current mode's exit method to stop processes
-        if self.mode:
-            self.mode.exit()
+           The old mode's exit method and the new mode's enter method are run
+           in the background (see TransitionManager) so this returns
+           immediately.
+        """
+        # Show the new mode straight away
+        self.lcd.queue.put(("mode", newmode.name))
+        self.lcd.queue.put(("modeicon", newmode.icon))
+
+        self.transitions.request(newmode)
+
+    def transition_progress(self, txt):
+        """Shows the progress of a change of mode on the display."""
+        if self.lcd.queue:
+            self.lcd.queue.put(("menuinfo", txt))
 
+    def mode_changed(self, newmode):
+        """Called by the TransitionManager when a mode has been left (newmode
+           is None) or entered.
+        """
         # Set the new mode
         self.mode = newmode
 
-        # Run the enter method of the mode to start relevant processes
-        self.mode.enter()
+        # Let the mode's player handle the volume if it can
+        if USE_NATIVE_VOLUME:
+            self.volume_control.set_mode(newmode)
 
-        # Remove the metadata from the display
-        self.lcd.clear_metadata()
+        # The old mode has been left so remove its metadata from the display
+        # before the new mode is entered (and shows its own). Empty metadata
+        # is handled by the display's thread: we're called on the transitions
+        # thread.
+        if newmode is None:
+            self.lcd.queue.put(("metadata", {}))
+            return
 
-        # Upate the mode name on the display
+        # Upate the mode name and icon on the display
         self.lcd.queue.put(("mode", newmode.name))
+        self.lcd.queue.put(("modeicon", newmode.icon))
+        self.lcd.queue.put(("menuinfo", newmode.name))
 
     def menu_change(self, txt):
         """Simple method to change the menu info on the display."""
+        trace = tracer.current()
+        if trace is not None:
+            trace.mark("handled")
+
         if self.lcd.queue:
             self.lcd.queue.put(("menuinfo", txt))
 
     def vol_change(self, level):
         """Method to provide graphical representation of volume on the
            display.
+
+           The display draws the volume bar itself (using custom characters
+           so it can show each step in volume) so we just send the level.
         """
+        trace = tracer.current()
+        if trace is not None:
+            trace.mark("handled")
 
-        # We've got 10 boxes for volume so rebase the percentage number
-        l = int(level/10)
+        if self.lcd.queue:
+            self.lcd.queue.put(("vol", level))
 
-        # Create the volume string (square blocks for volume padded with '-')
-        vol = "{v:-<10}".format(v=chr(255)*l)
+            # Show the mute icon if the volume control is muted
+            icon = "mute" if self.volume_control.muted else None
+            self.lcd.queue.put(("volicon", icon))
 
-        # Send the string to the display
-        if self.lcd.queue:
-            self.lcd.queue.put(("vol", "{vol}".format(vol=vol)))
+    def latency_stats(self):
+        """Returns the latency percentiles for each type of input event (if
+           tracing is enabled).
+        """
+        return tracer.stats()
+
+    def event_stats(self):
+        """Returns the queue depth and handler durations for the encoder
+           events.
+        """
+        return {"volume": self.volume_events.stats(),
+                "selector": self.selector_events.stats()}
 
-    def _time_worker(self):
-        """Thread to update the time on the display."""
+    def transition_stats(self):
+        """Returns the number of mode changes (and how many were superseded),
+           the time taken to enter and leave each mode and the switch times
+           to parked ("warm") and stopped ("cold") modes.
+        """
+        return self.transitions.stats()
 
-        # Loop to keep thread running while radio is running
-        while self.running:
+    def runtime_stats(self):
+        """Returns the number (and names) of running threads and how often
+           the scheduler and display threads wake up.
+        """
+        names = sorted(thread.name for thread in threading.enumerate())
 
-            # Get the time
-            now = datetime.datetime.now().time()
+        return {"threads": len(names),
+                "thread_names": names,
+                "scheduler": self.scheduler.stats(),
+                "display": self.lcd.stats()}
 
-            # Pretty formatting
-            timestring = "{h:0>2}:{m:0>2}".format(h=now.hour, m=now.minute)
+    def update_time(self):
+        """Updates the time on the display. Called by the scheduler at the
+           start of every minute.
+        """
+        # Get the time
+        now = datetime.datetime.now().time()
 
-            # We only update if the time has changed
-            if timestring != self.now:
-                self.lcd.queue.put(("time", timestring))
-                self.now = timestring
+        # Pretty formatting
+        timestring = "{h:0>2}:{m:0>2}".format(h=now.hour, m=now.minute)
 
-            # 1 second refresh should be accurate enough
-            sleep(1)
+        # We only update if the time has changed
+        if timestring != self.now:
+            self.lcd.queue.put(("time", timestring))
+            self.now = timestring
@@ -0,0 +1,162 @@
+"""Watches PulseAudio for changes to the sink volume.
+
+Other programs (e.g. AirPlay, a Squeezebox client or a Bluetooth device) can
+change the volume of the sink. Rather than polling the volume, the watcher
+reads the event stream from "pactl subscribe" and only asks PulseAudio for the
+volume when it reports that the sink has changed.
+
+Events usually arrive in bursts (every change we make ourselves is reported
+too) so all the events waiting to be read are handled together with a single
+query. The watcher can also be given a function to tell it when the events
+can't be from another program (e.g. while we're changing the volume) so it
+doesn't query the volume at all.
+
+Both the event stream and the volume query can be replaced (e.g. with a list of
+chunks of text and a function returning a fixed level) so the watcher can be
+used without PulseAudio.
+"""
+import logging
+import os
+import re
+from subprocess import Popen, PIPE, check_output, CalledProcessError
+from threading import Thread
+
+
+# Command to get the stream of events
+SUBSCRIBE = ["pactl", "subscribe"]
+
+# Command to get the details of the sinks
+LIST_SINKS = ["pactl", "list", "sinks"]
+
+# Lines from "pactl subscribe" e.g. "Event 'change' on sink #0"
+EVENT = re.compile(r"Event '(?P<event>\w+)' on sink #(?P<sink>\d+)")
+
+# Start of a sink's details and its volume e.g.
+#   Sink #0
+#   ...
+#   Volume: front-left: 32768 /  50% / -18.06 dB,   front-right: ...
+SINK = re.compile(r"^Sink #(?P<sink>\d+)", re.M)
+VOLUME = re.compile(r"^\s*Volume:.*?(?P<level>\d+)%", re.M)
+
+log = logging.getLogger(__name__)
+
+
+# Most output to read from "pactl subscribe" in one go (bytes)
+READ_SIZE = 65536
+
+
+def subscribe():
+    """Generator which yields the output of "pactl subscribe" as it arrives.
+
+       Each chunk contains all of the output waiting to be read (one or more
+       lines, and possibly the start of the next line).
+    """
+    with open(os.devnull, "w") as devnull:
+        proc = Popen(SUBSCRIBE, stdout=PIPE, stderr=devnull)
+
+    try:
+        # Reading the file descriptor directly returns everything that is
+        # waiting rather than a line at a time
+        fd = proc.stdout.fileno()
+        for chunk in iter(lambda: os.read(fd, READ_SIZE), ""):
+            yield chunk
+    finally:
+        if proc.poll() is None:
+            proc.terminate()
+
+
+def sink_volume(sink=0):
+    """Returns the volume (0-100) of the sink or None if it can't be found."""
+    try:
+        output = check_output(LIST_SINKS)
+    except (OSError, CalledProcessError):
+        return None
+
+    # Split the output into the details of each sink
+    parts = SINK.split(output)
+    for num, details in zip(parts[1::2], parts[2::2]):
+        if int(num) == sink:
+            match = VOLUME.search(details)
+            if match:
+                return int(match.group("level"))
+
+    return None
+
+
+class SinkEventWatcher(Thread):
+    """Thread which calls "callback" with the new volume whenever the sink
+       volume is changed.
+
+       Watcher takes the following parameters:
+         callback: function to call with the new level (0-100)
+         sink:     (optional) index of the sink to watch (default 0)
+         source:   (optional) function returning an iterable of chunks of
+                   event text (default reads "pactl subscribe")
+         query:    (optional) function taking the sink index and returning
+                   its volume (default reads "pactl list sinks")
+         idle:     (optional) function returning False if the events can be
+                   ignored (e.g. because we're changing the volume
+                   ourselves)
+    """
+
+    def __init__(self, callback, sink=0, source=subscribe, query=sink_volume,
+                 idle=None):
+        super(SinkEventWatcher, self).__init__(name="sink-watcher")
+        self.daemon = True
+
+        self.callback = callback
+        self.sink = sink
+        self.source = source
+        self.query = query
+        self.idle = idle
+
+        # Start of a line that hasn't been completely read yet
+        self.partial = ""
+
+        # Number of events for the sink, number of times the volume was
+        # queried, number of events ignored while we were busy and number of
+        # changes reported
+        self.events = 0
+        self.queries = 0
+        self.ignored = 0
+        self.changes = 0
+
+    def is_change(self, line):
+        """Returns True if the line is a change event for our sink."""
+        match = EVENT.match(line.strip())
+        return (match is not None and
+                int(match.group("sink")) == self.sink and
+                match.group("event") == "change")
+
+    def handle(self, text):
+        """Handles a chunk of the event stream. However many change events
+           there are, the volume is only queried once.
+        """
+        lines = (self.partial + text).split("\n")
+        self.partial = lines.pop()
+
+        events = sum(1 for line in lines if self.is_change(line))
+        if not events:
+            return
+
+        self.events += events
+
+        # Our own changes are reported too so there's no need to query the
+        # volume while we're making them
+        if self.idle is not None and not self.idle():
+            self.ignored += events
+            return
+
+        self.queries += 1
+        level = self.query(self.sink)
+        if level is not None:
+            self.changes += 1
+            self.callback(level)
+
+    def run(self):
+        try:
+            for text in self.source():
+                self.handle(text)
+
+        except OSError:
+            log.warning("Unable to watch for volume changes")
@@ -1,47 +1,88 @@
-from time import sleep
-from threading import Thread
-
 import pigpio
 
+from .gestures import GestureRecognizer, CLICK
+from .tracing import tracer
 
 # Based on Rotary Encoder class from:
 # http://abyz.co.uk/rpi/pigpio/code/rotary_encoder_py.zip
 # Thanks Joan!
 
-class RotaryEncoder(Thread):
+# Change in position for each change of state of the encoder. The state is
+# (A << 1) | B and the table is indexed by (old state << 2) | new state.
+# Turning forwards goes 00 -> 01 -> 11 -> 10 -> 00. Changes where both legs
+# have changed (i.e. we've missed an edge) are ignored.
+TRANSITIONS = [0, 1, -1, 0,
+               -1, 0, 0, 1,
+               1, 0, 0, -1,
+               0, -1, 1, 0]
+
+# State of the encoder when it is resting in a detent (both legs are pulled up)
+REST_STATE = 0b11
+
+# Acceleration curve: (maximum time between detents in microseconds, number of
+# steps to move). Turns slower than all of these move one step per detent.
+ACCELERATION = [(25000, 4),
+                (60000, 2)]
+
+class RotaryEncoder(object):
     """Class to decode mechanical rotary encoder pulses and button presses.
 
-       Now subclasses Thread so this runs in background."""
+       The pulses are handled by pigpio callbacks (on pigpio's own thread) so
+       the class doesn't need a thread of its own."""
 
     def __init__(self, pi, rotA, rotB, button,
-                 rot_callback=None, but_callback=None, but_debounce=400):
-        """Class takes seven parameters:
+                 rot_callback=None, but_callback=None, but_debounce=20,
+                 name="encoder", accelerate=True, bus=None):
+        """Class takes ten parameters:
              pi:           pigpio instance
              rotA:         GPIO pin for leg A of encoder
              rotB:         GPIO pin for leg B of encoder
              button:       GPIO pin for button
              rot_callback: (optional) Callback for rotation event
-             but_callback: (optional) Callback for button press
-             but_debounce: (optional) Debounce time for button (default 400ms)
+             but_callback: (optional) Callback for button click
+             but_debounce: (optional) Time the button must be steady before
+                           an edge is reported (default 20ms)
+             name:         (optional) Name of the encoder (used for tracing)
+             accelerate:   (optional) Move more than one step per detent
+                           when the encoder is turned quickly (default True)
+             bus:          (optional) EventBus used to call the callbacks
+                           (otherwise they're called on the pigpio thread)
+
+           The rotation callback is called with the number of steps to move
+           (positive for forwards and negative for backwards). Callbacks for
+           other button gestures (see gestures.py) can be set with
+           bind_gesture.
         """
-        super(RotaryEncoder, self).__init__()
-
-        # Thread needs to be daemonised
-        self.daemon = True
-
         self.pi = pi
+        self.name = name
         self.gpioA = rotA
         self.gpioB = rotB
         self.button = button
         self.rot_callback = rot_callback
         self.but_callback = but_callback
-        self.but_tick = 0
         self.bouncetime = but_debounce * 1000
 
-        self.levA = 0
-        self.levB = 0
+        # Callbacks for button gestures other than clicks
+        self.gesture_callbacks = {}
+        self.gestures = GestureRecognizer(
+            self._gesture,
+            watchdog=lambda ms: self.pi.set_watchdog(self.button, ms))
+
+        self.accelerate = accelerate
+        self.bus = bus
+
+        # Current state of the encoder, position since the last detent and the
+        # tick of the last detent (to calculate the speed of rotation)
+        self.state = REST_STATE
+        self.position = 0
+        self.detent_tick = None
 
-        self.lastGpio = None
+        # Number of edges received, the number that couldn't be decoded and
+        # the number of detents reported (several detents may be merged into
+        # one callback)
+        self.edges = 0
+        self.errors = 0
+        self.detents = 0
 
         self.pi.set_mode(rotA, pigpio.INPUT)
         self.pi.set_mode(rotB, pigpio.INPUT)
@@ -51,6 +92,10 @@ class RotaryEncoder(Thread):
         self.pi.set_pull_up_down(rotB, pigpio.PUD_UP)
         self.pi.set_pull_up_down(button, pigpio.PUD_UP)
 
+        # Only report button edges once the level has been steady for the
+        # debounce time
+        self.pi.set_glitch_filter(button, self.bouncetime)
+
     def bind_rotate(self, callback):
         """Set a callback function to be called when the encoder rotates."""
         self.rot_callback = callback
@@ -59,15 +104,32 @@ class RotaryEncoder(Thread):
         """Set a callback function to be called when the button is pressed."""
         self.but_callback = callback
 
+    def bind_gesture(self, gesture, callback):
+        """Set a callback function to be called for a button gesture (e.g.
+           gestures.LONG). The callback is called with the name of the
+           gesture.
+        """
+        if gesture == CLICK:
+            self.but_callback = callback
+        else:
+            self.gesture_callbacks[gesture] = callback
+
     def unbind(self):
         """Remove callbacks."""
         self.rot_callback = None
         self.but_callback = None
+        self.gesture_callbacks = {}
 
     def _pulse(self, gpio, level, tick):
         """
         Decode the rotary encoder pulse.
 
+        Each edge moves the encoder through the four states in the table
+        above. When the encoder comes back to rest in a detent, we report a
+        step if it has moved at least half way round the states in one
+        direction. Contact bounce moves the position backwards and forwards
+        so it cancels out.
+
                    +---------+         +---------+      0
                    |         |         |         |
          A         |         |         |         |
@@ -81,29 +143,87 @@ class RotaryEncoder(Thread):
          ----+         +---------+         +---------+  1
         """
 
+        if level not in (0, 1):
+            return
+
         if gpio == self.gpioA:
-            self.levA = level
+            new = (self.state & 0b01) | (level << 1)
         else:
-            self.levB = level;
+            new = (self.state & 0b10) | level
+
+        if new == self.state:
+            return
+
+        self.edges += 1
 
-        if gpio != self.lastGpio: # debounce
-            self.lastGpio = gpio
+        change = TRANSITIONS[(self.state << 2) | new]
+        if change == 0:
+            self.errors += 1
 
-            if gpio == self.gpioA and level == 1:
-                if self.levB == 1 and self.rot_callback:
-                    self.rot_callback(1)
-            elif gpio == self.gpioB and level == 1:
-                if self.levA == 1 and self.rot_callback:
-                    self.rot_callback(-1)
+        self.state = new
+        self.position += change
+
+        if new == REST_STATE:
+            position = self.position
+            self.position = 0
+
+            if abs(position) >= 2:
+                self.detents += 1
+                direction = 1 if position > 0 else -1
+                steps = self.steps(tick)
+
+                if self.rot_callback:
+                    self._rotate(direction * steps, tick)
+
+    def steps(self, tick):
+        """Returns the number of steps to move for a detent based on the time
+           since the last detent.
+        """
+        last = self.detent_tick
+        self.detent_tick = tick
+
+        if not self.accelerate or last is None:
+            return 1
+
+        interval = pigpio.tickDiff(last, tick)
+
+        for limit, steps in ACCELERATION:
+            if interval <= limit:
+                return steps
+
+        return 1
+
+    def _rotate(self, direction, tick):
+        """Calls the rotation callback (tracing the event if enabled)."""
+        self._dispatch(self.name + ".rotate", self.rot_callback, direction,
+                       tick, merge=True)
+
+    def _dispatch(self, kind, callback, value, tick, merge=False):
+        """Calls the callback directly or via the event bus."""
+        tracer.begin(kind, tick)
+        try:
+            if self.bus is not None:
+                self.bus.post(kind, callback, value, merge)
+            else:
+                callback(value)
+        finally:
+            tracer.end()
 
     def _but(self, gpio, level, tick):
+        """Passes button edges (debounced by pigpio's glitch filter) to the
+           gesture recogniser.
+        """
+        self.gestures.edge(level, tick)
 
-        # We need to debounce the button press
-        if (self.but_callback is not None and
-            tick > (self.but_tick + self.bouncetime)):
+    def _gesture(self, gesture, tick):
+        """Calls the callback for a button gesture."""
+        if gesture == CLICK:
+            callback = self.but_callback
+        else:
+            callback = self.gesture_callbacks.get(gesture)
 
-            self.but_callback(level)
-            self.but_tick = tick
+        if callback is not None:
+            self._dispatch(self.name + "." + gesture, callback, gesture, tick)
 
     def cancel(self):
         """Cancel the rotary encoder decoder."""
@@ -114,8 +234,11 @@ class RotaryEncoder(Thread):
         except AttributeError:
             pass
 
-    def run(self):
-        """Starts the thread. No callbacks are activated until this point."""
+    def start(self):
+        """Starts the decoder. No callbacks are activated until this point."""
+
+        # Start from the current position of the encoder
+        self.state = (self.pi.read(self.gpioA) << 1) | self.pi.read(self.gpioB)
 
         # Define the callbacks
         self.cbA = self.pi.callback(self.gpioA,
@@ -129,7 +252,3 @@ class RotaryEncoder(Thread):
         self.cbButton = self.pi.callback(self.button,
                                          pigpio.EITHER_EDGE,
                                          self._but)
-
-        # Start looping
-        while True:
-            sleep(1)
@@ -0,0 +1,254 @@
+"""Scheduler for timers and I/O watchers.
+
+Rather than each part of the radio having a thread that sleeps and wakes up to
+check whether there is anything to do, timers and file watchers are registered
+with a single scheduler. The scheduler runs on one thread and only wakes up
+when a timer is due or a watched file has data to read.
+
+Callbacks run on the scheduler's thread so they should return quickly.
+Timers and watchers can be added from any thread.
+"""
+import errno
+import heapq
+from itertools import count
+import logging
+import os
+import select
+import threading
+from time import time
+
+
+log = logging.getLogger(__name__)
+
+
+class Timer(object):
+    """A callback registered with the scheduler. Call "cancel" to stop it."""
+
+    __slots__ = ("when", "callback", "args", "interval", "align", "cancelled")
+
+    def __init__(self, when, callback, args, interval=None, align=False):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.interval = interval
+        self.align = align
+        self.cancelled = False
+
+    def cancel(self):
+        """Stops the timer."""
+        self.cancelled = True
+
+
+def next_boundary(now, interval):
+    """Returns the next time after "now" that is a multiple of "interval"
+       (e.g. the start of the next minute).
+    """
+    return (int(now // interval) + 1) * interval
+
+
+class Scheduler(object):
+    """Class to run timers and watch files on a single thread.
+
+       Call "run" to start the scheduler (this blocks until "stop" is called).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+        # Heap of (time, sequence, timer). The sequence keeps timers that are
+        # due at the same time in the order they were added.
+        self.timers = []
+        self.sequence = count()
+
+        # Files being watched: file descriptor -> (file, callback)
+        self.readers = {}
+
+        # Pipe used to wake the scheduler when timers or watchers are added
+        # from another thread
+        self.wake_read, self.wake_write = os.pipe()
+
+        self.running = False
+        self.thread = None
+
+        # Number of times the scheduler has woken up and when it started
+        self.wakeups = 0
+        self.started = None
+
+    def _wake(self):
+        """Wakes the scheduler if it is waiting on another thread."""
+        if self.thread is not None and \
+                self.thread is not threading.current_thread():
+            try:
+                os.write(self.wake_write, "x")
+            except OSError:
+                pass
+
+    def _add(self, timer):
+        with self.lock:
+            heapq.heappush(self.timers,
+                           (timer.when, next(self.sequence), timer))
+        self._wake()
+
+        return timer
+
+    def call_at(self, when, callback, *args):
+        """Calls the callback at the given time."""
+        return self._add(Timer(when, callback, args))
+
+    def call_later(self, delay, callback, *args):
+        """Calls the callback after "delay" seconds."""
+        return self.call_at(time() + delay, callback, *args)
+
+    def call_every(self, interval, callback, *args, **kwargs):
+        """Calls the callback every "interval" seconds.
+
+           Keyword arguments:
+             align: if True, calls are made on multiples of the interval
+                    (e.g. at the start of every minute for an interval of 60)
+             start: delay before the first call (defaults to the interval,
+                    or the next multiple of the interval if aligned)
+        """
+        align = kwargs.get("align", False)
+        start = kwargs.get("start")
+
+        now = time()
+
+        if start is not None:
+            when = now + start
+        elif align:
+            when = next_boundary(now, interval)
+        else:
+            when = now + interval
+
+        return self._add(Timer(when, callback, args, interval, align))
+
+    def add_reader(self, fileobj, callback):
+        """Calls the callback (with the file as the parameter) whenever there
+           is data to read from the file (or file descriptor).
+        """
+        fd = fileobj if isinstance(fileobj, int) else fileobj.fileno()
+
+        with self.lock:
+            self.readers[fd] = (fileobj, callback)
+        self._wake()
+
+    def remove_reader(self, fileobj):
+        """Stops watching the file."""
+        fd = fileobj if isinstance(fileobj, int) else fileobj.fileno()
+
+        with self.lock:
+            self.readers.pop(fd, None)
+        self._wake()
+
+    def stop(self):
+        """Stops the scheduler."""
+        self.running = False
+        self._wake()
+
+    def stats(self):
+        """Returns a dict showing the number of wakeups (and wakeups per
+           second), timers, watched files and running threads.
+        """
+        with self.lock:
+            timers = sum(1 for _, _, timer in self.timers
+                         if not timer.cancelled)
+            readers = len(self.readers)
+
+        elapsed = time() - self.started if self.started else 0
+
+        return {"wakeups": self.wakeups,
+                "wakeups_per_sec": self.wakeups / elapsed if elapsed else 0,
+                "timers": timers,
+                "readers": readers,
+                "threads": threading.active_count()}
+
+    def _call(self, callback, *args):
+        try:
+            callback(*args)
+        except Exception:
+            log.exception("Error in scheduled callback")
+
+    def _remove_closed(self, readers):
+        """Stops watching any of the files that have been closed."""
+        for fd in readers:
+            try:
+                os.fstat(fd)
+            except OSError:
+                log.warning("Watched file {} was closed".format(fd))
+                with self.lock:
+                    if self.readers.get(fd) == readers[fd]:
+                        del self.readers[fd]
+
+    def _timeout(self):
+        """Returns the time until the next timer is due (or None)."""
+        with self.lock:
+            while self.timers and self.timers[0][2].cancelled:
+                heapq.heappop(self.timers)
+
+            if not self.timers:
+                return None
+
+            return max(0, self.timers[0][0] - time())
+
+    def _run_timers(self):
+        now = time()
+
+        while True:
+            with self.lock:
+                if not self.timers or self.timers[0][0] > now:
+                    return
+                _, _, timer = heapq.heappop(self.timers)
+
+            if timer.cancelled:
+                continue
+
+            self._call(timer.callback, *timer.args)
+
+            # Reschedule repeating timers (skipping any calls we've missed)
+            if timer.interval and not timer.cancelled:
+                if timer.align:
+                    timer.when = next_boundary(now, timer.interval)
+                else:
+                    timer.when = max(timer.when + timer.interval, now)
+                self._add(timer)
+
+    def run(self):
+        """Runs the scheduler until "stop" is called."""
+        self.running = True
+        self.thread = threading.current_thread()
+        self.started = time()
+
+        while self.running:
+            timeout = self._timeout()
+
+            with self.lock:
+                readers = dict(self.readers)
+
+            try:
+                readable, _, _ = select.select(
+                    list(readers) + [self.wake_read], [], [], timeout)
+
+            except select.error as err:
+                if err.args[0] == errno.EINTR:
+                    continue
+
+                # A file was closed without being removed first
+                if err.args[0] == errno.EBADF:
+                    self._remove_closed(readers)
+                    continue
+
+                raise
+
+            self.wakeups += 1
+
+            for fd in readable:
+                if fd == self.wake_read:
+                    os.read(self.wake_read, 512)
+
+                elif fd in readers:
+                    fileobj, callback = readers[fd]
+                    self._call(callback, fileobj)
+
+            self._run_timers()
+
+        self.thread = None
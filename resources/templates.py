@@ -0,0 +1,188 @@
+"""Compiled display templates for the PiRadio LCD.
+
+Templates are defined as a list of format strings (one per line of the display)
+e.g.
+
+    ["{mode:^*} {time}",
+     "{title:^*}"]
+
+A "*" in place of the width in a field's format spec means "use the remaining
+width of the line". This means the same templates can be used on displays of
+different sizes.
+"""
+import re
+from string import Formatter
+
+
+# Regular expression to split a format spec into its component parts
+SPEC = re.compile(r"^(?P<align>(?:.?[<>=^])?)(?P<sign>[-+ ]?)(?P<alt>#?)"
+                  r"(?P<zero>0?)(?P<width>\*|\d*)(?P<comma>,?)"
+                  r"(?:\.(?P<precision>\d+))?(?P<type>[a-zA-Z%]?)$")
+
+
+class DisplayTemplate(object):
+    """A set of template lines compiled for a specific display size.
+
+       Each line is compiled once into a render function. The template also
+       keeps an index of which lines use each parameter so that only the lines
+       affected by a change need to be rendered again.
+    """
+
+    def __init__(self, lines, cols, rows, widths=None):
+        """Template takes four parameters:
+
+             lines:  list of format strings, one per line
+             cols:   number of characters per line
+             rows:   number of lines on the display
+             widths: (optional) dict of widths for fields that don't have a
+                     format spec in the template (e.g. {"time": 5})
+        """
+        self.cols = cols
+        self.rows = rows
+
+        # Lines that don't fit on the display are dropped and missing lines
+        # are left blank
+        lines = (list(lines) + [""] * rows)[:rows]
+
+        # Index of parameter name to the lines that use it
+        self.index = {}
+
+        # Width allocated to each field
+        self.widths = {}
+
+        # Compiled format strings and render functions for each line
+        self.formats = []
+        self.renderers = []
+
+        for i, line in enumerate(lines):
+            fmt, exact = self._compile_line(line, widths or {})
+            self.formats.append(fmt)
+
+            # Lines where every field has a fixed width don't need padding
+            if exact:
+                self.renderers.append(fmt.format)
+            else:
+                self.renderers.append(self._padded(fmt.format))
+
+            for _, field, _, _ in Formatter().parse(fmt):
+                if field:
+                    self.index.setdefault(field, set()).add(i)
+
+        self.index = {key: tuple(sorted(lines))
+                      for key, lines in self.index.iteritems()}
+
+    def _padded(self, render):
+        """Returns a render function that pads or truncates the rendered line
+           to the width of the display.
+        """
+        cols = self.cols
+
+        def render_padded(**params):
+            return render(**params)[:cols].ljust(cols)
+
+        return render_padded
+
+    def _compile_line(self, line, widths):
+        """Resolves the "*" widths in a template line.
+
+           Returns a tuple of the format string for the line and a flag which
+           is True if the rendered line will always be exactly the width of
+           the display.
+        """
+        pieces = list(Formatter().parse(line))
+
+        # Work out how much of the line is used by text and fixed width fields
+        fixed = 0
+        stars = 0
+        exact = True
+        for literal, field, spec, _ in pieces:
+            fixed += len(literal)
+
+            if field is None:
+                continue
+
+            match = SPEC.match(spec or "")
+            if match is None:
+                raise ValueError("Invalid format spec: {}".format(spec))
+
+            width = match.group("width")
+            if width == "*":
+                stars += 1
+            elif width:
+                fixed += int(width)
+                exact &= match.group("precision") == width
+            elif field in widths and not spec:
+                fixed += widths[field]
+            else:
+                fixed += int(match.group("precision") or widths.get(field, 0))
+                exact = False
+
+        # Share the remaining space between the "*" fields
+        if stars:
+            share, extra = divmod(max(self.cols - fixed, 0), stars)
+            exact &= fixed <= self.cols
+        else:
+            exact &= fixed == self.cols
+
+        # Rebuild the line as a normal format string
+        fmt = []
+        for literal, field, spec, conversion in pieces:
+            fmt.append(literal.replace("{", "{{").replace("}", "}}"))
+
+            if field is None:
+                continue
+
+            match = SPEC.match(spec or "")
+            if match.group("width") == "*":
+                stars -= 1
+                width = share + (extra if not stars else 0)
+                parts = match.groupdict("")
+                parts["width"] = str(width)
+                if not parts["precision"]:
+                    parts["precision"] = str(width)
+                spec = ("{align}{sign}{alt}{zero}{width}{comma}"
+                        ".{precision}{type}").format(**parts)
+                self.widths[field] = width
+
+            elif match.group("width"):
+                self.widths[field] = int(match.group("width"))
+
+            elif field in widths and not spec:
+                width = widths[field]
+                spec = "{w}.{w}".format(w=width)
+                self.widths[field] = width
+
+            else:
+                self.widths[field] = widths.get(field, 0)
+
+            fmt.append("{")
+            fmt.append(field)
+            if conversion:
+                fmt.append("!" + conversion)
+            if spec:
+                fmt.append(":" + spec)
+            fmt.append("}")
+
+        return "".join(fmt), exact
+
+    def lines_for(self, keys):
+        """Returns a sorted sequence of the lines which use any of the given
+           parameters.
+        """
+        if len(keys) == 1:
+            for key in keys:
+                return self.index.get(key, ())
+
+        lines = set()
+        for key in keys:
+            lines.update(self.index.get(key, ()))
+
+        return sorted(lines)
+
+    def render_line(self, line, params):
+        """Returns the text for a single line, padded to the display width."""
+        return self.renderers[line](**params)
+
+    def render(self, params):
+        """Returns a list of the text for every line of the display."""
+        return [self.render_line(i, params) for i in range(self.rows)]
@@ -0,0 +1,157 @@
+"""Latency tracing for the PiRadio.
+
+Tracing follows an input event (e.g. turning the selection dial) from the GPIO
+callback through to the text appearing on the LCD. Each event records the time
+at which it passes each stage:
+
+    edge:       GPIO callback received the pulse
+    posted:     event was put on the event bus
+    dispatched: event bus called the handler
+    queued:     text was sent to the display queue
+    dequeued:   display thread picked up the update
+    displayed:  LCD has been updated
+
+Tracing is disabled by default. When disabled, the only cost is checking the
+"enabled" flag.
+"""
+from collections import deque
+import logging
+import threading
+from time import time
+
+
+# Number of events to keep for each type of event
+SAMPLES = 1000
+
+# How often to log a summary of the latencies (seconds)
+REPORT_INTERVAL = 60
+
+# Percentiles to report
+PERCENTILES = (50, 95, 99)
+
+log = logging.getLogger(__name__)
+
+
+class Trace(object):
+    """Timestamps for a single input event."""
+
+    __slots__ = ("kind", "tick", "stages", "finished")
+
+    def __init__(self, kind, tick=None):
+        self.kind = kind
+        self.tick = tick
+        self.stages = [("edge", time())]
+        self.finished = False
+
+    def mark(self, stage):
+        """Records the time that the event reached a stage."""
+        self.stages.append((stage, time()))
+
+
+class Tracer(object):
+    """Class to record traces and calculate latency statistics.
+
+       The trace for the current event is stored per thread so that code
+       further along the chain (on the same thread) can find it without it
+       being passed as a parameter.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+        # Latencies (in seconds) for each event type and each stage
+        self.samples = {}
+
+        self.next_report = time() + REPORT_INTERVAL
+
+    def begin(self, kind, tick=None):
+        """Starts tracing a new event on the current thread."""
+        if not self.enabled:
+            return None
+
+        trace = Trace(kind, tick)
+        self.local.trace = trace
+
+        return trace
+
+    def current(self):
+        """Returns the trace for the event being handled by this thread."""
+        if not self.enabled:
+            return None
+
+        return getattr(self.local, "trace", None)
+
+    def resume(self, trace):
+        """Continues tracing an event on the current thread (e.g. when an
+           event is handed from one thread to another).
+        """
+        if self.enabled:
+            self.local.trace = trace
+
+    def end(self):
+        """Stops tracing on the current thread."""
+        if self.enabled:
+            self.local.trace = None
+
+    def finish(self, trace, stage="displayed"):
+        """Records the final stage of an event and stores the latencies."""
+        if trace.finished:
+            return
+
+        trace.mark(stage)
+        trace.finished = True
+
+        start = trace.stages[0][1]
+
+        with self.lock:
+            for name, stamp in trace.stages[1:]:
+                key = (trace.kind, name)
+                if key not in self.samples:
+                    self.samples[key] = deque(maxlen=SAMPLES)
+                self.samples[key].append(stamp - start)
+
+            report = time() >= self.next_report
+            if report:
+                self.next_report = time() + REPORT_INTERVAL
+
+        if report:
+            self.log_stats()
+
+    def stats(self):
+        """Returns a dict of latency percentiles (in milliseconds).
+
+           The dict is keyed by event type and then by stage e.g.
+
+             {"selector.rotate": {"displayed": {"count": 20,
+                                                "p50": 1.2,
+                                                "p95": 3.1,
+                                                "p99": 4.0}}}
+        """
+        with self.lock:
+            samples = {key: sorted(values)
+                       for key, values in self.samples.iteritems()}
+
+        stats = {}
+        for (kind, stage), values in samples.iteritems():
+            result = {"count": len(values)}
+            for p in PERCENTILES:
+                idx = int(round(p / 100.0 * (len(values) - 1)))
+                result["p{}".format(p)] = values[idx] * 1000
+
+            stats.setdefault(kind, {})[stage] = result
+
+        return stats
+
+    def log_stats(self):
+        """Logs the end to end latency of each type of event."""
+        for kind, stages in sorted(self.stats().iteritems()):
+            total = stages.get("displayed")
+            if total:
+                log.info("{kind}: n={count} p50={p50:.1f}ms p95={p95:.1f}ms "
+                         "p99={p99:.1f}ms".format(kind=kind, **total))
+
+
+# Shared tracer used by all the components
+tracer = Tracer()
@@ -0,0 +1,215 @@
+"""Changes between radio modes in the background.
+
+Entering or leaving a mode can take several seconds (e.g. finding the media
+server or turning on the Bluetooth adaptor). The TransitionManager runs the
+modes' "exit" and "enter" methods on its own thread so the controls and the
+display keep working while the mode changes.
+
+Only the latest requested mode matters. If another mode is selected while a
+change is under way, the change is cut short: a mode that is no longer wanted
+isn't entered and, if it has already been entered, it is left straight away.
+
+Modes that support standby can be parked instead of being left: their player
+keeps running but stops playing so switching back to the mode is almost
+instant. Each mode has a standby cost (roughly the memory, in MB, used by
+its processes) and parked modes are kept within a budget. When the budget is
+exceeded, the least recently used parked mode is left properly.
+"""
+from collections import deque, OrderedDict
+import logging
+from threading import Thread, Condition
+from time import time
+
+
+# Number of durations to keep for each mode and phase
+SAMPLES = 20
+
+log = logging.getLogger(__name__)
+
+
+class TransitionManager(Thread):
+    """Thread which changes the active mode.
+
+       Manager takes three optional parameters:
+         on_progress: function called with text describing what the manager
+                      is doing (e.g. "Starting Bluetooth...")
+         on_change:   function called with the new mode once it has been
+                      entered (or None when the old mode has been left)
+         budget:      total standby cost of the modes that can be parked
+                      (0 to turn off standby)
+    """
+
+    def __init__(self, on_progress=None, on_change=None, budget=0):
+        super(TransitionManager, self).__init__(name="transitions")
+        self.daemon = True
+
+        self.on_progress = on_progress
+        self.on_change = on_change
+        self.cond = Condition()
+
+        # Requested mode and the mode that has been entered
+        self.target = None
+        self.current = None
+
+        # Number of changes requested and number that were superseded before
+        # they finished
+        self.requests = 0
+        self.superseded = 0
+
+        # Time taken (seconds) by each phase: (mode name, "enter"/"exit"/
+        # "park"/"resume")
+        self.durations = {}
+
+        # Parked modes (least recently used first) and the standby budget
+        self.parked = OrderedDict()
+        self.budget = budget
+
+        # Time taken (seconds) to switch to a mode that was parked ("warm")
+        # or had to be entered ("cold")
+        self.switches = {"warm": deque(maxlen=SAMPLES),
+                         "cold": deque(maxlen=SAMPLES)}
+
+    def request(self, mode):
+        """Requests a change to the given mode. Returns immediately."""
+        with self.cond:
+            self.target = mode
+            self.requests += 1
+            self.cond.notify()
+
+    def busy(self):
+        """Returns True if a change of mode is under way."""
+        with self.cond:
+            return self.target is not self.current
+
+    def stats(self):
+        """Returns a dict of counters, the duration (in milliseconds) of each
+           mode's phases and the time taken by warm and cold switches.
+        """
+        with self.cond:
+            durations = {key: list(values)
+                         for key, values in self.durations.iteritems()}
+            switches = {key: list(values)
+                        for key, values in self.switches.iteritems()}
+            stats = {"requests": self.requests,
+                     "superseded": self.superseded,
+                     "parked": [mode.name for mode in self.parked]}
+
+        phases = {}
+        for (name, phase), values in durations.iteritems():
+            phases.setdefault(name, {})[phase] = {
+                "count": len(values),
+                "last": values[-1] * 1000,
+                "max": max(values) * 1000}
+
+        stats["modes"] = phases
+
+        for path, values in switches.iteritems():
+            if values:
+                stats[path] = {"count": len(values),
+                               "p50": sorted(values)[len(values) // 2] * 1000,
+                               "max": max(values) * 1000}
+
+        return stats
+
+    def exit_parked(self):
+        """Leaves all the parked modes (e.g. when the radio is shut down)."""
+        while self.parked:
+            mode, _ = self.parked.popitem(last=False)
+            self._run_phase(mode, "exit")
+
+    def _leave(self, mode):
+        """Parks the mode if it supports standby and it fits in the budget.
+           Otherwise the mode is left.
+        """
+        if not mode.supports_standby or mode.standby_cost > self.budget:
+            self._progress("Stopping {}...".format(mode.name))
+            self._run_phase(mode, "exit")
+            return
+
+        self._run_phase(mode, "park")
+        self.parked[mode] = mode.standby_cost
+
+        # Leave the least recently used modes until we're within the budget
+        while sum(self.parked.values()) > self.budget:
+            old, _ = self.parked.popitem(last=False)
+            self._progress("Stopping {}...".format(old.name))
+            self._run_phase(old, "exit")
+
+    def _progress(self, text):
+        if self.on_progress:
+            self.on_progress(text)
+
+    def _changed(self, mode):
+        if self.on_change:
+            self.on_change(mode)
+
+    def _run_phase(self, mode, phase):
+        """Runs one of the mode's methods (enter, exit, park or resume) and
+           records how long it took.
+        """
+        start = time()
+
+        try:
+            getattr(mode, phase)()
+        except Exception:
+            log.exception("Error in {} {}".format(mode.name, phase))
+
+        duration = time() - start
+
+        with self.cond:
+            key = (mode.name, phase)
+            if key not in self.durations:
+                self.durations[key] = deque(maxlen=SAMPLES)
+            self.durations[key].append(duration)
+
+        log.info("{} {} took {:.0f}ms".format(mode.name, phase,
+                                              duration * 1000))
+
+    def _wanted(self, mode):
+        """Returns True if the mode is still the one that was requested."""
+        with self.cond:
+            if self.target is mode:
+                return True
+
+            self.superseded += 1
+            return False
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.target is self.current:
+                    self.cond.wait()
+                target = self.target
+
+            start = time()
+
+            # Leave (or park) the current mode
+            if self.current is not None:
+                old = self.current
+                self._leave(old)
+                self.current = None
+                self._changed(None)
+
+            if target is None or not self._wanted(target):
+                continue
+
+            # Resume the new mode if it's parked, otherwise enter it
+            if target in self.parked:
+                del self.parked[target]
+                self._run_phase(target, "resume")
+                path = "warm"
+
+            else:
+                self._progress("Starting {}...".format(target.name))
+                self._run_phase(target, "enter")
+                path = "cold"
+
+            self.current = target
+
+            with self.cond:
+                self.switches[path].append(time() - start)
+
+            # If another mode was selected while we were entering this one,
+            # the next pass of the loop will leave it again
+            if self._wanted(target):
+                self._changed(target)
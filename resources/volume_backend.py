@@ -0,0 +1,225 @@
+"""Background volume setting for the PiRadio.
+
+Setting the volume means talking to the sound system which can take some
+time. Rather than doing this in the encoder callback, the VolumeWorker does it
+in its own thread. Only the latest requested level is applied so turning the
+dial quickly doesn't build up a backlog of volume changes.
+
+Changes can be ramped: the worker moves towards the requested level in small
+steps over a given time. The number of steps is limited by MAX_RATE so a ramp
+costs at most (ramp time * MAX_RATE) + 1 commands. A new request during a ramp
+changes the target of that ramp rather than queuing another one.
+"""
+import logging
+import os
+from subprocess import Popen, PIPE, check_call
+from threading import Thread, Condition
+from time import time
+
+
+# Persistent sessions for setting the volume: the command to start and the
+# line to send for each change of volume ("level" is 0-100 and "raw" is the
+# PulseAudio volume where 65536 is 100%)
+PACMD = (["pacmd"], "set-sink-volume 0 {raw}\n")
+AMIXER = (["amixer", "-q", "-s"], "sset Master {level}%\n")
+
+# Maximum number of volume changes per second while ramping
+MAX_RATE = 25
+
+log = logging.getLogger(__name__)
+
+
+class VolumeSession(object):
+    """Class to keep a command shell (e.g. pacmd or amixer -s) open so that
+       volume changes can be sent without starting a new process each time.
+
+       If the shell can't be used then the "fallback" command is run for each
+       change instead.
+    """
+
+    def __init__(self, args, line, fallback=None):
+        """Session takes three parameters:
+
+             args:     command to start the shell
+             line:     text to send for each change (see PACMD)
+             fallback: (optional) command to run if the shell isn't available
+                       e.g. "pactl set-sink-volume 0 {vol}%"
+        """
+        self.args = args
+        self.line = line
+        self.fallback = fallback
+        self.proc = None
+
+    def open(self):
+        """Starts the shell."""
+        with open(os.devnull, "w") as devnull:
+            self.proc = Popen(self.args, stdin=PIPE, stdout=devnull,
+                              stderr=devnull)
+
+    def close(self):
+        """Stops the shell."""
+        if self.proc is not None:
+            try:
+                self.proc.stdin.close()
+                self.proc.wait()
+            except (IOError, OSError):
+                pass
+            self.proc = None
+
+    def set_volume(self, level):
+        """Sets the volume (0-100)."""
+        line = self.line.format(level=level, raw=int(level * 65536 / 100))
+
+        # Try the shell (restarting it once if it has stopped)
+        for _ in range(2):
+            try:
+                if self.proc is None or self.proc.poll() is not None:
+                    self.open()
+
+                self.proc.stdin.write(line)
+                self.proc.stdin.flush()
+                return
+
+            except (IOError, OSError):
+                self.proc = None
+
+        if self.fallback:
+            check_call(self.fallback.format(vol=level).split())
+
+
+class VolumeWorker(Thread):
+    """Thread which applies volume changes in the background.
+
+       Calling "set" stores the requested level and returns immediately. The
+       thread then calls "apply" with the latest level. If several levels are
+       requested while a change is being applied, only the last one is used.
+
+       Worker takes the following parameters:
+         apply:    function to call with the new level (0-100)
+         max_rate: (optional) maximum number of calls to apply per second
+         name:     (optional) name of the thread
+    """
+
+    def __init__(self, apply, max_rate=MAX_RATE, name="volume-worker"):
+        super(VolumeWorker, self).__init__(name=name)
+        self.daemon = True
+
+        self.apply = apply
+        self.interval = 1.0 / max_rate
+        self.cond = Condition()
+
+        # Requested level and the last level that was applied
+        self.target = None
+        self.applied = None
+
+        # Current ramp: starting level, start time and duration
+        self.ramp_from = None
+        self.ramp_start = 0
+        self.ramp_time = 0
+
+        # Time of the last change
+        self.last = 0
+
+        # Number of levels requested, number of changes made, number of ramps
+        # and the most changes made in a single ramp
+        self.requests = 0
+        self.commands = 0
+        self.ramps = 0
+        self.ramp_calls = 0
+        self.max_ramp_calls = 0
+
+    def set(self, level, ramp=0):
+        """Requests a change of volume.
+
+           If "ramp" is given, the volume moves to the new level over that
+           many seconds. If a ramp is already under way it is restarted from
+           the current level towards the new one. The first level is always
+           applied immediately as there's nothing to ramp from.
+        """
+        with self.cond:
+            # Count new ramps but not changes to the target of the current one
+            if self.target == self.applied:
+                self.ramps += 1
+                self.ramp_calls = 0
+
+            self.target = level
+            self.ramp_from = self.applied
+            self.ramp_start = time()
+            self.ramp_time = ramp
+            self.requests += 1
+            self.cond.notify()
+
+    def sync(self, level):
+        """Records a level that has been set by another program.
+
+           Returns False, and ignores the level, if the worker is busy making
+           a change or if the level is the one it last set (i.e. the change
+           was ours).
+        """
+        with self.cond:
+            if self.target != self.applied or level == self.target:
+                return False
+
+            self.target = self.applied = level
+            return True
+
+    def idle(self, quiet=0):
+        """Returns True if the worker isn't making a change and hasn't made
+           one for "quiet" seconds.
+        """
+        with self.cond:
+            return (self.target == self.applied and
+                    time() - self.last >= quiet)
+
+    def ramp_level(self, now):
+        """Returns the level that the ramp should be at now."""
+        if not self.ramp_time or self.ramp_from is None:
+            return self.target
+
+        done = (now - self.ramp_start) / self.ramp_time
+        if done >= 1:
+            return self.target
+
+        return int(round(self.ramp_from + (self.target - self.ramp_from) * done))
+
+    def stats(self):
+        """Returns a dict of the number of requests, commands and ramps."""
+        with self.cond:
+            return {"requests": self.requests,
+                    "commands": self.commands,
+                    "ramps": self.ramps,
+                    "max_ramp_calls": self.max_ramp_calls}
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.target is None or self.target == self.applied:
+                    self.cond.wait()
+
+                # Don't make changes faster than the maximum rate
+                now = time()
+                delay = self.last + self.interval - now
+                if delay > 0:
+                    self.cond.wait(delay)
+                    continue
+
+                level = self.ramp_level(now)
+
+                # Ramp hasn't moved far enough to change the level yet
+                if level == self.applied:
+                    self.cond.wait(self.interval)
+                    continue
+
+                self.last = now
+
+            try:
+                self.apply(level)
+            except Exception:
+                log.exception("Unable to set volume to {}".format(level))
+
+            with self.cond:
+                self.applied = level
+                self.commands += 1
+                self.ramp_calls += 1
+                self.max_ramp_calls = max(self.max_ramp_calls,
+                                          self.ramp_calls)
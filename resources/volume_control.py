@@ -1,6 +1,6 @@
-from subprocess import check_call
-
 from .rotary_encoder import RotaryEncoder
+from .volume_backend import VolumeSession, VolumeWorker, PACMD
+from .pulse_events import SinkEventWatcher
 import pigpio
 
 class VolumeControl(object):
@@ -15,6 +15,8 @@ class VolumeControl(object):
          pinB:   GPIO pin for leg B on encoder
          button: GPIO pin for button on encoder
          led:    GPIO pin for mute indicator
+         cb:     (optional) function called with the new level
+         bus:    (optional) EventBus for calling the encoder callbacks
     """
 
     # Starting level
@@ -23,11 +25,30 @@ class VolumeControl(object):
     # Amount to change volume by (percent)
     INCREMENT = 5
 
-    # Base command for adjusting volume
+    # Time to ramp to a new level when the encoder is turned and to fade out
+    # or in when muting (seconds)
+    RAMP_TIME = 0.1
+    FADE_TIME = 0.4
+
+    # Persistent session used to adjust volume (PACMD or AMIXER from
+    # volume_backend)
+    SESSION = PACMD
+
+    # Follow changes to the volume made by other programs. Sink events that
+    # arrive within ECHO_TIME (seconds) of one of our own changes are taken
+    # to be from that change.
+    WATCH_SINK = True
+    ECHO_TIME = 0.2
+
+    # Sink level while a mode's player is controlling the volume (so the
+    # sound is only attenuated once)
+    NATIVE_SINK_LEVEL = 100
+
+    # Base command for adjusting volume (used if the session can't be started)
     #CMD = "amixer set Master {vol}% > /dev/null"
     CMD = "pactl set-sink-volume 0 {vol}%"
 
-    def __init__(self, pi, pinA, pinB, button, led=None, cb=None):
+    def __init__(self, pi, pinA, pinB, button, led=None, cb=None, bus=None):
 
         self.pi = pi
         self.level = self.INITIAL_VOL
@@ -36,22 +57,154 @@ class VolumeControl(object):
         self.led = led
         self.callback = cb
 
+        # Volume changes are made in the background so the encoder isn't held
+        # up waiting for the sound system
+        args, line = self.SESSION
+        self.session = VolumeSession(args, line, fallback=self.CMD)
+        self.worker = VolumeWorker(self.session.set_volume)
+        self.worker.start()
+
+        # Mode whose player is sent the volume changes (None for the sink) and
+        # a worker for each mode that has been used (so each player's changes
+        # are coalesced and limited to the rate the player can handle)
+        self.mode = None
+        self.mode_workers = {}
+
+        # Whether the sink has been raised to NATIVE_SINK_LEVEL for the mode
+        self.sink_native = False
+
+        # Watcher for changes made by other programs
+        if self.WATCH_SINK:
+            self.watcher = SinkEventWatcher(self.external_change,
+                                            idle=self.sink_idle)
+        else:
+            self.watcher = None
+
         if self.led:
             self.pi.set_mode(led, pigpio.OUTPUT)
             self.pi.write(led, 0)
 
         self.control = RotaryEncoder(pi, pinA, pinB, button,
                                      rot_callback=self.adjust,
-                                     but_callback=self.mute)
+                                     but_callback=self.mute,
+                                     name="volume", bus=bus)
 
-        self.setVolume(self.level)
+        self.setVolume(self.level, ramp=0)
 
-    def setVolume(self, vol):
-        cmd = self.CMD.format(vol=vol).split()
-        check_call(cmd)
+    def setVolume(self, vol, ramp=None):
+        """Requests a change of volume. Returns immediately.
 
-    def adjust(self, way):
+           The volume is ramped to the new level over "ramp" seconds (defaults
+           to RAMP_TIME).
+        """
+        if ramp is None:
+            ramp = self.RAMP_TIME
+
+        if self.mode is None:
+            self.worker.set(vol, ramp)
+        else:
+            self.mode_workers[self.mode].set(vol, ramp)
+
+    def set_mode(self, mode):
+        """Sends volume changes to the mode's player if it has its own volume
+           control (see RadioBaseMode.set_volume). Otherwise, or if "mode" is
+           None, the volume is set at the sink.
+        """
+        if mode is not None and not mode.volume_rate:
+            mode = None
+
+        if mode is self.mode:
+            return
+
+        if mode is None:
+            self.mode = None
+            self.setVolume(self.level, ramp=0)
+            return
+
+        if mode not in self.mode_workers:
+            apply = lambda level, mode=mode: self.set_native(mode, level)
+            worker = VolumeWorker(apply, max_rate=mode.volume_rate,
+                                  name="volume-" + mode.name)
+            worker.start()
+            self.mode_workers[mode] = worker
+
+        # The attenuation is left to the player but the sink stays at our
+        # level until the player has been set (otherwise there'd be a burst
+        # at full volume if the player was loud)
+        self.sink_native = False
+        self.worker.set(self.level, ramp=0)
+
+        self.mode = mode
+        self.setVolume(self.level, ramp=0)
+
+    def set_native(self, mode, level):
+        """Sets the volume of the mode's player, falling back to the sink if
+           the player can't be reached. Called on the mode's worker thread.
+
+           Once the player has been set, the sink is raised to
+           NATIVE_SINK_LEVEL.
+        """
+        if mode.set_volume(level):
+            if self.mode is mode and not self.sink_native:
+                self.sink_native = True
+                self.worker.set(self.NATIVE_SINK_LEVEL, ramp=self.RAMP_TIME)
 
+        else:
+            self.sink_native = False
+            self.worker.set(level)
+
+    def sink_idle(self):
+        """Returns True if the sink volume could have been changed by another
+           program (i.e. we're in control of the sink and haven't just
+           changed it ourselves).
+        """
+        return self.mode is None and self.worker.idle(self.ECHO_TIME)
+
+    def external_change(self, level):
+        """Updates the level when the volume has been changed by another
+           program (e.g. a Bluetooth device).
+        """
+        if self.mode is not None or not self.worker.sync(level):
+            return
+
+        self.level = level
+
+        # A new level means the output is no longer muted
+        if self.muted and level:
+            self.muted = False
+            if self.led:
+                self.pi.write(self.led, 0)
+
+        if self.callback:
+            self.callback(self.level)
+
+    def stats(self):
+        """Returns a dict showing the number of encoder turns, the number of
+           volume changes requested, the number of commands sent to the sound
+           system, the number of ramps and the most commands used by a ramp.
+           If the sink is being watched, the number of sink events and the
+           number of times the sink volume was queried are included.
+        """
+        stats = self.worker.stats()
+
+        for worker in self.mode_workers.values():
+            for key, value in worker.stats().items():
+                if key == "max_ramp_calls":
+                    stats[key] = max(stats[key], value)
+                else:
+                    stats[key] += value
+
+        # Number of turns of the encoder (to compare with the number of volume
+        # changes actually made)
+        stats["detents"] = self.control.detents
+
+        if self.watcher:
+            stats["sink_events"] = self.watcher.events
+            stats["sink_queries"] = self.watcher.queries
+
+        return stats
+
+    def adjust(self, way):
         if self.muted:
             self.mute(False)
         else:
@@ -75,7 +228,7 @@ class VolumeControl(object):
             self.level = 0
             self.muted = True
 
-        self.setVolume(self.level)
+        self.setVolume(self.level, ramp=self.FADE_TIME)
 
         if self.callback:
             self.callback(self.level)
@@ -85,3 +238,6 @@ class VolumeControl(object):
 
     def start(self):
         self.control.start()
+
+        if self.watcher:
+            self.watcher.start()